@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import socket
+import time
+from timing import HostTiming
+from rate_limit import RateController
+from targets import block_probes, block_size_for, iter_target_blocks
+from telemetry import ScanStats
+from results import PortState
+from resolver import address_family, address_of
+from socket_budget import LOCAL_ERRNOS, LOCAL_RETRY_LIMIT, abortive_close, connect_budget, local_retry_delay
+
+# 等待结果时检查停止标志的间隔（秒）
+STOP_POLL_INTERVAL = 0.05
+
+
+class AsyncConnectScanner:
+    """基于asyncio的TCP Connect扫描引擎
+
+    使用非阻塞套接字发起连接，同一时间最多保持concurrency个连接在途，
+    不再为每个端口占用一个系统线程。目标按块推进，块内的探测按
+    伪随机顺序发出，只为当前块内的目标保存计数。
+    """
+
+    def __init__(self, concurrency=5000, timing=None, rate_controller=None, seed=None, progress=None,
+                 stats=None):
+        # 并发数不超过文件描述符上限和本地临时端口数
+        self.concurrency, self.concurrency_limit = connect_budget(concurrency)
+        self.seed = seed
+        self.progress = progress
+        self.timing = timing or HostTiming()
+        self.rate_controller = rate_controller or RateController()
+        self.stats = stats or ScanStats(self.rate_controller)
+        self.is_scanning = False
+
+    async def connect_probe(self, target, port):
+        """对单个端口发起非阻塞连接，超时未回应时按时间模板重传
+        
+        Returns:
+            tuple: (target, port, status, elapsed)，elapsed为含重传的总耗时
+        """
+        self.stats.probe_start()
+        try:
+            return await self.connect_attempts(target, port)
+        finally:
+            self.stats.probe_end()
+
+    async def connect_attempts(self, target, port):
+        loop = asyncio.get_running_loop()
+        probe_start = time.monotonic()
+        # 使用预先解析的地址，sock_connect不再为每个探测调用解析器
+        try:
+            address = address_of(target)
+        except OSError as e:
+            self.stats.error(str(e))
+            return target, port, PortState.ERROR, time.monotonic() - probe_start
+        attempt = 0
+        local_retries = 0
+        while attempt <= self.timing.max_retries:
+            delay = self.rate_controller.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.stats.sent(attempt > 0)
+            start = time.monotonic()
+            s = None
+            status = None
+            local_error = None
+            try:
+                s = socket.socket(address_family(address), socket.SOCK_STREAM)
+                s.setblocking(False)
+                await asyncio.wait_for(loop.sock_connect(s, (address, port)),
+                                       self.timing.timeout(target, attempt))
+                status = PortState.OPEN
+            except asyncio.TimeoutError:
+                attempt += 1
+                continue
+            except ConnectionRefusedError:
+                status = PortState.CLOSED
+            except OSError as e:
+                if e.errno not in LOCAL_ERRNOS:
+                    # 网络不可达等来自网络的错误
+                    self.stats.reply(target)
+                    return target, port, PortState.CLOSED, time.monotonic() - probe_start
+                local_error = e
+            except Exception as e:
+                self.stats.error(str(e))
+                return target, port, PortState.ERROR, time.monotonic() - probe_start
+            finally:
+                if s is not None:
+                    if status is PortState.OPEN:
+                        abortive_close(s)
+                    else:
+                        s.close()
+            if local_error is not None:
+                # 临时端口或文件描述符耗尽，等待后重试，不消耗重传次数
+                if local_retries >= LOCAL_RETRY_LIMIT:
+                    self.stats.error(f"本机资源不足: {local_error}")
+                    return target, port, PortState.ERROR, time.monotonic() - probe_start
+                self.stats.local_retry()
+                await asyncio.sleep(local_retry_delay(local_retries))
+                local_retries += 1
+                continue
+            self.rate_controller.report(True, attempt > 0)
+            # 只用首次发送的结果更新RTT (Karn算法)
+            rtt = None
+            if attempt == 0:
+                rtt = time.monotonic() - start
+                self.timing.update(target, rtt)
+            self.stats.reply(target, rtt)
+            return target, port, status, time.monotonic() - probe_start
+        self.rate_controller.report(False)
+        self.stats.timeout()
+        return target, port, PortState.FILTERED, time.monotonic() - probe_start
+
+    async def run(self, targets, ports, result_callback=None, summary_callback=None,
+                  port_callback=None, host_callback=None):
+        """在一个并发窗口内扫描所有目标的所有端口"""
+        results = {}
+        remaining = {}
+        open_ports_of = {}
+        block_size = block_size_for(len(ports), self.concurrency * 4)
+        pending = set()
+
+        def iter_probes():
+            for block in iter_target_blocks(targets, block_size):
+                for target in block:
+                    if not ports:
+                        finish_target(target)
+                        continue
+                    remaining[target] = remaining.get(target, 0) + len(ports)
+                    open_ports_of.setdefault(target, [])
+                if ports:
+                    yield from block_probes(block, ports, self.seed)
+
+        def finish_target(target):
+            open_ports = sorted(open_ports_of.pop(target, []))
+            remaining.pop(target, None)
+            results[target] = open_ports
+            if host_callback:
+                host_callback(target, open_ports)
+            if summary_callback:
+                if open_ports:
+                    summary_callback(f"目标 {target} 开放的端口: {', '.join(map(str, open_ports))}")
+                else:
+                    summary_callback(f"目标 {target} 没有发现开放的端口")
+
+        probes = iter_probes()
+        exhausted = False
+        while self.is_scanning:
+            # 补满并发窗口
+            while not exhausted and len(pending) < self.concurrency:
+                try:
+                    target, port = next(probes)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(self.connect_probe(target, port)))
+
+            if not pending:
+                break
+
+            # 设置超时以便及时响应停止请求
+            done, pending = await asyncio.wait(pending, timeout=STOP_POLL_INTERVAL,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                target, port, status, elapsed = task.result()
+                if self.progress:
+                    self.progress.advance()
+                if port_callback:
+                    port_callback(target, port, status, elapsed)
+                if status.is_open:
+                    open_ports_of[target].append(port)
+                    if result_callback:
+                        result_callback(port, status)
+                remaining[target] -= 1
+                if remaining[target] == 0:
+                    finish_target(target)
+
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        return results
+
+    def scan(self, targets, ports, result_callback=None, summary_callback=None,
+             port_callback=None, host_callback=None):
+        """同步入口，返回 {target: [open_ports]}"""
+        self.is_scanning = True
+        try:
+            return asyncio.run(self.run(targets, ports, result_callback, summary_callback,
+                                        port_callback, host_callback))
+        finally:
+            self.is_scanning = False
+
+    def stop_scan(self):
+        """停止扫描"""
+        self.is_scanning = False
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""离线扫描性能基准测试
+
+在本机搭建已知端口状态的测试目标（回环地址或网络命名空间），
+通过 PortScanner.scan_multiple_targets 运行各种扫描方式，统计
+吞吐量、首个结果时间、探测延迟分位数、峰值内存和准确率，
+结果保存为JSON，可以与之前的结果比较以发现性能退化。
+
+每个测试目标上的端口布局:
+    开放: 监听并立即接受连接；UDP回显收到的数据
+    关闭: 没有监听，内核回应RST / ICMP端口不可达
+    丢弃: 全连接队列已满的监听套接字，内核静默丢弃新的SYN；
+          UDP套接字只接收不回应
+
+用法:
+    sudo python benchmark.py
+    sudo python benchmark.py --mode netns --delay 20 --loss 1 -o bench_results.json
+    python benchmark.py --scenarios tcp-thread,tcp-async --compare old.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+from results import PortState
+
+BENCH_VERSION = 1
+
+# 场景名称: (扫描类型, 引擎)
+SCENARIOS = {
+    "tcp-thread": ("TCP", "thread"),
+    "tcp-async": ("TCP", "async"),
+    "syn-thread": ("SYN", "thread"),
+    "syn-batch": ("SYN", "batch"),
+    "udp-thread": ("UDP", "thread"),
+}
+
+# 各扫描类型下每种端口布局应得到的扫描状态
+EXPECTED_STATUS = {
+    "TCP": {"open": PortState.OPEN, "closed": PortState.CLOSED, "dropped": PortState.FILTERED},
+    "SYN": {"open": PortState.OPEN, "closed": PortState.CLOSED, "dropped": PortState.FILTERED},
+    "UDP": {"open": PortState.OPEN, "closed": PortState.CLOSED, "dropped": PortState.OPEN_FILTERED},
+}
+
+NETNS_NAME = "pscan-bench"
+VETH_HOST = "pbench0"
+VETH_PEER = "pbench1"
+NETNS_SUBNET = "10.213"
+LOOPBACK_SUBNET = "127.213"
+
+# ports/sec下降超过该比例视为性能退化
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+
+
+def percentile(values, q):
+    """最近秩法计算分位数，values为空时返回None"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[index]
+
+
+def port_layout(base_port, open_count, closed_count, dropped_count):
+    """返回 {port: "open"/"closed"/"dropped"}，三类端口依次排列"""
+    layout = {}
+    port = base_port
+    for state, count in (("open", open_count), ("dropped", dropped_count), ("closed", closed_count)):
+        for _ in range(count):
+            layout[port] = state
+            port += 1
+    if port - 1 > 65535:
+        raise Exception("端口数量超出范围，请减小端口数或 --base-port")
+    return layout
+
+
+def run_command(command, check=True):
+    """执行网络配置命令"""
+    result = subprocess.run(command, capture_output=True, text=True)
+    if check and result.returncode != 0:
+        raise Exception(f"命令执行失败: {' '.join(command)}: {result.stderr.strip()}")
+    return result
+
+
+class LoopbackEnvironment:
+    """在回环接口上搭建测试目标
+
+    目标地址为 127.213.0.x；延迟和丢包通过回环接口上的netem实现，
+    会影响本机所有回环流量，测试结束后恢复。
+    """
+
+    def __init__(self, target_count):
+        self.addresses = [f"{LOOPBACK_SUBNET}.{i // 250}.{i % 250 + 1}" for i in range(target_count)]
+        self.netem = False
+
+    def setup(self, delay=0, loss=0):
+        if delay or loss:
+            add_netem("lo", delay, loss)
+            self.netem = True
+
+    def server_command(self):
+        return [sys.executable, os.path.abspath(__file__)]
+
+    def teardown(self):
+        if self.netem:
+            run_command(["tc", "qdisc", "del", "dev", "lo", "root"], check=False)
+            self.netem = False
+
+
+class NetnsEnvironment:
+    """在独立的网络命名空间中搭建测试目标
+
+    本机与命名空间之间通过veth连接，目标地址为 10.213.x.y；
+    延迟和丢包通过本机一侧veth上的netem实现，不影响其他流量。
+    """
+
+    def __init__(self, target_count):
+        self.addresses = [f"{NETNS_SUBNET}.{i // 250 + 1}.{i % 250 + 2}" for i in range(target_count)]
+        self.created = False
+
+    def setup(self, delay=0, loss=0):
+        self.teardown()
+        run_command(["ip", "netns", "add", NETNS_NAME])
+        self.created = True
+        run_command(["ip", "link", "add", VETH_HOST, "type", "veth", "peer", "name", VETH_PEER])
+        run_command(["ip", "link", "set", VETH_PEER, "netns", NETNS_NAME])
+        run_command(["ip", "addr", "add", f"{NETNS_SUBNET}.0.1/16", "dev", VETH_HOST])
+        run_command(["ip", "link", "set", VETH_HOST, "up"])
+        for address in self.addresses:
+            self.netns_command(["ip", "addr", "add", f"{address}/16", "dev", VETH_PEER])
+        self.netns_command(["ip", "link", "set", VETH_PEER, "up"])
+        self.netns_command(["ip", "link", "set", "lo", "up"])
+        if delay or loss:
+            add_netem(VETH_HOST, delay, loss)
+
+    def netns_command(self, command):
+        return run_command(["ip", "netns", "exec", NETNS_NAME] + command)
+
+    def server_command(self):
+        return ["ip", "netns", "exec", NETNS_NAME, sys.executable, os.path.abspath(__file__)]
+
+    def teardown(self):
+        # 删除命名空间时veth对随之删除
+        run_command(["ip", "link", "del", VETH_HOST], check=False)
+        run_command(["ip", "netns", "del", NETNS_NAME], check=False)
+        self.created = False
+
+
+def add_netem(device, delay, loss):
+    command = ["tc", "qdisc", "add", "dev", device, "root", "netem"]
+    if delay:
+        command += ["delay", f"{delay}ms"]
+    if loss:
+        command += ["loss", f"{loss}%"]
+    result = run_command(command, check=False)
+    if result.returncode != 0:
+        raise Exception(f"无法添加netem（需要root权限和sch_netem内核模块）: {result.stderr.strip()}")
+
+
+def serve(addresses, layout):
+    """测试目标服务，在当前网络命名空间中运行直到被终止"""
+    from socket_budget import raise_fd_limit
+
+    open_ports = [port for port, state in layout.items() if state == "open"]
+    dropped_ports = [port for port, state in layout.items() if state == "dropped"]
+    wanted = len(addresses) * (2 * len(open_ports) + 3 * len(dropped_ports)) + 64
+    if raise_fd_limit(wanted) < wanted:
+        raise Exception(f"文件描述符不足，需要 {wanted} 个")
+
+    selector = selectors.DefaultSelector()
+    keep = []
+    for address in addresses:
+        for port in open_ports:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((address, port))
+            listener.listen(1024)
+            listener.setblocking(False)
+            selector.register(listener, selectors.EVENT_READ, "tcp")
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.bind((address, port))
+            udp.setblocking(False)
+            selector.register(udp, selectors.EVENT_READ, "udp")
+        for port in dropped_ports:
+            # backlog为0的监听套接字在一个连接未被accept时即视为队列已满，
+            # 之后的SYN会被内核静默丢弃
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((address, port))
+            listener.listen(0)
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.settimeout(5)
+            if filler.connect_ex((address, port)) != 0:
+                raise Exception(f"无法填满 {address}:{port} 的连接队列")
+            # 只接收不回应的UDP端口
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.bind((address, port))
+            keep.extend((listener, filler, udp))
+
+    print("ready", flush=True)
+    while True:
+        for key, _ in selector.select(timeout=1.0):
+            try:
+                if key.data == "tcp":
+                    connection, _ = key.fileobj.accept()
+                    connection.close()
+                else:
+                    data, peer = key.fileobj.recvfrom(2048)
+                    key.fileobj.sendto(b"pscan-bench", peer)
+            except (BlockingIOError, ConnectionError):
+                pass
+
+
+class BenchRecorder:
+    """作为扫描的输出对象（与ScanOutput接口相同），记录每个端口的耗时"""
+
+    def __init__(self):
+        self.latencies = []
+        self.first_result = None
+        self.start_time = None
+        self.hosts = 0
+        self.last_stats = None
+
+    def start(self, scan_type, ports, results=None):
+        pass
+
+    def port_result(self, target, port, status, elapsed=None):
+        if elapsed is not None:
+            self.latencies.append(elapsed)
+
+    def result(self, port, status):
+        if self.first_result is None:
+            self.first_result = time.monotonic() - self.start_time
+
+    def host_done(self, target, open_ports, timing=None, rtt_histogram=None):
+        self.hosts += 1
+
+    def stats(self, stats):
+        self.last_stats = stats
+
+    def finish(self):
+        pass
+
+
+def run_one(config):
+    """在独立的进程中运行一次扫描，返回统计结果
+
+    每次运行使用单独的进程，峰值内存只包含本次扫描。
+    """
+    from scanner import PortScanner
+
+    scan_type, engine = SCENARIOS[config["scenario"]]
+    layout = {int(port): state for port, state in config["layout"].items()}
+    addresses = config["addresses"]
+    ports = sorted(layout)
+    expected = EXPECTED_STATUS[scan_type]
+
+    scanner = PortScanner()
+    recorder = BenchRecorder()
+    recorder.start_time = time.monotonic()
+    start = time.monotonic()
+    scanner.scan_multiple_targets(
+        addresses, ports, scan_type, config["threads"],
+        result_callback=recorder.result,
+        engine=engine, concurrency=config["concurrency"], timing=config["timing"],
+        min_rate=config["min_rate"], max_rate=config["max_rate"],
+        seed=config["seed"], output=recorder,
+    )
+    elapsed = time.monotonic() - start
+
+    probes = len(addresses) * len(ports)
+    correct = 0
+    errors = {}
+    for address in addresses:
+        host = scanner.results.host(address)
+        for port in ports:
+            status = host.state(port) if host is not None else None
+            if status is None:
+                status = "缺失"
+            if status == expected[layout[port]]:
+                correct += 1
+            else:
+                key = f"{layout[port]}->{status}"
+                errors[key] = errors.get(key, 0) + 1
+
+    # Linux上ru_maxrss的单位为KB
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "scenario": config["scenario"],
+        "scan_type": scan_type,
+        "engine": engine,
+        "targets": len(addresses),
+        "ports": len(ports),
+        "probes": probes,
+        "elapsed": elapsed,
+        "ports_per_sec": probes / elapsed if elapsed > 0 else None,
+        "time_to_first_result": recorder.first_result,
+        "latency_p50": percentile(recorder.latencies, 50),
+        "latency_p99": percentile(recorder.latencies, 99),
+        "peak_rss_kb": peak_rss,
+        "accuracy": correct / probes if probes else None,
+        "errors": errors,
+        "retransmits": recorder.last_stats["retransmits"],
+    }
+
+
+def run_scenario(config):
+    """启动子进程运行一次扫描，返回统计结果"""
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", json.dumps(config)],
+                            capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        raise Exception(f"场景 {config['scenario']} 运行失败: {result.stderr.strip()[-500:]}")
+    return json.loads(lines[-1])
+
+
+def summarize(runs):
+    """多次运行取中位数"""
+    summary = dict(runs[0])
+    for key in ("elapsed", "ports_per_sec", "time_to_first_result", "latency_p50", "latency_p99",
+                "peak_rss_kb", "accuracy"):
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = percentile(values, 50)
+    summary["repeats"] = len(runs)
+    return summary
+
+
+def format_value(value, fmt):
+    return "-" if value is None else format(value, fmt)
+
+
+def print_table(summaries):
+    print(f"\n{'场景':<12} {'探测数':>8} {'ports/s':>10} {'首个结果':>9} {'p50':>9} {'p99':>9} "
+          f"{'峰值内存':>10} {'准确率':>8}")
+    for s in summaries:
+        print(f"{s['scenario']:<12} {s['probes']:>8} {format_value(s['ports_per_sec'], '.0f'):>10} "
+              f"{format_value(s['time_to_first_result'], '.3f'):>9} "
+              f"{format_value(s['latency_p50'], '.4f'):>9} {format_value(s['latency_p99'], '.4f'):>9} "
+              f"{format_value(s['peak_rss_kb'] / 1024 if s['peak_rss_kb'] else None, '.1f'):>8}MB "
+              f"{format_value(s['accuracy'] * 100 if s['accuracy'] is not None else None, '.1f'):>7}%")
+        for key, count in s["errors"].items():
+            print(f"    误判 {key}: {count}")
+
+
+def compare(summaries, baseline_path, threshold):
+    """与之前保存的结果比较，返回发现的性能退化列表"""
+    try:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = {s["scenario"]: s for s in json.load(f)["summaries"]}
+    except Exception as e:
+        raise Exception(f"读取基准结果失败: {e}")
+
+    regressions = []
+    print(f"\n与 {baseline_path} 比较:")
+    for s in summaries:
+        old = baseline.get(s["scenario"])
+        if old is None:
+            print(f"  {s['scenario']}: 基准结果中没有该场景")
+            continue
+        if (old["targets"], old["ports"]) != (s["targets"], s["ports"]):
+            print(f"  {s['scenario']}: 注意，测试目标数或端口数与基准结果不同")
+        if old["ports_per_sec"] and s["ports_per_sec"] is not None:
+            change = s["ports_per_sec"] / old["ports_per_sec"] - 1
+            print(f"  {s['scenario']}: ports/s {old['ports_per_sec']:.0f} -> {s['ports_per_sec']:.0f} "
+                  f"({change:+.1%})")
+            if change < -threshold:
+                regressions.append(f"{s['scenario']} 吞吐量下降 {-change:.1%}")
+        if old["accuracy"] is not None and s["accuracy"] is not None and s["accuracy"] < old["accuracy"]:
+            regressions.append(f"{s['scenario']} 准确率下降 {old['accuracy']:.2%} -> {s['accuracy']:.2%}")
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='端口扫描性能基准测试')
+    parser.add_argument('--mode', choices=['loopback', 'netns'], default='loopback',
+                        help='测试目标所在的环境: loopback 回环地址, netns 网络命名空间 (默认: loopback)')
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS),
+                        help=f'要运行的场景，逗号分隔 (默认: 全部，可选: {", ".join(SCENARIOS)})')
+    parser.add_argument('--targets', type=int, default=4, help='测试目标数 (默认: 4)')
+    parser.add_argument('--open', dest='open_ports', type=int, default=20, help='每个目标的开放端口数 (默认: 20)')
+    parser.add_argument('--closed', dest='closed_ports', type=int, default=400,
+                        help='每个目标的关闭端口数 (默认: 400)')
+    parser.add_argument('--dropped', dest='dropped_ports', type=int, default=20,
+                        help='每个目标静默丢弃的端口数 (默认: 20)')
+    parser.add_argument('--base-port', type=int, default=20000, help='测试端口的起始端口 (默认: 20000)')
+    parser.add_argument('--delay', type=float, default=0, help='注入的延迟毫秒数（需要netem）')
+    parser.add_argument('--loss', type=float, default=0, help='注入的丢包百分比（需要netem）')
+    parser.add_argument('--repeat', type=int, default=1, help='每个场景运行的次数，结果取中位数 (默认: 1)')
+    parser.add_argument('-t', '--threads', type=int, default=100, help='thread引擎的线程数 (默认: 100)')
+    parser.add_argument('--concurrency', type=int, default=1000, help='async引擎的并发连接数 (默认: 1000)')
+    parser.add_argument('--timing', default='aggressive', help='时间模板 (默认: aggressive)')
+    parser.add_argument('--min-rate', type=float, help='最小发包速率')
+    parser.add_argument('--max-rate', type=float, help='最大发包速率')
+    parser.add_argument('--seed', type=int, default=1, help='扫描顺序的种子 (默认: 1)')
+    parser.add_argument('-o', dest='output_file', default='bench_results.json',
+                        help='结果文件 (默认: bench_results.json)')
+    parser.add_argument('--compare', dest='baseline', help='与之前保存的结果比较')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='吞吐量下降超过该比例时视为退化 (默认: 0.1)')
+    # 内部使用: 测试目标服务和单次扫描子进程
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    if args.serve:
+        config = json.loads(args.serve)
+        serve(config["addresses"], {int(port): state for port, state in config["layout"].items()})
+        return
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one)), ensure_ascii=False))
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            print(f"错误: 未知的场景 {name}")
+            sys.exit(1)
+    is_root = hasattr(os, "geteuid") and os.geteuid() == 0
+    if not is_root:
+        if args.mode == "netns" or args.delay or args.loss:
+            print("错误: 网络命名空间和netem需要root权限")
+            sys.exit(1)
+        skipped = [name for name in scenarios if SCENARIOS[name][0] != "TCP"]
+        if skipped:
+            print(f"没有root权限，跳过需要原始套接字的场景: {', '.join(skipped)}")
+        scenarios = [name for name in scenarios if SCENARIOS[name][0] == "TCP"]
+
+    layout = port_layout(args.base_port, args.open_ports, args.closed_ports, args.dropped_ports)
+    environment = (NetnsEnvironment if args.mode == "netns" else LoopbackEnvironment)(args.targets)
+    server = None
+    summaries = []
+    try:
+        environment.setup(args.delay, args.loss)
+        serve_config = json.dumps({"addresses": environment.addresses, "layout": layout})
+        server = subprocess.Popen(environment.server_command() + ["--serve", serve_config],
+                                  stdout=subprocess.PIPE, text=True)
+        if server.stdout.readline().strip() != "ready":
+            raise Exception("测试目标服务启动失败")
+        print(f"测试目标: {len(environment.addresses)} 个地址 ({args.mode})，每个目标 "
+              f"{args.open_ports} 个开放 / {args.closed_ports} 个关闭 / {args.dropped_ports} 个丢弃端口")
+
+        for name in scenarios:
+            config = {
+                "scenario": name, "addresses": environment.addresses, "layout": layout,
+                "threads": args.threads, "concurrency": args.concurrency, "timing": args.timing,
+                "min_rate": args.min_rate, "max_rate": args.max_rate, "seed": args.seed,
+            }
+            runs = []
+            for i in range(args.repeat):
+                print(f"运行场景 {name} ({i+1}/{args.repeat})...")
+                runs.append(run_scenario(config))
+            summaries.append(summarize(runs) | {"runs": runs})
+    except KeyboardInterrupt:
+        print("\n基准测试被用户中断")
+        sys.exit(1)
+    except Exception as e:
+        print(f"基准测试出错: {e}")
+        sys.exit(1)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        environment.teardown()
+
+    print_table(summaries)
+    report = {
+        "version": BENCH_VERSION,
+        "created": time.time(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("serve", "run_one")},
+        "summaries": summaries,
+    }
+    try:
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到文件: {args.output_file}")
+    except Exception as e:
+        print(f"写入结果文件时出错: {e}")
+
+    if args.baseline:
+        try:
+            regressions = compare(summaries, args.baseline, args.threshold)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        if regressions:
+            print("\n发现性能退化:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(2)
+        print("\n没有发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import os
+import threading
+import time
+
+CHECKPOINT_VERSION = 1
+
+
+class RangeSet:
+    """由不相交的半开区间 [start, end) 组成的整数集合
+
+    扫描按伪随机排列的位置顺序推进，已完成的位置大多是连续的，
+    用区间保存时检查点的大小与目标数无关。
+    """
+
+    def __init__(self, ranges=()):
+        # ranges须按顺序排列且互不相交，例如ranges()的返回值
+        self.starts = [start for start, _ in ranges]
+        self.ends = [end for _, end in ranges]
+
+    def add(self, value):
+        i = bisect.bisect_right(self.starts, value)
+        if i and self.ends[i - 1] >= value:
+            if self.ends[i - 1] > value:
+                return
+            # 紧接在前一个区间之后，向后扩展并尝试与下一个区间合并
+            self.ends[i - 1] = value + 1
+            if i < len(self.starts) and self.starts[i] == value + 1:
+                self.ends[i - 1] = self.ends[i]
+                del self.starts[i]
+                del self.ends[i]
+            return
+        if i < len(self.starts) and self.starts[i] == value + 1:
+            self.starts[i] = value
+            return
+        self.starts.insert(i, value)
+        self.ends.insert(i, value + 1)
+
+    def __contains__(self, value):
+        i = bisect.bisect_right(self.starts, value)
+        return i > 0 and value < self.ends[i - 1]
+
+    def __len__(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def ranges(self):
+        return [[start, end] for start, end in zip(self.starts, self.ends)]
+
+    def complement(self, n):
+        """返回 [0, n) 中不在集合内的区间"""
+        result = []
+        position = 0
+        for start, end in zip(self.starts, self.ends):
+            if start >= n:
+                break
+            if start > position:
+                result.append((position, start))
+            position = max(position, end)
+        if position < n:
+            result.append((position, n))
+        return result
+
+
+# 不写入检查点文件的参数（令牌），恢复扫描时从命令行重新读取
+SECRET_SETTINGS = ("cluster_token", "api_token")
+
+
+class ScanCheckpoint:
+    """扫描检查点
+
+    记录命令行设置、随机种子、主机发现的结果以及按扫描顺序已完成的
+    目标位置区间，目标完成时按间隔写入文件。恢复时使用相同的种子
+    和目标列表重建扫描顺序，跳过已完成的位置，从中断处继续。
+    只保存完整扫描过的目标，中断时正在扫描的目标会重新扫描。
+    """
+
+    def __init__(self, file_path, settings=None, interval=10.0):
+        self.file_path = file_path
+        self.settings = {key: value for key, value in (settings or {}).items() if key not in SECRET_SETTINGS}
+        self.interval = interval
+        self.seed = None
+        self.target_count = None
+        self.alive = None
+        self.unresolved = None
+        self.scan_count = None
+        self.completed = RangeSet()
+        self.results = {}
+        self.last_save = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, file_path, interval=10.0):
+        """读取检查点文件"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            raise Exception(f"读取检查点文件失败: {e}")
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise Exception(f"不支持的检查点版本: {state.get('version')}")
+
+        checkpoint = cls(file_path, state["settings"], interval)
+        checkpoint.seed = state["seed"]
+        checkpoint.target_count = state["target_count"]
+        checkpoint.alive = state["alive"]
+        checkpoint.unresolved = state.get("unresolved")
+        checkpoint.scan_count = state["scan_count"]
+        checkpoint.completed = RangeSet(state["completed"])
+        checkpoint.results = state["results"]
+        return checkpoint
+
+    @property
+    def resumed(self):
+        return self.target_count is not None
+
+    @property
+    def finished(self):
+        return self.scan_count is not None and len(self.completed) >= self.scan_count
+
+    def begin(self, target_count, seed):
+        """开始扫描，返回应使用的随机种子
+
+        新的扫描记录目标数和种子；恢复的扫描检查目标列表是否一致，
+        并沿用检查点中的种子以得到相同的扫描顺序。
+        """
+        if self.resumed:
+            if target_count != self.target_count:
+                raise Exception(f"目标列表与检查点不一致: 检查点中有 {self.target_count} 个目标，"
+                                f"当前有 {target_count} 个")
+            return self.seed
+        self.target_count = target_count
+        self.seed = seed
+        self.save()
+        return seed
+
+    def set_alive(self, alive):
+        """记录主机发现的结果（compact_targets压缩后的条目）"""
+        self.alive = alive
+        self.save()
+
+    def set_unresolved(self, unresolved):
+        """记录无法解析的域名目标"""
+        self.unresolved = unresolved
+        self.save()
+
+    def set_scan_count(self, count):
+        """记录需要扫描的目标数（主机发现之后）"""
+        self.scan_count = count
+
+    def mark_done(self, positions, target, open_ports):
+        """目标扫描完成"""
+        with self.lock:
+            for position in positions:
+                self.completed.add(position)
+            if open_ports:
+                self.results[target] = list(open_ports)
+            due = time.monotonic() - self.last_save >= self.interval
+        if due:
+            self.save()
+
+    def save(self):
+        """原子地写入检查点文件"""
+        with self.lock:
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "settings": self.settings,
+                "seed": self.seed,
+                "target_count": self.target_count,
+                "alive": self.alive,
+                "unresolved": self.unresolved,
+                "scan_count": self.scan_count,
+                "completed": self.completed.ranges(),
+                "results": self.results,
+                "updated": time.time(),
+            }
+            temp_path = self.file_path + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.file_path)
+            except Exception as e:
+                raise Exception(f"写入检查点文件失败: {e}")
+            self.last_save = time.monotonic()
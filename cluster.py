@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 分布式扫描: 协调节点把任务分成工作单元，通过TCP租给各工作节点，
+# 工作节点扫描后把事件流式发回，协调节点合并后通过原有的回调输出
+
+import collections
+import hmac
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from checkpoint import RangeSet
+from output import format_port_ranges
+from results import PortState
+from targets import PortSpec, StridedView, TargetSpec, compact_targets, compose_shard
+from telemetry import RttHistogram
+from timing import RttEstimator
+from workers import EventBatcher, scan_shard
+
+CLUSTER_VERSION = 1
+
+# 默认的工作单元数，单元越多，节点失效时需要重新扫描的部分越小
+DEFAULT_UNITS = 64
+# 超过该时间没有收到工作节点的任何消息时，收回它租用的工作单元（秒）
+DEFAULT_LEASE_TIMEOUT = 30.0
+# 同一工作单元出错的次数达到该值时放弃整个扫描
+MAX_UNIT_FAILURES = 3
+# 单条消息的最大长度（字节）
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+# 没有可租的工作单元时工作节点等待的时间（秒）
+WAIT_INTERVAL = 1.0
+# 工作节点发送事件批次的间隔（秒）
+BATCH_INTERVAL = 0.5
+# 协调节点等待事件时检查停止标志的间隔（秒）
+STOP_POLL_INTERVAL = 0.05
+CONNECT_TIMEOUT = 10.0
+
+
+def parse_address(address):
+    """解析 "host:port" 形式的地址，返回 (host, port)"""
+    host, _, port = address.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        port = 0
+    if not host or not 0 < port <= 65535:
+        raise Exception(f"无效的地址: {address}，格式应为 host:port")
+    return host.strip('[]'), port
+
+
+class Connection:
+    """按行分隔的JSON消息连接，发送可以来自多个线程"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        data = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n"
+        with self.lock:
+            self.sock.sendall(data)
+
+    def receive(self):
+        """读取一条消息，对方关闭连接时返回None"""
+        line = self.reader.readline(MAX_MESSAGE_SIZE + 1)
+        if not line:
+            return None
+        if not line.endswith(b"\n"):
+            raise Exception("消息过长或不完整")
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader.close()
+        self.sock.close()
+
+
+def encode_event(event):
+    """把工作节点的扫描事件转换为可以JSON序列化的列表"""
+    kind = event[0]
+    if kind == "port":
+        _, target, port, status, elapsed = event
+        return [kind, target, port, int(status), elapsed]
+    if kind == "host":
+        _, target, open_ports, positions, timing, histogram = event
+        return [kind, target, open_ports, positions, timing.__getstate__(), histogram]
+    return list(event)
+
+
+def decode_event(event):
+    kind = event[0]
+    if kind == "port":
+        _, target, port, status, elapsed = event
+        return kind, target, port, PortState(status), elapsed
+    if kind == "host":
+        _, target, open_ports, positions, state, histogram = event
+        timing = RttEstimator()
+        timing.__setstate__(state)
+        return kind, target, open_ports, positions, timing, histogram
+    return tuple(event)
+
+
+class WorkUnit:
+    """一个工作单元: 目标分片和端口分片，以及租约和已完成的主机"""
+
+    def __init__(self, index, target_shard, port_split, port_count):
+        self.index = index
+        self.target_shard = target_shard
+        self.port_split = port_split
+        # 单元内每个主机的探测数
+        self.port_count = port_count
+        self.worker = None
+        self.done = False
+        self.failures = 0
+        # 本单元已完成的主机在扫描顺序中的位置，重新租出时跳过
+        self.positions = []
+        self.finished_hosts = 0
+        # 已计入进度的探测数，以及本次租约开始时的值
+        self.credited = 0
+        self.base = 0
+        # 主机完成前暂存的端口事件，租约失效时丢弃，重新扫描不会重复输出
+        self.pending = {}
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.coordinator.serve_worker(self.request, self.client_address)
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ScanCoordinator:
+    """分布式扫描的协调节点
+
+    按扫描顺序中的目标位置把任务分成若干工作单元（目标少于单元数时按端口划分，
+    与多进程分片的规则相同），工作节点连接后逐个租用单元并把扫描事件流式发回。
+    端口结果在主机完成后才输出，工作节点断开或超过租约时间没有消息时，
+    它租用的单元丢弃未完成主机的结果后重新租给其他节点，已完成的主机不再扫描。
+    发包速率上下限对每个工作节点分别生效。
+    """
+
+    def __init__(self, listen, settings, units=DEFAULT_UNITS, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                 token=None, progress=None, stats=None):
+        self.listen = listen
+        self.settings = dict(settings)
+        self.unit_count = units
+        self.lease_timeout = lease_timeout
+        self.token = token
+        self.progress = progress
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.events = queue.Queue()
+        self.units = []
+        self.pending = collections.deque()
+        self.remaining = 0
+        self.completed = []
+        self.job = None
+        self.connections = set()
+        self.stopped = threading.Event()
+        self.is_scanning = False
+        try:
+            self.server = CoordinatorServer(parse_address(listen), WorkerHandler)
+        except OSError as e:
+            raise Exception(f"协调节点无法监听 {listen}: {e}")
+        self.server.coordinator = self
+
+    def run(self, targets, ports, target_count, target_shard=None, completed=None,
+            progress_callback=None, result_callback=None, summary_callback=None,
+            port_callback=None, host_callback=None):
+        """等待工作节点完成所有工作单元，返回 {target: [open_ports]}
+
+        回调与多进程分片扫描 (ShardedScan) 相同。
+        """
+        self.is_scanning = True
+        if isinstance(targets, TargetSpec):
+            entries = targets.entries()
+        else:
+            entries = compact_targets(targets)
+        # 工作节点按相同的条目和端口字符串重建目标和端口序列，分片的下标一致
+        job_ports = PortSpec(format_port_ranges(ports))
+        split_targets = target_count >= self.unit_count
+        count = self.unit_count if split_targets else min(self.unit_count, len(job_ports))
+        if target_count == 0:
+            count = 0
+        reports_per_host = 1 if split_targets else count
+        for index in range(count):
+            if split_targets:
+                unit = WorkUnit(index, compose_shard(target_shard, index, count), None, len(job_ports))
+            else:
+                unit = WorkUnit(index, target_shard, (index, count), len(StridedView(job_ports, index, count)))
+            self.units.append(unit)
+            self.pending.append(index)
+        self.remaining = count
+        self.completed = completed.ranges() if completed is not None else []
+        self.job = {"type": "job", "version": CLUSTER_VERSION, "targets": entries,
+                    "ports": format_port_ranges(job_ports), "settings": self.settings,
+                    "units": count, "heartbeat": self.lease_timeout / 3}
+
+        results = {}
+        hosts = {}
+
+        def finish_host(target, host):
+            open_ports = sorted(host["open_ports"])
+            results[target] = open_ports
+            if host_callback:
+                histogram = host["histogram"].to_dict() if host["histogram"].count else None
+                host_callback(target, open_ports, sorted(host["positions"]), host["timing"], histogram)
+            if summary_callback:
+                if open_ports:
+                    summary_callback(f"目标 {target} 开放的端口: {', '.join(map(str, open_ports))}")
+                else:
+                    summary_callback(f"目标 {target} 没有发现开放的端口")
+
+        if count == 0:
+            self.is_scanning = False
+            self.server.server_close()
+            return results
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if progress_callback:
+            progress_callback(f"协调节点监听 {self.listen}，共 {count} 个工作单元，等待工作节点连接")
+        try:
+            while True:
+                try:
+                    event = self.events.get(timeout=STOP_POLL_INTERVAL)
+                except queue.Empty:
+                    if self.stopped.is_set():
+                        break
+                    continue
+                kind = event[0]
+                if kind == "finished":
+                    break
+                elif kind == "error":
+                    raise Exception(event[1])
+                elif kind == "progress":
+                    if self.progress:
+                        self.progress.advance(event[1])
+                elif kind == "message":
+                    if progress_callback:
+                        progress_callback(event[1])
+                elif kind == "port":
+                    _, target, port, status, elapsed = event
+                    if port_callback:
+                        port_callback(target, port, status, elapsed)
+                    if status.is_open and result_callback:
+                        result_callback(port, status)
+                elif kind == "host":
+                    _, target, open_ports, positions, timing, histogram = event
+                    host = hosts.setdefault(target, {"reports": 0, "open_ports": set(), "positions": set(),
+                                                     "timing": timing, "histogram": RttHistogram()})
+                    host["reports"] += 1
+                    host["open_ports"].update(open_ports)
+                    host["positions"].update(positions)
+                    if histogram is not None:
+                        host["histogram"].merge(RttHistogram.from_dict(histogram))
+                    if host["reports"] == reports_per_host:
+                        del hosts[target]
+                        finish_host(target, host)
+        finally:
+            self.is_scanning = False
+            self.shutdown()
+        return results
+
+    def serve_worker(self, sock, address):
+        """处理一个工作节点的连接，在服务器的线程中运行"""
+        sock.settimeout(self.lease_timeout)
+        connection = Connection(sock)
+        name = f"{address[0]}:{address[1]}"
+        with self.lock:
+            if self.stopped.is_set():
+                connection.close()
+                return
+            self.connections.add(connection)
+        try:
+            hello = connection.receive()
+            if hello is None or hello.get("type") != "hello":
+                return
+            if hello.get("version") != CLUSTER_VERSION:
+                connection.send({"type": "error", "message": f"协议版本不一致: {hello.get('version')}"})
+                return
+            if self.token is not None and not hmac.compare_digest(str(hello.get("token") or ""), self.token):
+                connection.send({"type": "error", "message": "认证失败"})
+                self.events.put(("message", f"拒绝工作节点 {name}: 认证失败"))
+                return
+            name = f"{hello.get('name')} ({name})"
+            connection.send(self.job)
+            self.events.put(("message", f"工作节点 {name} 已连接"))
+            while not self.stopped.is_set():
+                message = connection.receive()
+                if message is None:
+                    break
+                kind = message.get("type")
+                if kind == "lease":
+                    connection.send(self.lease(connection))
+                elif kind == "events":
+                    self.receive_events(connection, name, message)
+        except Exception as e:
+            if not self.stopped.is_set():
+                self.events.put(("message", f"工作节点 {name} 连接出错: {e}"))
+        finally:
+            self.release(connection, name)
+            with self.lock:
+                self.connections.discard(connection)
+            connection.close()
+
+    def lease(self, connection):
+        """为工作节点分配下一个工作单元"""
+        with self.lock:
+            if self.remaining == 0:
+                return {"type": "finished"}
+            if not self.pending:
+                return {"type": "wait", "delay": WAIT_INTERVAL}
+            unit = self.units[self.pending.popleft()]
+            unit.worker = connection
+            unit.base = unit.credited
+            completed = RangeSet(self.completed)
+            for position in unit.positions:
+                completed.add(position)
+            return {"type": "unit", "unit": unit.index, "target_shard": unit.target_shard,
+                    "port_split": unit.port_split, "completed": completed.ranges()}
+
+    def receive_events(self, connection, name, message):
+        """处理工作节点发回的一批事件"""
+        if self.stats is not None and message.get("totals") is not None:
+            self.stats.merge_worker(id(connection), message["totals"])
+        with self.lock:
+            unit = self.units[message["unit"]]
+            # 已被收回的租约发来的事件不再使用
+            if unit.worker is not connection:
+                return
+            self.credit(unit, unit.base + message["done"])
+            for event in message["events"]:
+                event = decode_event(event)
+                kind = event[0]
+                if kind == "port":
+                    unit.pending.setdefault(event[1], []).append(event)
+                elif kind == "host":
+                    for port_event in unit.pending.pop(event[1], []):
+                        self.events.put(port_event)
+                    unit.positions.extend(event[3])
+                    unit.finished_hosts += 1
+                    self.events.put(event)
+                elif kind == "message":
+                    self.events.put(("message", f"[{name}] {event[1]}"))
+                elif kind == "done":
+                    self.finish_unit(unit, name, event[1])
+
+    def credit(self, unit, credited):
+        """把工作单元的进度变化计入总进度（调用时持有锁）"""
+        if credited != unit.credited:
+            self.events.put(("progress", credited - unit.credited))
+            unit.credited = credited
+
+    def finish_unit(self, unit, name, error):
+        """工作单元结束（调用时持有锁）"""
+        unit.worker = None
+        if not error:
+            unit.done = True
+            unit.pending.clear()
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.events.put(("finished",))
+            return
+        unit.failures += 1
+        self.reset(unit)
+        if unit.failures >= MAX_UNIT_FAILURES:
+            self.events.put(("error", f"工作单元 {unit.index+1} 出错 {unit.failures} 次: {error}"))
+        else:
+            self.events.put(("message", f"工作节点 {name} 扫描工作单元 {unit.index+1} 出错: {error}，重新分配"))
+            self.pending.appendleft(unit.index)
+
+    def reset(self, unit):
+        """丢弃工作单元中未完成主机的结果和进度（调用时持有锁）"""
+        unit.worker = None
+        unit.pending.clear()
+        self.credit(unit, unit.finished_hosts * unit.port_count)
+        unit.base = unit.credited
+
+    def release(self, connection, name):
+        """收回断开的工作节点租用的工作单元"""
+        with self.lock:
+            for unit in self.units:
+                if unit.worker is connection and not unit.done:
+                    self.reset(unit)
+                    self.pending.appendleft(unit.index)
+                    if not self.stopped.is_set():
+                        self.events.put(("message", f"工作节点 {name} 断开，重新分配工作单元 {unit.index+1}"))
+
+    def shutdown(self):
+        """通知所有工作节点结束并关闭服务"""
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.send({"type": "stop"})
+            except OSError:
+                pass
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop_scan(self):
+        """停止扫描"""
+        self.is_scanning = False
+        self.stopped.set()
+
+
+class UnitSink:
+    """EventBatcher的输出端: 把事件批次发给协调节点"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, batch):
+        unit, events, done, totals = batch
+        # 逐端口的结果回调由协调节点根据端口事件产生
+        events = [encode_event(event) for event in events if event[0] != "result"]
+        try:
+            self.connection.send({"type": "events", "unit": unit, "events": events, "done": done,
+                                  "totals": totals})
+        except OSError:
+            # 连接断开由读取线程发现并停止扫描
+            pass
+
+
+class ClusterWorker:
+    """分布式扫描的工作节点
+
+    连接协调节点后循环租用工作单元，用本机的扫描引擎扫描并把事件发回，
+    直到任务完成、协调节点通知停止或连接断开。
+    """
+
+    def __init__(self, address, token=None, progress_callback=None):
+        from scanner import PortScanner
+
+        self.address = address
+        self.token = token
+        self.progress_callback = progress_callback
+        self.scanner = PortScanner()
+        self.replies = queue.Queue()
+        self.closed = threading.Event()
+        self.stop_requested = False
+        self.connection = None
+
+    def run(self):
+        """运行直到任务结束，返回完成的工作单元数"""
+        try:
+            sock = socket.create_connection(parse_address(self.address), CONNECT_TIMEOUT)
+        except OSError as e:
+            raise Exception(f"无法连接协调节点 {self.address}: {e}")
+        sock.settimeout(None)
+        self.connection = Connection(sock)
+        finished = threading.Event()
+        done_units = 0
+        try:
+            self.connection.send({"type": "hello", "version": CLUSTER_VERSION, "name": socket.gethostname(),
+                                  "token": self.token})
+            threading.Thread(target=self.read_loop, daemon=True).start()
+            job = self.next_reply()
+            if job is None:
+                return done_units
+            if job.get("type") == "error":
+                raise Exception(f"协调节点拒绝连接: {job.get('message')}")
+            targets = TargetSpec(job["targets"])
+            ports = PortSpec(job["ports"])
+            settings = job["settings"]
+            if self.progress_callback:
+                self.progress_callback(f"已连接协调节点 {self.address}: {len(targets)} 个目标，"
+                                       f"{len(ports)} 个端口，{job['units']} 个工作单元")
+            threading.Thread(target=self.watch, args=(finished, job["heartbeat"]), daemon=True).start()
+            while not self.closed.is_set():
+                self.connection.send({"type": "lease"})
+                message = self.next_reply()
+                if message is None or message["type"] == "finished":
+                    break
+                if message["type"] == "wait":
+                    time.sleep(message["delay"])
+                    continue
+                self.scan_unit(targets, ports, settings, message)
+                done_units += 1
+                if self.progress_callback:
+                    self.progress_callback(f"完成工作单元 {message['unit']+1}/{job['units']}")
+        except OSError as e:
+            if not self.stop_requested:
+                raise Exception(f"与协调节点的连接已断开: {e}")
+        finally:
+            finished.set()
+            self.scanner.stop_scan()
+            self.connection.close()
+        return done_units
+
+    def next_reply(self):
+        """等待协调节点的下一条消息，协调节点通知停止时返回None"""
+        message = self.replies.get()
+        if message is None:
+            if self.stop_requested:
+                return None
+            raise Exception("与协调节点的连接已断开")
+        if message.get("type") == "stop":
+            return None
+        return message
+
+    def scan_unit(self, targets, ports, settings, message):
+        """扫描一个工作单元，把事件和结束标记发给协调节点"""
+        batcher = EventBatcher(UnitSink(self.connection), message["unit"], BATCH_INTERVAL)
+        target_shard = tuple(message["target_shard"]) if message["target_shard"] else None
+        port_split = tuple(message["port_split"]) if message["port_split"] else None
+        error = None
+        try:
+            scan_shard(self.scanner, batcher, targets, ports, target_shard, port_split,
+                       RangeSet(message["completed"]), settings)
+        except Exception as e:
+            error = str(e)
+        # 被中断的扫描不发送结束标记，协调节点会把单元重新分配
+        if self.closed.is_set():
+            batcher.stopped.set()
+        else:
+            batcher.close(error)
+
+    def read_loop(self):
+        """读取协调节点的消息，连接断开或收到停止通知时停止扫描"""
+        try:
+            while True:
+                message = self.connection.receive()
+                if message is None:
+                    break
+                if message.get("type") == "stop":
+                    self.stop_requested = True
+                    self.replies.put(message)
+                    break
+                self.replies.put(message)
+        except Exception:
+            pass
+        finally:
+            self.closed.set()
+            self.replies.put(None)
+
+    def watch(self, finished, heartbeat):
+        """定期发送心跳；连接关闭后持续通知扫描器停止，直到本节点退出"""
+        last_ping = time.monotonic()
+        while not finished.wait(STOP_POLL_INTERVAL):
+            if self.closed.is_set():
+                self.scanner.stop_scan()
+            elif time.monotonic() - last_ping >= heartbeat:
+                last_ping = time.monotonic()
+                try:
+                    self.connection.send({"type": "ping"})
+                except OSError:
+                    pass
+
+    def stop(self):
+        """停止扫描并断开连接"""
+        self.stop_requested = True
+        self.closed.set()
+        self.scanner.stop_scan()
+        if self.connection is not None:
+            try:
+                self.connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# TCP Connect扫描的探测函数，只使用系统的套接字接口，不依赖scapy
+
+import errno
+import os
+import socket
+import time
+from results import PortState
+from resolver import address_family, address_of
+from socket_budget import LOCAL_ERRNOS, LOCAL_RETRY_LIMIT, abortive_close, local_retry_delay
+from tracing import span
+
+# connect_ex在超时时返回的错误码
+TIMEOUT_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ETIMEDOUT, errno.EINPROGRESS)
+
+
+def tcp_connect_scan(scanner, target, port):
+    """执行TCP Connect扫描
+
+    建立的连接以RST关闭，不留下TIME_WAIT；临时端口或文件描述符耗尽等
+    本机原因的失败等待后重试，不消耗重传次数，也不会被当作端口状态。
+    """
+    tracer = scanner.tracer
+    scanner.stats.probe_start()
+    try:
+        address = address_of(target)
+        attempt = 0
+        local_retries = 0
+        has_token = False
+        while True:
+            # 先取得发送许可再创建套接字，等待限速时不占用文件描述符；
+            # 创建套接字失败后重试时沿用已取得的许可
+            if not has_token:
+                with span(tracer, "rate_wait", "tcp_connect_scan"):
+                    scanner.rate_controller.acquire()
+                has_token = True
+            try:
+                with span(tracer, "socket", "tcp_connect_scan"):
+                    s = socket.socket(address_family(address), socket.SOCK_STREAM)
+            except OSError as e:
+                if e.errno not in LOCAL_ERRNOS or local_retries >= LOCAL_RETRY_LIMIT:
+                    raise
+                scanner.stats.local_retry()
+                time.sleep(local_retry_delay(local_retries))
+                local_retries += 1
+                continue
+            has_token = False
+            s.settimeout(scanner.timing.timeout(target, attempt))
+            scanner.stats.sent(attempt > 0)
+            start = time.monotonic()
+            result = s.connect_ex((address, port))
+            elapsed = time.monotonic() - start
+            if tracer is not None:
+                end = time.perf_counter()
+                tracer.add("timeout_wait" if result in TIMEOUT_ERRNOS else "connect", "tcp_connect_scan",
+                           end - elapsed, end)
+            with span(tracer, "close", "tcp_connect_scan"):
+                if result == 0:
+                    abortive_close(s)
+                else:
+                    s.close()
+            if result in LOCAL_ERRNOS:
+                if local_retries >= LOCAL_RETRY_LIMIT:
+                    raise OSError(result, f"本机资源不足: {os.strerror(result)}")
+                scanner.stats.local_retry()
+                time.sleep(local_retry_delay(local_retries))
+                local_retries += 1
+                continue
+            if result not in TIMEOUT_ERRNOS or attempt >= scanner.timing.max_retries or not scanner.is_scanning:
+                break
+            attempt += 1
+
+        scanner.rate_controller.report(result not in TIMEOUT_ERRNOS, attempt > 0)
+        if result in TIMEOUT_ERRNOS:
+            scanner.stats.timeout()
+            return port, PortState.FILTERED
+        rtt = None
+        if attempt == 0 and result in (0, errno.ECONNREFUSED):
+            rtt = elapsed
+            scanner.timing.update(target, rtt)
+        scanner.stats.reply(target, rtt)
+
+        if result == 0:
+            return port, PortState.OPEN
+        else:
+            return port, PortState.CLOSED
+    except Exception as e:
+        scanner.stats.error(str(e))
+        return port, PortState.ERROR
+    finally:
+        scanner.stats.probe_end()
@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hmac
+import importlib
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scanner import PortScanner, SCAN_PROBES, check_address_family, load_probe
+from rate_limit import RateController
+from timing import get_timing_profile
+from targets import PortSpec, TargetSpec
+from output import ScanOutput, JsonLinesWriter, format_port_ranges
+from history import ScanHistory
+from packets import RAW_SOCKETS
+
+# 任务参数及默认值
+JOB_DEFAULTS = {
+    "targets": None,
+    "ports": None,
+    "scan_type": "TCP",
+    "engine": "thread",
+    "threads": 20,
+    "concurrency": 1000,
+    "timing": "normal",
+    "host_discovery": True,
+    "randomize": True,
+    "seed": None,
+    "service_detection": False,
+    "stats_interval": 0,
+    "history": None,
+    "delta": False,
+    "delta_slices": 8,
+}
+
+# 任务参数的类型: 参数 -> (类型, 说明)，默认值为None的参数也可以为null
+JOB_TYPES = {
+    "targets": (str, "字符串"),
+    "ports": (str, "字符串"),
+    "scan_type": (str, "字符串"),
+    "engine": (str, "字符串"),
+    "threads": (int, "整数"),
+    "concurrency": (int, "整数"),
+    "timing": ((str, int), "字符串或整数"),
+    "host_discovery": (bool, "布尔值"),
+    "randomize": (bool, "布尔值"),
+    "seed": (int, "整数"),
+    "service_detection": (bool, "布尔值"),
+    "stats_interval": ((int, float), "数字"),
+    "history": (str, "字符串"),
+    "delta": (bool, "布尔值"),
+    "delta_slices": (int, "整数"),
+}
+
+# 保留的已结束任务数，超过时删除最早结束的任务
+MAX_FINISHED_JOBS = 200
+# 定时任务最短的间隔（秒）
+MIN_SCHEDULE_INTERVAL = 10
+# 流式返回结果时等待新记录的间隔（秒）
+FOLLOW_INTERVAL = 1.0
+
+
+def job_settings(params):
+    """检查任务参数，返回补全默认值后的参数"""
+    if not isinstance(params, dict):
+        raise Exception("任务参数必须是JSON对象")
+    unknown = set(params) - set(JOB_DEFAULTS)
+    if unknown:
+        raise Exception(f"未知的任务参数: {', '.join(sorted(unknown))}")
+    for name, value in params.items():
+        kind, description = JOB_TYPES[name]
+        if value is None and JOB_DEFAULTS[name] is None:
+            continue
+        # JSON的true/false在Python中也是int，数字参数不接受布尔值
+        if not isinstance(value, kind) or (isinstance(value, bool) and kind is not bool):
+            raise Exception(f"任务参数 {name} 必须是{description}，收到: {json.dumps(value, ensure_ascii=False)}")
+    settings = {**JOB_DEFAULTS, **params}
+    if not settings["targets"] or not isinstance(settings["targets"], str):
+        raise Exception("缺少目标 (targets)，多个目标用逗号分隔")
+    if settings["scan_type"] not in SCAN_PROBES:
+        raise Exception(f"未知的扫描类型: {settings['scan_type']}")
+    if settings["engine"] not in ("thread", "async", "batch"):
+        raise Exception(f"未知的扫描引擎: {settings['engine']}")
+    if settings["engine"] == "async" and settings["scan_type"] != "TCP":
+        raise Exception("async引擎仅支持TCP Connect扫描")
+    if settings["engine"] == "batch" and settings["scan_type"] != "SYN":
+        raise Exception("batch引擎仅支持TCP SYN扫描")
+    if settings["service_detection"] and settings["scan_type"] == "UDP":
+        raise Exception("服务识别仅支持TCP扫描")
+    if settings["delta"] and not settings["history"]:
+        raise Exception("增量扫描 (delta) 需要指定历史数据库 (history)")
+    if not 1 <= settings["threads"] <= 500:
+        raise Exception("线程数必须在1-500之间")
+    if not 1 <= settings["concurrency"] <= 20000:
+        raise Exception("并发连接数必须在1-20000之间")
+    if settings["stats_interval"] < 0:
+        raise Exception("统计信息的间隔不能为负数")
+    if not 1 <= settings["delta_slices"] <= 1000:
+        raise Exception("增量扫描的片数必须在1-1000之间")
+    settings["timing"] = get_timing_profile(settings["timing"])
+    # 提前解析目标和端口，参数错误在提交时返回
+    try:
+        targets = TargetSpec(settings["targets"].split(','))
+    except Exception as e:
+        raise Exception(f"目标解析错误: {e}")
+    check_address_family(targets, settings["scan_type"])
+    try:
+        PortSpec(settings["ports"])
+    except Exception as e:
+        raise Exception(f"端口范围解析错误: {e}")
+    return settings
+
+
+class MemoryWriter(JsonLinesWriter):
+    """把JSON Lines记录保存在内存中的流式输出，供客户端按偏移读取
+
+    为控制内存，端口记录只保留开放的端口，其他状态的端口数在主机摘要中。
+    """
+
+    def __init__(self):
+        self.protocol = "tcp"
+        self.records = []
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, text):
+        with self.condition:
+            self.records.append(text)
+            self.condition.notify_all()
+
+    def flush(self):
+        pass
+
+    def port_result(self, target, port, status, elapsed):
+        if status.is_open:
+            super().port_result(target, port, status, elapsed)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def read(self, offset, wait=0):
+        """返回 (offset之后的记录, 输出是否已结束)，没有新记录时最多等待wait秒"""
+        with self.condition:
+            if offset >= len(self.records) and not self.closed and wait > 0:
+                self.condition.wait(wait)
+            return self.records[offset:], self.closed
+
+
+class ScanJob:
+    """守护进程中的一个扫描任务"""
+
+    def __init__(self, job_id, settings, schedule_id=None):
+        self.id = job_id
+        self.settings = settings
+        self.schedule_id = schedule_id
+        self.state = "queued"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.open_ports = None
+        self.changes = 0
+        self.scanner = None
+        self.future = None
+        self.writer = MemoryWriter()
+
+    def message(self, text):
+        self.writer.write_record({"type": "message", "text": text, "time": round(time.time(), 3)})
+
+    def update_progress(self, done, total, rate, eta):
+        self.progress = {"done": done, "total": total, "rate": rate, "eta": eta}
+
+    def record_changes(self, target, changes):
+        self.changes += len(changes)
+        for port, old, new in changes:
+            self.writer.write_record({
+                "type": "change", "target": target, "port": port,
+                "old": old.nmap_name if old is not None else None, "new": new.nmap_name,
+                "time": round(time.time(), 3),
+            })
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "schedule": self.schedule_id,
+            "state": self.state,
+            "error": self.error,
+            "settings": self.settings,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": self.progress,
+            "open_ports": self.open_ports,
+            "changes": self.changes,
+            "records": len(self.writer.records),
+        }
+
+
+class ScanSchedule:
+    """定时任务，每隔every秒提交一次扫描，上一次扫描未结束时顺延"""
+
+    def __init__(self, schedule_id, settings, every):
+        self.id = schedule_id
+        self.settings = settings
+        self.every = every
+        self.next_run = time.time()
+        self.last_job = None
+        self.runs = 0
+
+    def to_dict(self):
+        return {"id": self.id, "settings": self.settings, "every": self.every,
+                "next_run": self.next_run, "last_job": self.last_job, "runs": self.runs}
+
+
+class ScanDaemon:
+    """常驻的扫描服务
+
+    启动时预先加载所有扫描引擎（包括scapy），并为每种扫描类型准备一个
+    常驻的扫描器。通过HTTP接口提交的任务在线程池中执行，同时最多运行
+    max_jobs个任务；任务从空闲的扫描器中取用同类型的扫描器，用完后放回，
+    thread引擎的线程池、batch引擎的收发套接字和原始数据包的收发器在任务
+    之间保持打开。所有任务共享同一个发包速率控制器和DNS缓存，每个任务的
+    开销只剩探测本身。
+    """
+
+    def __init__(self, max_jobs=4, min_rate=None, max_rate=None, preload=True, history_dir=None):
+        self.max_jobs = max_jobs
+        # 任务的历史数据库只能位于启动时指定的目录中
+        self.history_dir = None
+        if history_dir:
+            self.history_dir = os.path.abspath(history_dir)
+            try:
+                os.makedirs(self.history_dir, mode=0o700, exist_ok=True)
+            except OSError as e:
+                raise Exception(f"无法创建历史数据库目录 {history_dir}: {e}")
+        self.rate_controller = RateController(min_rate, max_rate)
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self.jobs = {}
+        self.schedules = {}
+        self.job_ids = itertools.count(1)
+        self.schedule_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.scheduler_thread = None
+        # 空闲的常驻扫描器: 扫描类型 -> [PortScanner]，同一类型最多有max_jobs个
+        self.idle_scanners = {scan_type: [] for scan_type in SCAN_PROBES}
+        if preload:
+            self.preload()
+
+    def preload(self):
+        """导入所有扫描类型和引擎的模块，第一个任务不再承担导入的开销"""
+        for scan_type in SCAN_PROBES:
+            try:
+                load_probe(scan_type)
+            except ImportError:
+                # 没有安装scapy时只能进行TCP Connect扫描
+                pass
+        for module in ("scheduler", "async_scanner", "discovery", "syn_scanner"):
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass
+        if RAW_SOCKETS:
+            # 提前打开线程引擎共用的原始套接字和接收线程（需要root权限）
+            try:
+                importlib.import_module("raw_probes").exchange()
+            except OSError:
+                pass
+        for scan_type, scanners in self.idle_scanners.items():
+            scanners.append(PortScanner(warm=True))
+
+    def acquire_scanner(self, scan_type):
+        """取出一个空闲的常驻扫描器，没有时新建"""
+        with self.lock:
+            scanners = self.idle_scanners[scan_type]
+            return scanners.pop() if scanners else PortScanner(warm=True)
+
+    def release_scanner(self, scan_type, scanner):
+        """任务结束后把扫描器放回空闲列表，守护进程停止后直接释放"""
+        with self.lock:
+            if not self.stopped.is_set():
+                self.idle_scanners[scan_type].append(scanner)
+                return
+        scanner.close()
+
+    def job_settings(self, params):
+        """检查任务参数，历史数据库的名称解析到历史目录中"""
+        settings = job_settings(params)
+        if settings["history"]:
+            self.history_path(settings["history"])
+        return settings
+
+    def history_path(self, name):
+        """返回历史目录中名为name的数据库路径，name只能是文件名"""
+        if self.history_dir is None:
+            raise Exception("守护进程启动时没有指定历史数据库目录 (--history-dir)，任务不能使用history")
+        if (name in ('.', '..') or os.path.basename(name) != name
+                or (os.path.altsep and os.path.altsep in name)):
+            raise Exception(f"历史数据库 (history) 只能是文件名，不能包含路径: {name}")
+        return os.path.join(self.history_dir, name)
+
+    def submit(self, params, schedule_id=None):
+        """提交一个扫描任务，返回ScanJob"""
+        settings = self.job_settings(params)
+        with self.lock:
+            job = ScanJob(next(self.job_ids), settings, schedule_id)
+            self.jobs[job.id] = job
+            self.prune_locked()
+        job.future = self.executor.submit(self.run_job, job)
+        return job
+
+    def prune_locked(self):
+        finished = [job for job in self.jobs.values() if job.finished is not None]
+        for job in sorted(finished, key=lambda job: job.finished)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def run_job(self, job):
+        if job.state != "queued":
+            return
+        settings = job.settings
+        scanner = self.acquire_scanner(settings["scan_type"])
+        # 先设置扫描器再改变状态，取消运行中的任务时总能找到扫描器
+        job.scanner = scanner
+        job.state = "running"
+        job.started = time.time()
+        history = None
+        try:
+            targets = TargetSpec(settings["targets"].split(','))
+            ports = PortSpec(settings["ports"])
+            if settings["history"]:
+                history = ScanHistory(self.history_path(settings["history"]),
+                                      json.dumps(settings, ensure_ascii=False))
+                if settings["delta"]:
+                    protocol = "udp" if settings["scan_type"] == "UDP" else "tcp"
+                    planned, plan = history.plan_delta(ports, protocol, settings["delta_slices"])
+                    job.message(f"增量扫描: 已知开放或最近变化的端口 {plan['priority']} 个，"
+                                f"其余端口第 {plan['slice'] + 1}/{plan['slices']} 片 {plan['tail']} 个")
+                    ports = PortSpec(format_port_ranges(planned))
+            output = ScanOutput([job.writer], json.dumps(settings, ensure_ascii=False))
+            results = scanner.scan_multiple_targets(
+                targets, ports, settings["scan_type"], settings["threads"], job.message,
+                engine=settings["engine"], concurrency=settings["concurrency"],
+                timing=settings["timing"], host_discovery=settings["host_discovery"],
+                randomize=settings["randomize"], seed=settings["seed"],
+                progress_update_callback=job.update_progress, output=output,
+                stats_interval=settings["stats_interval"],
+                service_detection=settings["service_detection"],
+                history=history, change_callback=job.record_changes,
+                rate_controller=self.rate_controller,
+            )
+            job.open_ports = results
+            job.state = "cancelled" if job.state == "cancelling" else "done"
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            if history is not None:
+                history.close()
+            job.writer.close()
+            # 在锁内解除关联，扫描器放回后不会被取消本任务的请求停止
+            with self.lock:
+                job.scanner = None
+            self.release_scanner(settings["scan_type"], scanner)
+            job.finished = time.time()
+
+    def cancel(self, job_id):
+        """取消排队中的任务或停止运行中的任务"""
+        job = self.get_job(job_id)
+        if job.state == "queued" and job.future.cancel():
+            job.state = "cancelled"
+            job.finished = time.time()
+            job.writer.close()
+        elif job.state == "running":
+            job.state = "cancelling"
+            with self.lock:
+                if job.scanner is not None:
+                    job.scanner.stop_scan()
+        return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def add_schedule(self, params):
+        """添加定时任务，params中的every为间隔秒数"""
+        params = dict(params)
+        every = params.pop("every", None)
+        if not isinstance(every, (int, float)) or every < MIN_SCHEDULE_INTERVAL:
+            raise Exception(f"定时任务的间隔 (every) 不能小于 {MIN_SCHEDULE_INTERVAL} 秒")
+        settings = self.job_settings(params)
+        with self.lock:
+            schedule = ScanSchedule(next(self.schedule_ids), settings, every)
+            self.schedules[schedule.id] = schedule
+        return schedule
+
+    def remove_schedule(self, schedule_id):
+        with self.lock:
+            schedule = self.schedules.pop(schedule_id, None)
+        if schedule is None:
+            raise KeyError(schedule_id)
+        return schedule
+
+    def run_schedules(self):
+        """定时提交到期的定时任务"""
+        while not self.stopped.wait(1.0):
+            now = time.time()
+            with self.lock:
+                due = [schedule for schedule in self.schedules.values() if schedule.next_run <= now]
+            for schedule in due:
+                last = self.jobs.get(schedule.last_job)
+                if last is not None and last.finished is None:
+                    continue
+                job = self.submit(schedule.settings, schedule.id)
+                schedule.last_job = job.id
+                schedule.runs += 1
+                schedule.next_run = now + schedule.every
+
+    def start(self):
+        self.scheduler_thread = threading.Thread(target=self.run_schedules, daemon=True)
+        self.scheduler_thread.start()
+
+    def stop(self):
+        """停止定时任务和所有运行中的任务"""
+        self.stopped.set()
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if job.finished is None:
+                self.cancel(job.id)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            scanners = [scanner for idle in self.idle_scanners.values() for scanner in idle]
+            for idle in self.idle_scanners.values():
+                idle.clear()
+        for scanner in scanners:
+            scanner.close()
+
+
+class RequestError(Exception):
+    """带有HTTP状态码的请求错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def object_id(text):
+    """解析路径中的任务编号，无效的编号按不存在处理"""
+    try:
+        return int(text)
+    except ValueError:
+        raise KeyError(text)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """任务接口
+
+        GET    /jobs                     任务列表
+        POST   /jobs                     提交任务，请求体为任务参数 (JSON)
+        GET    /jobs/<id>                任务状态
+        GET    /jobs/<id>/results        任务的JSON Lines记录；?follow=1 持续返回直到任务结束，?offset=N 跳过前N条
+        DELETE /jobs/<id>                取消任务
+        GET    /schedules                定时任务列表
+        POST   /schedules                添加定时任务，参数中的every为间隔秒数
+        DELETE /schedules/<id>           删除定时任务
+
+    POST的请求体必须是 Content-Type: application/json；启动时指定了令牌时，
+    所有请求都需要带有 Authorization: Bearer <令牌>，否则监听TCP端口时
+    只接受Host为本机名称或监听地址的请求。
+    """
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        # 浏览器的跨域简单请求不能使用application/json，要求该类型可以阻止网页代替用户提交任务
+        if self.headers.get_content_type() != "application/json":
+            raise RequestError(415, "请求体的Content-Type必须是application/json")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            raise Exception(f"请求体不是有效的JSON: {e}")
+
+    def route(self):
+        """返回 (路径各段, 查询参数)"""
+        path, _, query = self.path.partition('?')
+        params = dict(item.partition('=')[::2] for item in query.split('&') if item)
+        return [part for part in path.split('/') if part], params
+
+    def check_host(self):
+        """没有令牌时拒绝Host不是本机名称或监听地址的请求
+
+        DNS重绑定后网页与接口同源，可以提交任意请求，但请求的Host仍是网页的域名。
+        """
+        if self.server.allowed_hosts is None:
+            return
+        host = (self.headers.get("Host") or "").strip().lower()
+        if host.startswith("["):
+            host = host[1:].partition("]")[0]
+        elif host.count(":") == 1:
+            host = host.partition(":")[0]
+        if host not in self.server.allowed_hosts:
+            raise RequestError(403, f"不接受的Host: {host or '(空)'}，请使用本机地址访问或启动时指定接口令牌")
+
+    def check_token(self):
+        """启动时指定了令牌时，请求需要带有 Authorization: Bearer <令牌>"""
+        token = self.server.api_token
+        if token is None:
+            self.check_host()
+            return
+        scheme, _, value = (self.headers.get("Authorization") or "").partition(' ')
+        if scheme.lower() != "bearer" or not hmac.compare_digest(value.strip(), token):
+            raise RequestError(401, "缺少或错误的接口令牌")
+
+    def handle_request(self, method):
+        daemon = self.server.scan_daemon
+        parts, params = self.route()
+        try:
+            self.check_token()
+            if parts == ["jobs"] and method == "GET":
+                with daemon.lock:
+                    jobs = list(daemon.jobs.values())
+                self.send_json(200, [job.to_dict() for job in jobs])
+            elif parts == ["jobs"] and method == "POST":
+                self.send_json(201, daemon.submit(self.read_json()).to_dict())
+            elif len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+                self.send_json(200, daemon.get_job(object_id(parts[1])).to_dict())
+            elif len(parts) == 2 and parts[0] == "jobs" and method == "DELETE":
+                self.send_json(200, daemon.cancel(object_id(parts[1])).to_dict())
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "results" and method == "GET":
+                self.send_results(daemon.get_job(object_id(parts[1])), int(params.get("offset") or 0),
+                                  params.get("follow") in ("1", "true"))
+            elif parts == ["schedules"] and method == "GET":
+                with daemon.lock:
+                    schedules = list(daemon.schedules.values())
+                self.send_json(200, [schedule.to_dict() for schedule in schedules])
+            elif parts == ["schedules"] and method == "POST":
+                self.send_json(201, daemon.add_schedule(self.read_json()).to_dict())
+            elif len(parts) == 2 and parts[0] == "schedules" and method == "DELETE":
+                self.send_json(200, daemon.remove_schedule(object_id(parts[1])).to_dict())
+            else:
+                self.send_json(404, {"error": f"未知的接口: {method} {self.path}"})
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except KeyError:
+            self.send_json(404, {"error": f"任务或定时任务不存在: {self.path}"})
+        except Exception as e:
+            self.send_json(400, {"error": str(e)})
+
+    def send_results(self, job, offset, follow):
+        """返回任务的JSON Lines记录，follow时持续返回新记录直到任务结束"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+        while True:
+            records, closed = job.writer.read(offset, FOLLOW_INTERVAL if follow else 0)
+            if records:
+                self.wfile.write("".join(records).encode("utf-8"))
+                self.wfile.flush()
+                offset += len(records)
+            if not follow or (closed and not records) or self.server.scan_daemon.stopped.is_set():
+                break
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """监听Unix套接字的HTTP服务"""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        # 只允许当前用户访问
+        os.chmod(self.server_address, 0o600)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def create_server(daemon, listen=None, socket_path=None, token=None):
+    """创建任务接口的HTTP服务，listen为 "host:port"，socket_path为Unix套接字路径，
+    token不为None时每个请求都需要提供该令牌"""
+    try:
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = UnixHTTPServer(socket_path, DaemonHandler)
+        else:
+            host, _, port = listen.rpartition(':')
+            server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), DaemonHandler)
+    except (OSError, ValueError) as e:
+        raise Exception(f"无法启动任务接口 {socket_path or listen}: {e}")
+    server.scan_daemon = daemon
+    server.api_token = token
+    # 浏览器无法访问Unix套接字，只检查TCP接口的Host
+    server.allowed_hosts = None
+    if not socket_path:
+        server.allowed_hosts = {"localhost", "127.0.0.1", "::1"}
+        if host not in ("", "0.0.0.0", "::"):
+            server.allowed_hosts.add(host.strip("[]").lower())
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import errno
+import ipaddress
+import os
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from resolver import address_family, address_of
+
+# TCP SYN/ACK ping使用的端口
+SYN_PING_PORTS = [80, 443, 22]
+ACK_PING_PORTS = [80]
+
+
+def has_raw_privileges():
+    """是否有发送原始数据包的权限"""
+    return hasattr(os, "geteuid") and os.geteuid() == 0
+
+
+class HostDiscovery:
+    """端口扫描前的主机发现
+
+    对本地网段的目标发送ARP请求，对其他目标发送ICMP echo以及
+    TCP SYN/ACK ping，任意一种得到回应即认为主机存活。
+    目标按批次处理，多个批次并发执行；没有原始套接字权限时
+    退回到TCP连接探测，这时不加载scapy。
+    """
+
+    def __init__(self, timeout=1.0, batch_size=256, workers=8, rate_controller=None):
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.workers = workers
+        self.rate_controller = rate_controller
+
+    def send_interval(self):
+        """按速率控制器换算批量发送的包间隔"""
+        if self.rate_controller is None or self.rate_controller.rate is None:
+            return 0
+        return 1.0 / self.rate_controller.rate
+
+    def arp_ping(self, ips):
+        """在本地网段发送ARP请求，返回回应的IP集合"""
+        from scapy.all import srp, conf, ARP, Ether
+
+        by_iface = {}
+        for ip in ips:
+            iface, _, gateway = conf.route.route(ip)
+            if gateway == "0.0.0.0" and iface != conf.loopback_name:
+                by_iface.setdefault(iface, []).append(ip)
+
+        alive = set()
+        for iface, local_ips in by_iface.items():
+            answered, _ = srp(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=local_ips), iface=iface,
+                              timeout=self.timeout, inter=self.send_interval(), verbose=0)
+            alive.update(reply[ARP].psrc for _, reply in answered)
+        return alive
+
+    def ip_ping(self, ips):
+        """发送ICMP echo和TCP SYN/ACK ping，返回回应的IP集合"""
+        from scapy.all import sr, IP, ICMP, TCP
+
+        packets = (
+            [IP(dst=ip)/ICMP() for ip in ips]
+            + [IP(dst=ip)/TCP(dport=SYN_PING_PORTS, flags="S") for ip in ips]
+            + [IP(dst=ip)/TCP(dport=ACK_PING_PORTS, flags="A") for ip in ips]
+        )
+        answered, _ = sr(packets, timeout=self.timeout, inter=self.send_interval(), verbose=0)
+        return {reply[IP].src for _, reply in answered}
+
+    def connect_ping(self, ip):
+        """无原始套接字权限时，用TCP连接判断主机是否存活"""
+        for port in SYN_PING_PORTS:
+            s = socket.socket(address_family(ip), socket.SOCK_STREAM)
+            s.settimeout(self.timeout)
+            try:
+                result = s.connect_ex((ip, port))
+            finally:
+                s.close()
+            # 连接成功或被拒绝都说明主机在线
+            if result == 0 or result == errno.ECONNREFUSED:
+                return True
+        return False
+
+    def probe_batch(self, ips):
+        """对一批IP执行所有发现方式，返回存活的IP集合"""
+        # ARP和ICMP ping只支持IPv4，没有原始套接字权限时和IPv6地址都用TCP连接判断
+        if has_raw_privileges():
+            connect_ips = [ip for ip in ips if address_family(ip) == socket.AF_INET6]
+            ips = [ip for ip in ips if address_family(ip) == socket.AF_INET]
+        else:
+            connect_ips, ips = ips, []
+        # 回环地址无需探测
+        alive = {ip for ip in connect_ips if ipaddress.ip_address(ip).is_loopback}
+        remaining = [ip for ip in connect_ips if ip not in alive]
+        if remaining:
+            with ThreadPoolExecutor(max_workers=min(64, len(remaining))) as executor:
+                results = executor.map(self.connect_ping, remaining)
+                alive |= {ip for ip, up in zip(remaining, results) if up}
+        if not ips:
+            return alive
+
+        from scapy.all import conf
+
+        # 经回环接口路由的地址（回环地址和本机地址）无需探测
+        alive |= {ip for ip in ips if conf.route.route(ip)[0] == conf.loopback_name}
+        remaining = [ip for ip in ips if ip not in alive]
+        if not remaining:
+            return alive
+
+        alive |= self.arp_ping(remaining)
+        remaining = [ip for ip in remaining if ip not in alive]
+        if remaining:
+            alive |= self.ip_ping(remaining)
+        return alive
+
+    def probe_targets(self, targets, progress_callback=None):
+        """解析一批目标并探测，返回其中存活的目标"""
+        ip_of = {}
+        for target in targets:
+            try:
+                ip_of[target] = address_of(target)
+            except socket.gaierror as e:
+                if progress_callback:
+                    progress_callback(f"无法解析目标 {target}: {e}")
+
+        alive = self.probe_batch(list(dict.fromkeys(ip_of.values())))
+        return [target for target in targets if ip_of.get(target) in alive]
+
+    def discover(self, targets, progress_callback=None):
+        """返回存活的目标列表，保持原有顺序
+
+        目标按批次逐步读取，同时最多有workers个批次在探测，
+        不会一次性展开整个目标集合。
+        """
+        alive = []
+        pending = deque()
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for target in targets:
+                batch.append(target)
+                if len(batch) < self.batch_size:
+                    continue
+                pending.append(executor.submit(self.probe_targets, batch, progress_callback))
+                batch = []
+                if len(pending) >= self.workers:
+                    alive.extend(pending.popleft().result())
+            if batch:
+                pending.append(executor.submit(self.probe_targets, batch, progress_callback))
+            while pending:
+                alive.extend(pending.popleft().result())
+        return alive
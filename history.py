@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+import time
+from results import PortState
+from output import format_port_ranges
+
+HISTORY_VERSION = 1
+
+# 状态在该时间内变化过的端口在增量扫描中每次都扫描（秒）
+RECENT_CHANGE_WINDOW = 7 * 86400
+# 按间隔提交事务，避免每个主机提交一次（秒）
+COMMIT_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    start REAL,
+    end REAL,
+    scan_type TEXT,
+    protocol TEXT,
+    port_count INTEGER,
+    args TEXT,
+    hosts INTEGER DEFAULT 0,
+    changes INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    first_seen REAL,
+    last_seen REAL,
+    run_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS ports (
+    host TEXT,
+    protocol TEXT,
+    port INTEGER,
+    state INTEGER,
+    service TEXT,
+    first_seen REAL,
+    last_seen REAL,
+    last_change REAL,
+    run_id INTEGER,
+    PRIMARY KEY (host, protocol, port)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ports_by_state ON ports (protocol, state, port);
+CREATE INDEX IF NOT EXISTS ports_by_change ON ports (protocol, last_change);
+"""
+
+# 只有确认开放的端口算作开放；UDP无回应的端口都是open|filtered，记录它们会使
+# 增量扫描把几乎所有无回应的端口当作已知开放，并把它们的变化报告为开放/关闭
+KNOWN_OPEN = PortState.OPEN
+
+
+def format_change(target, change):
+    """把一条端口变化格式化为一行文本"""
+    port, old, new = change
+    old_text = str(old) if old is not None else "未记录"
+    if new == KNOWN_OPEN:
+        return f"{target}:{port} 新开放（{old_text} → {new}）"
+    return f"{target}:{port} 不再开放（{old_text} → {new}）"
+
+
+class ScanHistory:
+    """基于SQLite的扫描历史库
+
+    每个 (主机, 协议, 端口) 一行，只记录确认开放 (open) 过的端口：当前状态、首次和最近
+    一次扫描到的时间以及最近一次状态变化的时间，全端口扫描大量网段时
+    数据库的大小只与开放端口数有关。每次扫描记录为一次运行，
+    主机完成时与上次的状态比较，返回新开放和不再开放的端口。
+    增量扫描 (plan_delta) 每次都扫描已知开放和最近变化过的端口，
+    其余端口分成若干片，每次运行轮流扫描其中一片。
+    """
+
+    def __init__(self, file_path, args=""):
+        self.file_path = file_path
+        self.args = args
+        self.run_id = None
+        self.protocol = None
+        self.host_count = 0
+        self.change_count = 0
+        self.last_commit = time.monotonic()
+        self.lock = threading.Lock()
+        try:
+            # 主机完成的回调可能来自扫描线程或服务识别线程，访问都在锁内进行
+            self.db = sqlite3.connect(file_path, check_same_thread=False)
+            self.db.executescript(SCHEMA)
+            version = self.get_meta("version")
+            if version is None:
+                self.set_meta("version", HISTORY_VERSION)
+            elif int(version) != HISTORY_VERSION:
+                raise Exception(f"不支持的历史数据库版本: {version}")
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise Exception(f"打开历史数据库失败: {e}")
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def plan_delta(self, ports, protocol, slices=8, now=None):
+        """规划一次增量扫描的端口
+
+        Args:
+            ports: 完整的端口范围
+            protocol: "tcp" 或 "udp"
+            slices: 其余端口分成的片数，每次运行扫描其中一片
+
+        Returns:
+            tuple: (端口列表, 信息)，信息包含 priority（已知开放和最近变化的端口数）、
+            tail（本次扫描的其余端口数）、slice（本次扫描的片序号，从0开始）和 slices
+        """
+        now = time.time() if now is None else now
+        key = f"slice:{protocol}:{format_port_ranges(ports)}"
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT port FROM ports WHERE protocol = ? AND (state = ? OR last_change >= ?)",
+                (protocol, int(KNOWN_OPEN), now - RECENT_CHANGE_WINDOW)).fetchall()
+            index = int(self.get_meta(key) or 0) % slices
+            # 片序号在规划时前进，中断的运行不会重复扫描同一片
+            self.set_meta(key, (index + 1) % slices)
+            self.db.commit()
+        known = {port for port, in rows}
+        priority = []
+        tail = []
+        for position, port in enumerate(sorted(set(ports))):
+            if port in known:
+                priority.append(port)
+            elif position % slices == index:
+                tail.append(port)
+        info = {"priority": len(priority), "tail": len(tail), "slice": index, "slices": slices}
+        return sorted(priority + tail), info
+
+    def begin_run(self, scan_type, protocol, ports):
+        """开始记录一次扫描"""
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO runs (start, scan_type, protocol, port_count, args) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), scan_type, protocol, len(ports), self.args))
+            self.run_id = cursor.lastrowid
+            self.protocol = protocol
+            self.host_count = 0
+            self.change_count = 0
+            self.db.commit()
+
+    def record_host(self, target, host, services=None):
+        """记录主机的扫描结果，返回与上次相比的变化
+
+        Args:
+            target: 目标
+            host: ResultStore中的HostResult，未扫描的端口（增量扫描）不视为变化
+            services: {port: 服务名} 服务识别的结果
+
+        Returns:
+            list: [(port, 上次的状态或None, 本次的状态)]，按端口排序
+        """
+        if host is None:
+            return []
+        services = services or {}
+        now = time.time()
+        changes = []
+        with self.lock:
+            previous = dict(self.db.execute("SELECT port, state FROM ports WHERE host = ? AND protocol = ?",
+                                            (target, self.protocol)).fetchall())
+            open_ports = host.ports(KNOWN_OPEN)
+            for port in open_ports:
+                state = KNOWN_OPEN
+                old = previous.get(port)
+                old = PortState(old) if old is not None else None
+                changed = old != KNOWN_OPEN
+                if changed:
+                    changes.append((port, old, state))
+                self.db.execute(
+                    "INSERT INTO ports (host, protocol, port, state, service, first_seen, last_seen, last_change, run_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (host, protocol, port) DO UPDATE SET state = excluded.state, "
+                    "service = COALESCE(excluded.service, service), last_seen = excluded.last_seen, "
+                    "last_change = CASE WHEN ? THEN excluded.last_change ELSE last_change END, "
+                    "run_id = excluded.run_id",
+                    (target, self.protocol, port, int(state), services.get(port), now, now, now, self.run_id,
+                     changed))
+            open_set = set(open_ports)
+            for port, old in previous.items():
+                if port in open_set:
+                    continue
+                state = host.state(port)
+                if state is None:
+                    continue
+                old = PortState(old)
+                if old == KNOWN_OPEN:
+                    changes.append((port, old, state))
+                self.db.execute(
+                    "UPDATE ports SET state = ?, last_seen = ?, "
+                    "last_change = CASE WHEN state != ? THEN ? ELSE last_change END, run_id = ? "
+                    "WHERE host = ? AND protocol = ? AND port = ?",
+                    (int(state), now, int(state), now, self.run_id, target, self.protocol, port))
+            self.db.execute(
+                "INSERT INTO hosts (host, first_seen, last_seen, run_id) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (host) DO UPDATE SET last_seen = excluded.last_seen, run_id = excluded.run_id",
+                (target, now, now, self.run_id))
+            self.host_count += 1
+            self.change_count += len(changes)
+            if time.monotonic() - self.last_commit >= COMMIT_INTERVAL:
+                self.commit_locked()
+        changes.sort()
+        return changes
+
+    def commit_locked(self):
+        try:
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise Exception(f"写入历史数据库失败: {e}")
+        self.last_commit = time.monotonic()
+
+    def finish_run(self):
+        """结束本次扫描的记录"""
+        with self.lock:
+            if self.run_id is None:
+                return
+            self.db.execute("UPDATE runs SET end = ?, hosts = ?, changes = ? WHERE id = ?",
+                            (time.time(), self.host_count, self.change_count, self.run_id))
+            self.commit_locked()
+            self.run_id = None
+
+    def close(self):
+        with self.lock:
+            self.commit_locked()
+            self.db.close()
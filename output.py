@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import socket
+import threading
+import time
+from results import ResultStore
+from resolver import address_family, address_of
+
+# 扫描类型对应的协议和nmap中的扫描类型名
+SCAN_TYPE_INFO = {
+    "SYN": ("tcp", "syn"),
+    "TCP": ("tcp", "connect"),
+    "UDP": ("udp", "udp"),
+}
+
+# XML属性值中需要转义的字符
+XML_ATTRIBUTE_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;",
+                                       "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"})
+
+
+def quoteattr(value):
+    """转义XML属性值并加上双引号（xml.sax.saxutils会连带导入urllib，拖慢启动）"""
+    return '"' + str(value).translate(XML_ATTRIBUTE_ESCAPES) + '"'
+
+
+def format_port_ranges(ports):
+    """把端口序列压缩为 "1-100,443" 形式的字符串"""
+    ranges = []
+    for port in sorted(set(ports)):
+        if ranges and port == ranges[-1][1] + 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+class StreamWriter:
+    """流式输出的基类
+
+    扫描过程中持续写入，内容先进入缓冲区，每隔flush_interval秒
+    或主机扫描完成时写入文件，便于其他工具 tail -f 读取。
+    append为True时（恢复扫描）追加到已有的文件。
+    """
+
+    def __init__(self, file_path, flush_interval=1.0, append=False):
+        try:
+            self.file = open(file_path, 'a' if append else 'w', encoding='utf-8')
+        except Exception as e:
+            raise Exception(f"打开输出文件失败: {e}")
+        # 追加到非空文件时，部分格式不再重复写入文件头
+        self.resumed = append and self.file.tell() > 0
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            self.buffer.append(text)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def start_scan(self, info):
+        pass
+
+    def port_result(self, target, port, status, elapsed):
+        pass
+
+    def service_result(self, target, port, service):
+        pass
+
+    def host_done(self, target, host):
+        self.flush()
+
+    def scan_stats(self, stats):
+        pass
+
+    def end_scan(self, info):
+        pass
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class JsonLinesWriter(StreamWriter):
+    """JSON Lines格式，每个端口结果一行"""
+
+    def write_record(self, record):
+        self.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def start_scan(self, info):
+        self.write_record({"type": "scan_start", **info})
+
+    def port_result(self, target, port, status, elapsed):
+        self.write_record({
+            "type": "port",
+            "target": target,
+            "port": port,
+            "protocol": self.protocol,
+            "state": status.nmap_name,
+            "status": str(status),
+            "elapsed": round(elapsed, 6) if elapsed is not None else None,
+            "time": round(time.time(), 3),
+        })
+
+    def service_result(self, target, port, service):
+        self.write_record({
+            "type": "service",
+            "target": target,
+            "port": port,
+            "protocol": self.protocol,
+            **service,
+            "time": round(time.time(), 3),
+        })
+
+    def host_done(self, target, host):
+        self.write_record({"type": "host", "target": target, **host})
+        super().host_done(target, host)
+
+    def scan_stats(self, stats):
+        self.write_record({"type": "stats", "time": round(time.time(), 3), **stats})
+
+    def end_scan(self, info):
+        self.write_record({"type": "scan_end", **info})
+
+
+class GrepableWriter(StreamWriter):
+    """grepable格式，每个主机一行，与nmap -oG兼容"""
+
+    def start_scan(self, info):
+        self.write(f"# pscan scan initiated {time.ctime(info['start'])} as: {info['args']}\n")
+
+    def host_done(self, target, host):
+        entries = []
+        for port, state in host["ports"]:
+            service = host["services"].get(port)
+            if service is None:
+                entries.append(f"{port}/{state}/{self.protocol}/////")
+                continue
+            # nmap -oG中隧道和服务名用 | 连接，例如 ssl|http
+            name = f"{service['tunnel']}|{service['name']}" if service["tunnel"] else service["name"]
+            version = " ".join(service[key] for key in ("product", "version") if service[key])
+            entries.append(f"{port}/{state}/{self.protocol}//{name}//{version}/")
+        line = f"Host: {host['address']} ({target if target != host['address'] else ''})\t"
+        line += f"Ports: {', '.join(entries)}"
+        if host["ignored"]:
+            ignored = ", ".join(f"{state} ({count})" for state, count in host["ignored"])
+            line += f"\tIgnored State: {ignored}"
+        self.write(line + "\n")
+        super().host_done(target, host)
+
+    def end_scan(self, info):
+        self.write(f"# pscan done at {time.ctime(info['end'])} -- {info['hosts']} hosts scanned "
+                   f"in {info['elapsed']:.2f} seconds\n")
+
+
+class XmlWriter(StreamWriter):
+    """XML格式，与nmap -oX的结构兼容
+
+    每个主机扫描完成后立即写出<host>元素，扫描结束时才写入
+    <runstats>和闭合标签。恢复扫描时去掉上次写入的<runstats>和闭合标签，
+    新的<host>元素接在已有的元素后面。
+    """
+
+    def __init__(self, file_path, flush_interval=1.0, append=False):
+        if append:
+            self.strip_trailer(file_path)
+        super().__init__(file_path, flush_interval, append)
+
+    @staticmethod
+    def strip_trailer(file_path):
+        try:
+            with open(file_path, 'rb+') as f:
+                data = f.read()
+                index = data.rfind(b"<runstats>")
+                if index < 0:
+                    index = data.rfind(b"</nmaprun>")
+                if index >= 0:
+                    f.truncate(index)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            raise Exception(f"打开输出文件失败: {e}")
+
+    def start_scan(self, info):
+        if self.resumed:
+            return
+        self.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.write(f'<nmaprun scanner="pscan" args={quoteattr(info["args"])} start="{int(info["start"])}" '
+                   f'startstr={quoteattr(time.ctime(info["start"]))} xmloutputversion="1.05">\n')
+        self.write(f'<scaninfo type="{info["scan_name"]}" protocol="{self.protocol}" '
+                   f'numservices="{info["port_count"]}" services="{info["services"]}"/>\n')
+
+    def host_done(self, target, host):
+        addrtype = "ipv6" if address_family(host["address"]) == socket.AF_INET6 else "ipv4"
+        lines = [f'<host starttime="{int(host["start"])}" endtime="{int(host["end"])}">',
+                 '<status state="up" reason="user-set"/>',
+                 f'<address addr={quoteattr(host["address"])} addrtype="{addrtype}"/>']
+        if target != host["address"]:
+            lines.append(f'<hostnames><hostname name={quoteattr(target)} type="user"/></hostnames>')
+        lines.append('<ports>')
+        # 与nmap相同，每个省略的状态一个<extraports>元素
+        for state, count in host["ignored"]:
+            lines.append(f'<extraports state="{state}" count="{count}"/>')
+        for port, state in host["ports"]:
+            service = host["services"].get(port)
+            lines.append(f'<port protocol="{self.protocol}" portid="{port}"><state state="{state}"/>'
+                         f'{self.service_element(service) if service else ""}</port>')
+        lines.append('</ports>')
+        if host.get("srtt") is not None:
+            # nmap中的时间单位为微秒
+            lines.append(f'<times srtt="{int(host["srtt"] * 1e6)}" rttvar="{int(host["rttvar"] * 1e6)}" '
+                         f'to="{int(host["rto"] * 1e6)}"/>')
+        lines.append('</host>\n')
+        self.write("\n".join(lines))
+        super().host_done(target, host)
+
+    @staticmethod
+    def service_element(service):
+        attributes = [f'name={quoteattr(service["name"])}']
+        for key in ("product", "version", "tunnel"):
+            if service[key]:
+                attributes.append(f'{key}={quoteattr(service[key])}')
+        # 与nmap相同，探测得到的结果可信度为10，按端口号推测的为3
+        attributes.append(f'method="{service["method"]}" conf="{10 if service["method"] == "probed" else 3}"')
+        return f'<service {" ".join(attributes)}/>'
+
+    def end_scan(self, info):
+        self.write(f'<runstats><finished time="{int(info["end"])}" timestr={quoteattr(time.ctime(info["end"]))} '
+                   f'elapsed="{info["elapsed"]:.2f}"/>'
+                   f'<hosts up="{info["hosts"]}" down="0" total="{info["hosts"]}"/></runstats>\n')
+        self.write('</nmaprun>\n')
+
+
+class ScanOutput:
+    """把扫描过程中的端口结果和主机摘要分发给多个流式输出
+
+    主机摘要从ResultStore中读取：开放端口全部列出，其他状态的端口
+    超过MAX_LISTED个时只计数并在输出中合并为 extraports / Ignored State。
+    没有传入结果库时使用自己的结果库记录端口状态。
+    """
+
+    MAX_LISTED = 25
+
+    def __init__(self, writers=None, args=""):
+        self.writers = list(writers or [])
+        self.args = args
+        self.results = None
+        self.owns_results = False
+        self.host_starts = {}
+        self.host_count = 0
+        self.start_time = None
+        self.lock = threading.Lock()
+
+    def add_writer(self, writer):
+        self.writers.append(writer)
+
+    def start(self, scan_type, ports, results=None):
+        protocol, scan_name = SCAN_TYPE_INFO.get(scan_type, ("tcp", "connect"))
+        self.start_time = time.time()
+        self.owns_results = results is None
+        self.results = results if results is not None else ResultStore(ports)
+        info = {
+            "args": self.args,
+            "start": self.start_time,
+            "scan_type": scan_type,
+            "scan_name": scan_name,
+            "protocol": protocol,
+            "port_count": len(ports),
+            "services": format_port_ranges(ports),
+        }
+        for writer in self.writers:
+            writer.protocol = protocol
+            writer.start_scan(info)
+
+    def port_result(self, target, port, status, elapsed=None):
+        """记录单个端口的扫描结果"""
+        with self.lock:
+            if target not in self.host_starts:
+                self.host_starts[target] = time.time()
+        if self.owns_results:
+            self.results.record(target, port, status)
+        for writer in self.writers:
+            writer.port_result(target, port, status, elapsed)
+
+    def service_result(self, target, port, service):
+        """记录开放端口的服务识别结果"""
+        if self.owns_results:
+            self.results.set_service(target, port, service)
+        for writer in self.writers:
+            writer.service_result(target, port, service)
+
+    def host_done(self, target, open_ports, timing=None, rtt_histogram=None):
+        """主机扫描完成，输出主机摘要"""
+        with self.lock:
+            start = self.host_starts.pop(target, None) or time.time()
+            self.host_count += 1
+        host = self.results.finish(target) if self.owns_results else self.results.host(target)
+        counts = host.counts() if host is not None else {}
+        ports = []
+        ignored = []
+        for state, count in sorted(counts.items()):
+            if not state.is_open and count > self.MAX_LISTED:
+                ignored.append((state.nmap_name, count))
+                continue
+            ports.extend((port, state.nmap_name) for port in host.ports(state))
+        ports.sort()
+        try:
+            address = address_of(target)
+        except (socket.gaierror, UnicodeError):
+            address = target
+        summary = {
+            "address": address,
+            "start": start,
+            "end": time.time(),
+            "open_ports": list(open_ports),
+            "counts": {state.nmap_name: count for state, count in sorted(counts.items())},
+            "ports": ports,
+            "ignored": ignored,
+            "services": self.results.services_of(target),
+        }
+        if timing is not None and timing.srtt is not None:
+            summary.update(srtt=timing.srtt, rttvar=timing.rttvar, rto=timing.rto)
+        if rtt_histogram is not None:
+            summary["rtt_histogram"] = rtt_histogram
+        for writer in self.writers:
+            writer.host_done(target, summary)
+
+    def stats(self, stats):
+        """写入一条扫描统计记录"""
+        for writer in self.writers:
+            writer.scan_stats(stats)
+
+    def finish(self):
+        """扫描结束，写入统计信息并关闭所有输出"""
+        end = time.time()
+        info = {"end": end, "elapsed": end - (self.start_time or end), "hosts": self.host_count}
+        for writer in self.writers:
+            writer.end_scan(info)
+            writer.close()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 预先构造的原始数据包模板和按固定偏移的回应解码，不依赖scapy。
+# 每个目标只构造一次IP/TCP或IP/UDP头，固定字段的校验和预先求和，
+# 发送时只写入端口、序列号、标志和IP ID并增量计算校验和；
+# 回应由原始套接字接收，只读取判断端口状态所需的几个字段。
+
+import itertools
+import random
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from functools import lru_cache
+
+# Linux的原始套接字可以自行构造IP头 (IPPROTO_RAW)，并接收本机收到的所有TCP/UDP/ICMP数据包；
+# 其他平台上的原始数据包扫描仍通过scapy收发
+RAW_SOCKETS = sys.platform.startswith("linux")
+
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# 与scapy默认值相同的字段
+IP_TTL = 64
+TCP_WINDOW = 8192
+
+# 引用原数据包的ICMP差错消息（与scapy的sr1匹配的类型相同）
+ICMP_ERROR_TYPES = (3, 4, 5, 11, 12)
+
+SO_ATTACH_FILTER = 26
+# 原始套接字的接收缓冲区，批量扫描时回应可能短时间内大量到达（字节）
+RECEIVE_BUFFER = 4 * 1024 * 1024
+MAX_PACKET = 65535
+# 接收线程检查停止标志的间隔（秒）
+STOP_POLL_INTERVAL = 0.1
+
+# IP ID从随机值开始递增，next()在多个线程中调用是安全的
+IP_IDS = itertools.count(random.randrange(1 << 16))
+
+
+def fold(total):
+    """把反码求和的进位折回低16位"""
+    total = (total & 0xFFFF) + (total >> 16)
+    return (total & 0xFFFF) + (total >> 16)
+
+
+def ones_sum(data):
+    """按16位大端字求和（未折叠），奇数长度在末尾补零"""
+    if len(data) % 2:
+        data = bytes(data) + b"\0"
+    return sum(struct.unpack(f"!{len(data) // 2}H", data))
+
+
+@lru_cache(maxsize=1024)
+def payload_sum(payload):
+    """载荷的校验和部分，常见服务的UDP载荷只计算一次"""
+    return ones_sum(payload)
+
+
+@lru_cache(maxsize=4096)
+def source_address(destination):
+    """按路由表选择发往destination时使用的本机地址"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((destination, 9))
+        return s.getsockname()[0]
+    finally:
+        s.close()
+
+
+class TcpTemplate:
+    """发往一个目标的TCP数据包模板（20字节IP头 + 20字节TCP头，无选项）
+
+    地址、源端口、TTL和窗口等固定字段及其校验和只计算一次，
+    fill() 只写入目的端口、序列号、确认号、标志和IP ID，校验和按增量计算。
+    """
+
+    def __init__(self, destination, sport, source=None):
+        source = source or source_address(destination)
+        src = socket.inet_aton(source)
+        dst = socket.inet_aton(destination)
+        self.destination = destination
+        self.template = (struct.pack("!BBHHHBBH4s4s", 0x45, 0, 40, 0, 0, IP_TTL, socket.IPPROTO_TCP, 0,
+                                     src, dst)
+                         + struct.pack("!HHIIBBHHH", sport, 0, 0, 0, 5 << 4, 0, TCP_WINDOW, 0, 0))
+        # IP头中ID和校验和以外各字段的和
+        self.ip_sum = ones_sum(self.template[:20])
+        # 伪首部和TCP头固定字段的和
+        self.tcp_sum = ones_sum(src + dst) + socket.IPPROTO_TCP + 20 + ones_sum(self.template[20:])
+
+    def new_buffer(self):
+        """预先分配的发送缓冲区，同一时间只能由一个线程使用"""
+        return bytearray(self.template)
+
+    def fill(self, buffer, dport, seq, flags, ack=0):
+        """在缓冲区中写入本次发送的字段，返回缓冲区"""
+        ip_id = next(IP_IDS) & 0xFFFF
+        struct.pack_into("!H", buffer, 4, ip_id)
+        struct.pack_into("!H", buffer, 10, ~fold(self.ip_sum + ip_id) & 0xFFFF)
+        struct.pack_into("!HII", buffer, 22, dport, seq, ack)
+        buffer[33] = flags
+        total = self.tcp_sum + dport + (seq >> 16) + (seq & 0xFFFF) + (ack >> 16) + (ack & 0xFFFF) + flags
+        struct.pack_into("!H", buffer, 36, ~fold(total) & 0xFFFF)
+        return buffer
+
+
+class UdpTemplate:
+    """发往一个目标的UDP数据包模板（20字节IP头 + 8字节UDP头）
+
+    地址部分的校验和只计算一次，载荷的校验和按载荷缓存，
+    build() 只写入长度、端口和IP ID。
+    """
+
+    def __init__(self, destination, source=None):
+        source = source or source_address(destination)
+        src = socket.inet_aton(source)
+        dst = socket.inet_aton(destination)
+        self.destination = destination
+        self.template = (struct.pack("!BBHHHBBH4s4s", 0x45, 0, 0, 0, 0, IP_TTL, socket.IPPROTO_UDP, 0,
+                                     src, dst)
+                         + bytes(8))
+        self.ip_sum = ones_sum(self.template[:20])
+        self.pseudo_sum = ones_sum(src + dst) + socket.IPPROTO_UDP
+
+    def build(self, sport, dport, payload=b""):
+        length = 8 + len(payload)
+        ip_id = next(IP_IDS) & 0xFFFF
+        buffer = bytearray(self.template)
+        buffer += payload
+        struct.pack_into("!HH", buffer, 2, 20 + length, ip_id)
+        struct.pack_into("!H", buffer, 10, ~fold(self.ip_sum + 20 + length + ip_id) & 0xFFFF)
+        # 伪首部和UDP头中各有一次长度
+        total = self.pseudo_sum + 2 * length + sport + dport + payload_sum(payload)
+        # 校验和为0表示不校验，按RFC 768改为0xFFFF
+        struct.pack_into("!HHHH", buffer, 20, sport, dport, length, (~fold(total) & 0xFFFF) or 0xFFFF)
+        return buffer
+
+
+def decode(packet):
+    """按固定偏移解码收到的IPv4数据包
+
+    Returns:
+        tuple: TCP为 ("tcp", 源地址, 源端口, 目的端口, 序列号, 确认号, 标志)，
+        UDP为 ("udp", 源地址, 源端口, 目的端口)，
+        ICMP差错为 ("icmp", 源地址, 类型, 代码, 原数据包的协议, 原目的地址, 原源端口, 原目的端口)；
+        其他、不完整或非首个分片的数据包为None
+    """
+    if len(packet) < 20 or packet[0] >> 4 != 4:
+        return None
+    # 只有首个分片带有传输层头
+    if struct.unpack_from("!H", packet, 6)[0] & 0x1FFF:
+        return None
+    ihl = (packet[0] & 0x0F) * 4
+    protocol = packet[9]
+    source = socket.inet_ntoa(packet[12:16])
+    if protocol == socket.IPPROTO_TCP:
+        if len(packet) < ihl + 14:
+            return None
+        sport, dport, seq, ack = struct.unpack_from("!HHII", packet, ihl)
+        return "tcp", source, sport, dport, seq, ack, packet[ihl + 13]
+    if protocol == socket.IPPROTO_UDP:
+        if len(packet) < ihl + 4:
+            return None
+        sport, dport = struct.unpack_from("!HH", packet, ihl)
+        return "udp", source, sport, dport
+    if protocol == socket.IPPROTO_ICMP:
+        inner = ihl + 8
+        if len(packet) < inner + 20 or packet[ihl] not in ICMP_ERROR_TYPES:
+            return None
+        inner_ihl = (packet[inner] & 0x0F) * 4
+        if len(packet) < inner + inner_ihl + 4:
+            return None
+        sport, dport = struct.unpack_from("!HH", packet, inner + inner_ihl)
+        return ("icmp", source, packet[ihl], packet[ihl + 1], packet[inner + 9],
+                socket.inet_ntoa(packet[inner + 16:inner + 20]), sport, dport)
+    return None
+
+
+def tcp_answers(reply, seq):
+    """TCP回应是否回答序列号为seq的SYN（与scapy的匹配规则相同）"""
+    flags = reply[6]
+    # 不带ACK的SYN不是回应
+    if flags & TCP_SYN and not flags & TCP_ACK:
+        return False
+    # 不带ACK的RST不检查确认号
+    if flags & TCP_RST and not flags & TCP_ACK:
+        return True
+    return abs(reply[5] - seq) <= 2
+
+
+def attach_port_filter(sock, low, high):
+    """在内核中只保留目的端口在 [low, high] 内的TCP或UDP数据包（SO_ATTACH_FILTER）
+
+    无法附加时忽略，由Python层按端口过滤。
+    """
+    import ctypes
+
+    program = [
+        (0xB1, 0, 0, 0),           # ldxb 4*([0]&0xf)  IP头长度
+        (0x48, 0, 0, 2),           # ldh [x+2]         目的端口
+        (0x35, 0, 2, low),         # jge #low
+        (0x25, 1, 0, high),        # jgt #high
+        (0x06, 0, 0, MAX_PACKET),  # ret 保留
+        (0x06, 0, 0, 0),           # ret 丢弃
+    ]
+    code = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *insn) for insn in program))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack("HL", len(program), ctypes.addressof(code))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    except OSError:
+        pass
+
+
+def open_send_socket():
+    """发送原始IP数据包的套接字（IPPROTO_RAW隐含IP_HDRINCL）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, RECEIVE_BUFFER)
+    except OSError:
+        pass
+    return sock
+
+
+class RawReceiver:
+    """在后台线程中从原始套接字接收数据包，交给 handler(数据包, 接收时间)"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.selector = selectors.DefaultSelector()
+        self.sockets = []
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, protocol, ports=None):
+        """接收一种协议的数据包，ports为 (low, high) 时只接收目的端口在范围内的数据包"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, protocol)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except OSError:
+            pass
+        if ports is not None:
+            attach_port_filter(sock, *ports)
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.sockets.append(sock)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for key, _ in self.selector.select(STOP_POLL_INTERVAL):
+                while True:
+                    try:
+                        packet = key.fileobj.recv(MAX_PACKET)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break
+                    self.handler(packet, time.time())
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        for sock in self.sockets:
+            self.selector.unregister(sock)
+            sock.close()
+        self.selector.close()
+
+
+class Waiter:
+    """一个等待回应的探测"""
+
+    __slots__ = ("seq", "event", "reply", "time")
+
+    def __init__(self, seq=None):
+        self.seq = seq
+        self.event = threading.Event()
+        self.reply = None
+        self.time = None
+
+
+class RawExchange:
+    """线程引擎中所有原始数据包探测共用的收发器
+
+    所有探测共用一个发送套接字和一个接收线程。探测发送前按
+    (协议, 目标地址, 目标端口, 本机源端口) 登记，接收线程解码回应
+    （或引用了原数据包的ICMP差错）后唤醒对应的探测，代替每次调用sr1时
+    创建抓包套接字并完整解析回应。进程内只创建一个，见 raw_exchange()。
+    """
+
+    def __init__(self, tcp_sport, udp_ports):
+        self.tcp_sport = tcp_sport
+        self.send_sock = open_send_socket()
+        self.waiters = {}
+        self.lock = threading.Lock()
+        self.receiver = RawReceiver(self.handle)
+        self.receiver.add(socket.IPPROTO_TCP, (tcp_sport, tcp_sport))
+        self.receiver.add(socket.IPPROTO_UDP, udp_ports)
+        self.receiver.add(socket.IPPROTO_ICMP)
+        self.receiver.start()
+
+    @lru_cache(maxsize=4096)
+    def tcp_template(self, destination):
+        return TcpTemplate(destination, self.tcp_sport)
+
+    @lru_cache(maxsize=4096)
+    def udp_template(self, destination):
+        return UdpTemplate(destination)
+
+    def request(self, key, packet, timeout, seq=None):
+        """发送数据包并等待回应
+
+        Args:
+            key: (协议, 目标地址, 目标端口, 本机源端口)
+            seq: TCP探测的序列号，用于校验回应的确认号
+
+        Returns:
+            tuple: (解码后的回应或None, 发送时间, 回应的接收时间或None)
+        """
+        waiter = Waiter(seq)
+        with self.lock:
+            self.waiters[key] = waiter
+        try:
+            sent = time.time()
+            self.send_sock.sendto(packet, (key[1], 0))
+            waiter.event.wait(timeout)
+        finally:
+            with self.lock:
+                if self.waiters.get(key) is waiter:
+                    del self.waiters[key]
+        return waiter.reply, sent, waiter.time
+
+    def send(self, packet, destination):
+        """只发送，不等待回应（例如关闭半开连接的RST）"""
+        self.send_sock.sendto(packet, (destination, 0))
+
+    def handle(self, packet, timestamp):
+        reply = decode(packet)
+        if reply is None:
+            return
+        kind = reply[0]
+        if kind == "icmp":
+            # ICMP差错引用的原数据包: (协议, 目的地址, 源端口, 目的端口)
+            protocol = {socket.IPPROTO_TCP: "tcp", socket.IPPROTO_UDP: "udp"}.get(reply[4])
+            if protocol is None:
+                return
+            key = (protocol, reply[5], reply[7], reply[6])
+        else:
+            key = (kind, reply[1], reply[2], reply[3])
+        with self.lock:
+            waiter = self.waiters.get(key)
+        if waiter is None or waiter.reply is not None:
+            return
+        if kind == "tcp" and not tcp_answers(reply, waiter.seq):
+            return
+        waiter.time = timestamp
+        waiter.reply = reply
+        waiter.event.set()
+
+
+_exchange = None
+_exchange_lock = threading.Lock()
+
+
+def raw_exchange(udp_ports):
+    """进程内共享的RawExchange，第一次使用时创建（需要root权限）"""
+    global _exchange
+    with _exchange_lock:
+        if _exchange is None:
+            _exchange = RawExchange(random.randint(40000, 60000), udp_ports)
+        return _exchange
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+def format_eta(seconds):
+    """把剩余秒数格式化为 时:分:秒"""
+    if seconds is None:
+        return "未知"
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressTracker:
+    """统计已完成的探测数，并按固定间隔回调 (done, total, rate, eta)
+
+    rate为最近一段时间内每秒完成的探测数（指数平滑），
+    eta为按当前速率估计的剩余秒数，无法估计时为None。
+    回调在独立的线程中触发，扫描线程只需要调用advance()。
+    """
+
+    # 速率平滑系数
+    SMOOTHING = 0.3
+
+    def __init__(self, total, callback=None, interval=1.0):
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.done = 0
+        self.rate = 0.0
+        self.start_time = time.monotonic()
+        self.last_time = self.start_time
+        self.last_done = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def advance(self, count=1):
+        """记录完成的探测"""
+        with self.lock:
+            self.done += count
+
+    def snapshot(self):
+        """返回 (done, total, rate, eta)"""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last_time
+            if elapsed > 0:
+                current = (self.done - self.last_done) / elapsed
+                if self.last_done == 0 and self.rate == 0:
+                    self.rate = current
+                else:
+                    self.rate = self.SMOOTHING * current + (1 - self.SMOOTHING) * self.rate
+                self.last_time = now
+                self.last_done = self.done
+            remaining = max(0, self.total - self.done)
+            eta = remaining / self.rate if self.rate > 0 else None
+            return self.done, self.total, self.rate, eta
+
+    def start(self):
+        """启动定时回调线程"""
+        if self.callback is None or self.interval <= 0:
+            return
+        self.thread = threading.Thread(target=self.report_loop, daemon=True)
+        self.thread.start()
+
+    def report_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.callback(*self.snapshot())
+
+    def stop(self):
+        """停止定时回调，并输出最后一次进度"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+            self.callback(*self.snapshot())
@@ -4,19 +4,108 @@
 import argparse
 import sys
 from scanner import PortScanner
+from timing import TIMING_PROFILES, get_timing_profile
+from progress import format_eta
+from targets import parse_shard
+from output import ScanOutput, JsonLinesWriter, GrepableWriter, XmlWriter, format_port_ranges
+from checkpoint import SECRET_SETTINGS, ScanCheckpoint
+from telemetry import ScanStats, MetricsServer, format_stats
+from services import format_service
+from history import ScanHistory, format_change
 
 def parse_arguments():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='端口扫描工具')
-    parser.add_argument('target', nargs='?', help='目标IP地址')
+    parser.add_argument('target', nargs='?', help='目标IP地址、域名、CIDR网段或IP范围，多个目标用逗号分隔')
     parser.add_argument('-p', dest='ports', help='指定端口范围 (例如: 22,80,443 或 1-1000)')
     parser.add_argument('-sS', action='store_true', help='执行TCP SYN扫描')
     parser.add_argument('-sT', action='store_true', help='执行TCP Connect扫描')
     parser.add_argument('-sU', action='store_true', help='执行UDP扫描')
+    parser.add_argument('-sn', action='store_true', help='只进行主机发现，不扫描端口')
+    parser.add_argument('-sV', dest='service_detection', action='store_true',
+                       help='识别开放端口上运行的服务和版本（与端口扫描并行，仅TCP扫描）')
+    parser.add_argument('--service-concurrency', dest='service_concurrency', type=int, default=32,
+                       help='同时进行服务识别的端口数 (默认: 32, 范围: 1-1000)')
+    parser.add_argument('--service-timeout', dest='service_timeout', type=float, default=3.0,
+                       help='服务识别每次连接和等待回应的超时秒数 (默认: 3)')
+    parser.add_argument('-Pn', action='store_true', help='跳过主机发现，将所有目标视为存活')
+    parser.add_argument('-r', dest='sequential', action='store_true', help='按顺序扫描目标和端口（默认随机顺序）')
     parser.add_argument('-iL', dest='input_file', help='从文件读取目标列表')
+    parser.add_argument('--resolve-concurrency', dest='resolve_concurrency', type=int, default=64,
+                       help='扫描开始前同时解析的域名数 (默认: 64)')
+    parser.add_argument('--dns-cache', dest='dns_cache',
+                       help='DNS缓存文件，按记录的TTL在多次运行之间复用解析结果')
     parser.add_argument('-oN', dest='output_file', help='将结果写入文件')
+    parser.add_argument('-oJ', dest='json_file', help='扫描过程中以JSON Lines格式流式写入结果')
+    parser.add_argument('-oG', dest='grepable_file', help='扫描过程中以grepable格式流式写入结果（兼容nmap -oG）')
+    parser.add_argument('-oX', dest='xml_file', help='扫描过程中以XML格式流式写入结果（兼容nmap -oX）')
     parser.add_argument('-t', '--threads', dest='threads', type=int, default=20, 
                        help='设置并发线程数 (默认: 20, 范围: 1-500)')
+    parser.add_argument('--engine', dest='engine', choices=['thread', 'async', 'batch'], default='thread',
+                       help='扫描引擎: thread 线程池, async 异步连接 (仅-sT), batch 批量SYN (仅-sS), 默认: thread')
+    parser.add_argument('--concurrency', dest='concurrency', type=int, default=5000,
+                       help='async引擎的并发连接数 (默认: 5000, 范围: 1-20000)')
+    parser.add_argument('--max-hosts', dest='max_hosts', type=int, default=16,
+                       help='同时扫描的目标数上限 (默认: 16)')
+    parser.add_argument('--max-host-probes', dest='max_host_probes', type=int,
+                       help='每个目标同时执行的探测数上限 (默认: 等于线程数)')
+    parser.add_argument('--min-rate', dest='min_rate', type=float,
+                       help='最小发包速率（包/秒），拥塞降速不会低于该值')
+    parser.add_argument('--max-rate', dest='max_rate', type=float,
+                       help='最大发包速率（包/秒），不设置则不限速')
+    parser.add_argument('--progress-interval', dest='progress_interval', type=float, default=5,
+                       help='输出扫描进度的间隔秒数，0表示不输出 (默认: 5)')
+    parser.add_argument('--stats-interval', dest='stats_interval', type=float, default=0,
+                       help='输出探测计数、发包速率和RTT等统计信息的间隔秒数，0表示只在结束时写入输出文件 (默认: 0)')
+    parser.add_argument('--metrics-port', dest='metrics_port', type=int,
+                       help='在127.0.0.1的指定端口上提供Prometheus格式的 /metrics 接口')
+    parser.add_argument('--timing', dest='timing', default='normal',
+                       help=f'时间模板，决定超时估计和重传次数: {", ".join(TIMING_PROFILES)} 或 0-5 (默认: normal)')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+                       help='工作进程数，大于1时把扫描分片到多个进程中并行执行 (默认: 1)')
+    parser.add_argument('--shard', dest='shard',
+                       help='只扫描整个任务的第i个分片 (格式: i/N)，用于把任务分给多次运行或多台机器')
+    parser.add_argument('--seed', dest='seed', type=int,
+                       help='随机扫描顺序的种子，相同的种子得到相同的顺序（默认随机生成）')
+    parser.add_argument('--checkpoint', dest='checkpoint', help='定期把扫描进度保存到检查点文件')
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=float, default=10,
+                       help='保存检查点的间隔秒数 (默认: 10)')
+    parser.add_argument('--resume', dest='resume',
+                       help='从检查点文件恢复中断的扫描，沿用上次的参数（忽略其他参数）')
+    parser.add_argument('--history', dest='history',
+                       help='把扫描结果记录到SQLite历史数据库，报告与上次扫描相比新开放和不再开放的端口')
+    parser.add_argument('--delta', dest='delta', action='store_true',
+                       help='增量扫描（需要 --history）: 只扫描已知开放、最近变化过的端口和其余端口中的一片，只输出变化')
+    parser.add_argument('--delta-slices', dest='delta_slices', type=int, default=8,
+                       help='增量扫描时其余端口分成的片数，每次运行轮流扫描其中一片 (默认: 8)')
+    parser.add_argument('--daemon', dest='daemon', action='store_true',
+                       help='以守护进程方式运行，通过本机的HTTP接口接收扫描任务')
+    parser.add_argument('--listen', dest='listen', default='127.0.0.1:8642',
+                       help='守护进程的HTTP接口监听地址 (默认: 127.0.0.1:8642)')
+    parser.add_argument('--socket', dest='socket_path',
+                       help='守护进程改为监听Unix套接字（只允许当前用户访问）')
+    parser.add_argument('--max-jobs', dest='max_jobs', type=int, default=4,
+                       help='守护进程同时运行的扫描任务数 (默认: 4)')
+    parser.add_argument('--history-dir', dest='history_dir',
+                       help='守护进程中任务的历史数据库目录，任务的history参数为该目录中的文件名')
+    parser.add_argument('--api-token', dest='api_token',
+                       help='守护进程接口的令牌，请求需要带有 Authorization: Bearer <令牌>')
+    parser.add_argument('--coordinator', dest='coordinator',
+                       help='作为分布式扫描的协调节点监听指定地址 (host:port)，把任务分给连接的工作节点')
+    parser.add_argument('--units', dest='units', type=int, default=64,
+                       help='分布式扫描的工作单元数 (默认: 64)')
+    parser.add_argument('--lease-timeout', dest='lease_timeout', type=float, default=30,
+                       help='工作节点超过该秒数没有消息时，把它的工作单元重新分配 (默认: 30)')
+    parser.add_argument('--worker', dest='worker',
+                       help='作为分布式扫描的工作节点连接协调节点 (host:port)，扫描参数由协调节点下发')
+    parser.add_argument('--cluster-token', dest='cluster_token',
+                       help='协调节点和工作节点之间的共享令牌，工作节点连接时需要提供')
+    parser.add_argument('--trace', dest='trace_file',
+                       help='把每个探测各阶段的时间线写入Chrome trace格式的文件（可用Perfetto打开）')
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                       help='扫描结束时输出按阶段和探测函数汇总的耗时')
+    # 检查点中记录增量扫描规划后的端口，恢复时不再重新规划
+    parser.set_defaults(delta_planned=False)
     return parser.parse_args()
 
 # 回调函数用于命令行输出
@@ -28,10 +117,67 @@ def result_callback(port, status):
     """结果回调函数"""
     print(f"端口 {port}: {status}")
 
+def progress_update_callback(done, total, rate, eta):
+    """进度统计回调函数"""
+    percent = done / total * 100 if total else 100
+    print(f"进度: {done}/{total} ({percent:.1f}%)，速率 {rate:.0f} 个探测/秒，预计剩余 {format_eta(eta)}")
+
+def service_callback(target, port, service):
+    """服务识别结果回调函数"""
+    print(f"服务 {target}:{port}: {format_service(service)}")
+
+def change_callback(target, changes):
+    """端口变化回调函数"""
+    for change in changes:
+        print(f"变化 {format_change(target, change)}")
+
+def stats_callback(stats):
+    """统计信息回调函数"""
+    print(format_stats(stats))
+
 def summary_callback(message):
     """摘要回调函数"""
     print(f"\n{message}")
 
+def run_daemon(args):
+    """运行扫描守护进程，直到收到Ctrl-C"""
+    from daemon import ScanDaemon, create_server
+    
+    if args.max_jobs < 1 or args.max_jobs > 64:
+        print("错误: 同时运行的任务数必须在1-64之间")
+        sys.exit(1)
+    try:
+        daemon = ScanDaemon(args.max_jobs, args.min_rate, args.max_rate, history_dir=args.history_dir)
+        server = create_server(daemon, args.listen, args.socket_path, args.api_token)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    daemon.start()
+    print(f"扫描守护进程已启动: {args.socket_path or 'http://' + args.listen}，同时运行 {args.max_jobs} 个任务")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止守护进程...")
+    finally:
+        daemon.stop()
+        server.server_close()
+
+def run_cluster_worker(args):
+    """运行分布式扫描的工作节点，直到协调节点结束任务"""
+    from cluster import ClusterWorker
+    
+    worker = ClusterWorker(args.worker, args.cluster_token, progress_callback)
+    try:
+        units = worker.run()
+    except KeyboardInterrupt:
+        print("\n工作节点被用户中断")
+        worker.stop()
+        return
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print(f"\n任务结束，本节点完成了 {units} 个工作单元")
+
 def main():
     # 检查是否没有提供任何参数，如果没有则启动GUI
     if len(sys.argv) == 1:
@@ -54,11 +200,119 @@ def main():
     
     args = parse_arguments()
     
+    # 恢复扫描时使用检查点中保存的参数
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint = ScanCheckpoint.load(args.resume)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        if checkpoint.finished:
+            print(f"检查点 {args.resume} 中的扫描已经完成")
+            return
+        # 检查点中不保存令牌，沿用本次命令行中的令牌
+        secrets = {key: getattr(args, key) for key in SECRET_SETTINGS}
+        args = argparse.Namespace(**{**checkpoint.settings, **secrets})
+        checkpoint.interval = args.checkpoint_interval
+        print(f"从检查点 {checkpoint.file_path} 恢复扫描，使用上次的参数")
+    elif args.checkpoint:
+        if args.sn:
+            print("错误: 只进行主机发现 (-sn) 时不支持检查点")
+            sys.exit(1)
+        if args.checkpoint_interval <= 0:
+            print("错误: 检查点间隔必须大于0")
+            sys.exit(1)
+        checkpoint = ScanCheckpoint(args.checkpoint, vars(args), args.checkpoint_interval)
+    
     # 验证线程数范围
     if args.threads < 1 or args.threads > 500:
         print("错误: 线程数必须在1-500之间")
         sys.exit(1)
     
+    # 验证并发连接数范围
+    if args.concurrency < 1 or args.concurrency > 20000:
+        print("错误: 并发连接数必须在1-20000之间")
+        sys.exit(1)
+    
+    if args.max_hosts < 1 or (args.max_host_probes is not None and args.max_host_probes < 1):
+        print("错误: 目标数和探测数上限必须大于0")
+        sys.exit(1)
+    
+    # 验证发包速率
+    if (args.min_rate is not None and args.min_rate <= 0) or (args.max_rate is not None and args.max_rate <= 0):
+        print("错误: 发包速率必须大于0")
+        sys.exit(1)
+    if args.min_rate is not None and args.max_rate is not None and args.min_rate > args.max_rate:
+        print("错误: --min-rate 不能大于 --max-rate")
+        sys.exit(1)
+    
+    if args.workers < 1 or args.workers > 256:
+        print("错误: 工作进程数必须在1-256之间")
+        sys.exit(1)
+    
+    if args.service_concurrency < 1 or args.service_concurrency > 1000:
+        print("错误: 服务识别并发数必须在1-1000之间")
+        sys.exit(1)
+    if args.service_timeout <= 0:
+        print("错误: 服务识别超时必须大于0")
+        sys.exit(1)
+    
+    if args.delta and not args.history:
+        print("错误: 增量扫描 (--delta) 需要使用 --history 指定历史数据库")
+        sys.exit(1)
+    if args.delta_slices < 1 or args.delta_slices > 1000:
+        print("错误: 增量扫描的分片数必须在1-1000之间")
+        sys.exit(1)
+    
+    if args.resolve_concurrency < 1 or args.resolve_concurrency > 1000:
+        print("错误: 域名解析并发数必须在1-1000之间")
+        sys.exit(1)
+    
+    if args.metrics_port is not None and not 1 <= args.metrics_port <= 65535:
+        print("错误: 指标接口端口必须在1-65535之间")
+        sys.exit(1)
+    
+    if args.units < 1 or args.units > 100000:
+        print("错误: 工作单元数必须在1-100000之间")
+        sys.exit(1)
+    if args.lease_timeout < 1:
+        print("错误: 租约超时必须不小于1秒")
+        sys.exit(1)
+    if args.coordinator and args.workers > 1:
+        print("错误: --coordinator 与 --workers 不能同时使用，工作节点各自执行扫描")
+        sys.exit(1)
+    if (args.trace_file or args.profile) and (args.workers > 1 or args.coordinator):
+        print("错误: --trace 和 --profile 只记录本进程中的探测，不能与 --workers 或 --coordinator 同时使用")
+        sys.exit(1)
+    
+    if args.daemon:
+        run_daemon(args)
+        return
+    
+    if args.worker:
+        run_cluster_worker(args)
+        return
+    
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        # 各分片必须使用相同的扫描顺序，否则分片之间会重叠
+        if args.seed is None and not args.sequential:
+            print("错误: 使用 --shard 时需要用 --seed 为所有分片指定相同的种子")
+            sys.exit(1)
+    
+    # 验证时间模板
+    try:
+        timing = get_timing_profile(args.timing)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    
     # 创建扫描器实例
     scanner = PortScanner()
     
@@ -69,6 +323,16 @@ def main():
     elif args.sU:
         scan_type = "UDP"
     
+    if args.engine == "async" and scan_type != "TCP":
+        print("错误: async引擎仅支持TCP Connect扫描 (-sT)")
+        sys.exit(1)
+    if args.engine == "batch" and scan_type != "SYN":
+        print("错误: batch引擎仅支持TCP SYN扫描 (-sS)")
+        sys.exit(1)
+    if args.service_detection and scan_type == "UDP":
+        print("错误: 服务识别 (-sV) 仅支持TCP扫描")
+        sys.exit(1)
+    
     # 解析端口范围
     try:
         ports = scanner.parse_port_range(args.ports)
@@ -85,26 +349,142 @@ def main():
             print(f"读取输入文件时出错: {e}")
             sys.exit(1)
     elif args.target:
-        targets = [args.target]
+        try:
+            targets = scanner.parse_targets(args.target)
+        except Exception as e:
+            print(f"目标解析错误: {e}")
+            sys.exit(1)
     else:
         print("错误: 未指定目标。使用 -h 查看帮助信息。")
         sys.exit(1)
     
-    print(f"开始扫描 {len(targets)} 个目标，{len(ports)} 个端口（使用 {args.threads} 个线程）")
+    if args.sn and args.Pn:
+        print("错误: -sn 与 -Pn 不能同时使用")
+        sys.exit(1)
+    
+    # 只进行主机发现
+    if args.sn:
+        try:
+            alive = scanner.discover_hosts(targets, progress_callback)
+        except KeyboardInterrupt:
+            print("\n\n主机发现被用户中断")
+            sys.exit(0)
+        except Exception as e:
+            print(f"主机发现过程中发生错误: {e}")
+            sys.exit(1)
+        
+        for host in alive:
+            print(f"主机 {host} 存活")
+        if args.output_file:
+            try:
+                scanner.save_hosts_to_file(alive, args.output_file)
+                print(f"\n结果已保存到文件: {args.output_file}")
+            except Exception as e:
+                print(f"写入输出文件时出错: {e}")
+        print(f"\n主机发现完成！共 {len(alive)}/{len(targets)} 个目标存活")
+        return
+    
+    # 扫描历史和增量扫描
+    history = None
+    if args.history:
+        try:
+            history = ScanHistory(args.history, " ".join(sys.argv))
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+    if args.delta and not args.delta_planned:
+        ports, plan = history.plan_delta(ports, "udp" if scan_type == "UDP" else "tcp", args.delta_slices)
+        print(f"增量扫描: 已知开放或最近变化的端口 {plan['priority']} 个，"
+              f"其余端口第 {plan['slice'] + 1}/{plan['slices']} 片 {plan['tail']} 个")
+        if not ports:
+            print("没有需要扫描的端口")
+            return
+        if checkpoint is not None:
+            checkpoint.settings.update(ports=format_port_ranges(ports), delta_planned=True)
+        ports = scanner.parse_port_range(format_port_ranges(ports))
+    
+    if args.engine == "async":
+        print(f"开始扫描 {len(targets)} 个目标，{len(ports)} 个端口（异步引擎，{args.concurrency} 个并发连接）")
+    elif args.engine == "batch":
+        print(f"开始扫描 {len(targets)} 个目标，{len(ports)} 个端口（批量SYN引擎）")
+    else:
+        print(f"开始扫描 {len(targets)} 个目标，{len(ports)} 个端口（使用 {args.threads} 个线程）")
+    
+    # 流式输出
+    output = None
+    writer_classes = [(args.json_file, JsonLinesWriter), (args.grepable_file, GrepableWriter),
+                      (args.xml_file, XmlWriter)]
+    if any(path for path, _ in writer_classes):
+        try:
+            # 恢复扫描时追加到上次的输出文件
+            append = checkpoint is not None and checkpoint.resumed
+            output = ScanOutput([cls(path, append=append) for path, cls in writer_classes if path],
+                                " ".join(sys.argv))
+        except Exception as e:
+            print(f"打开输出文件时出错: {e}")
+            sys.exit(1)
+    
+    # 扫描统计和指标接口
+    stats = ScanStats()
+    metrics_server = None
+    if args.metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(stats, args.metrics_port)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        metrics_server.start()
+        print(f"指标接口: http://127.0.0.1:{args.metrics_port}/metrics")
+    
+    # 时间线跟踪和性能剖析
+    tracer = None
+    if args.trace_file or args.profile:
+        from tracing import ScanTracer
+        try:
+            tracer = ScanTracer(args.trace_file, args.profile)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
     
     # 执行扫描
     try:
+        # 增量扫描只输出变化
         scan_results = scanner.scan_multiple_targets(
-            targets, ports, scan_type, args.threads,
-            progress_callback, result_callback, summary_callback
+            targets, ports, scan_type, args.threads, progress_callback,
+            None if args.delta else result_callback, None if args.delta else summary_callback,
+            engine=args.engine, concurrency=args.concurrency,
+            max_hosts=args.max_hosts, max_host_probes=args.max_host_probes,
+            timing=timing, min_rate=args.min_rate, max_rate=args.max_rate,
+            host_discovery=not args.Pn, randomize=not args.sequential, seed=args.seed,
+            progress_update_callback=progress_update_callback if args.progress_interval > 0 else None,
+            progress_interval=args.progress_interval, output=output, checkpoint=checkpoint,
+            workers=args.workers, shard=shard, stats=stats,
+            stats_callback=stats_callback if args.stats_interval > 0 else None,
+            stats_interval=args.stats_interval,
+            service_detection=args.service_detection, service_concurrency=args.service_concurrency,
+            service_timeout=args.service_timeout,
+            service_callback=None if args.delta else service_callback,
+            history=history, change_callback=change_callback if history is not None else None,
+            resolve_concurrency=args.resolve_concurrency, dns_cache=args.dns_cache,
+            coordinator=args.coordinator, cluster_units=args.units, lease_timeout=args.lease_timeout,
+            cluster_token=args.cluster_token, tracer=tracer
         )
     except KeyboardInterrupt:
         print("\n\n扫描被用户中断")
         scanner.stop_scan()
+        if checkpoint is not None:
+            print(f"可以使用 --resume {checkpoint.file_path} 继续扫描")
         sys.exit(0)
     except Exception as e:
         print(f"扫描过程中发生错误: {e}")
         sys.exit(1)
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        if history is not None:
+            history.close()
+        if tracer is not None:
+            tracer.close()
     
     # 输出结果到文件
     if args.output_file:
@@ -117,6 +497,16 @@ def main():
     print(f"\n扫描完成！")
     total_open_ports = sum(len(ports) for ports in scan_results.values())
     print(f"共发现 {total_open_ports} 个开放端口")
+    if history is not None:
+        total_changes = sum(len(changes) for changes in scanner.changes.values())
+        print(f"与上次扫描相比共 {total_changes} 个端口变化")
+    if tracer is not None:
+        if args.trace_file:
+            print(f"跟踪记录已写入: {args.trace_file}")
+        if args.profile:
+            print()
+            for line in tracer.report():
+                print(line)
 
 if __name__ == "__main__":
     try:
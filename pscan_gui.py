@@ -8,11 +8,48 @@ import threading
 import queue
 import time
 from scanner import PortScanner
+from timing import TIMING_PROFILES
+from progress import format_eta
+from result_table import ResultModel, VirtualTable
+from services import service_name
+
+# 界面刷新间隔（毫秒），每次刷新把积压的消息合并成一次界面更新
+FRAME_INTERVAL = 50
+# 结果队列的容量，界面处理不过来时扫描线程在入队时等待
+RESULT_QUEUE_SIZE = 10000
+# 每次刷新最多处理的消息数，避免一次刷新占用过长时间
+MAX_BATCH = 5000
+# 日志区域保留的最大行数
+MAX_LOG_LINES = 1000
 
 # 设置CustomTkinter主题
 ctk.set_appearance_mode("dark")  # 或 "light"
 ctk.set_default_color_theme("blue")  # 或 "green", "dark-blue"
 
+class GuiOutput:
+    """作为扫描的输出对象（与ScanOutput接口相同），把开放端口交给界面的结果队列"""
+
+    def __init__(self, put):
+        self.put = put
+        self.protocol = "tcp"
+
+    def start(self, scan_type, ports, results=None):
+        self.protocol = "udp" if scan_type == "UDP" else "tcp"
+
+    def port_result(self, target, port, status, elapsed=None):
+        if status.is_open:
+            self.put(('result', (target, port, str(status), service_name(port, self.protocol))))
+
+    def host_done(self, target, open_ports, timing=None, rtt_histogram=None):
+        pass
+
+    def stats(self, stats):
+        pass
+
+    def finish(self):
+        pass
+
+
 class PortScannerGUI:
     def __init__(self):
         self.window = ctk.CTk()
@@ -27,12 +64,17 @@ class PortScannerGUI:
         
         # GUI控制变量
         self.scan_thread = None
-        self.result_queue = queue.Queue()
+        # 有界队列：结果过多时扫描线程等待界面处理，内存不会无限增长
+        self.result_queue = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+        # 进度只保留最新的一次，由界面刷新时读取
+        self.latest_progress = None
+        self.shown_progress = None
+        self.result_model = ResultModel()
         
         self.setup_ui()
         
         # 启动结果更新线程
-        self.window.after(100, self.check_result_queue)
+        self.window.after(FRAME_INTERVAL, self.check_result_queue)
     
     def setup_ui(self):
         # 创建主滚动框架
@@ -55,7 +97,7 @@ class PortScannerGUI:
         target_label.pack(pady=(15, 5))
         
         # 目标输入
-        self.target_entry = ctk.CTkEntry(target_frame, placeholder_text="输入IP地址或域名，如: 192.168.1.1 或 google.com", width=400)
+        self.target_entry = ctk.CTkEntry(target_frame, placeholder_text="输入IP地址、域名或网段，如: 192.168.1.1、google.com 或 192.168.1.0/24", width=400)
         self.target_entry.pack(pady=(0, 10))
         
         # 文件选择按钮
@@ -122,6 +164,17 @@ class PortScannerGUI:
         
         thread_slider.configure(command=self.update_thread_label)
         
+        # 时间模板
+        timing_frame = ctk.CTkFrame(settings_frame)
+        timing_frame.pack(fill="x", padx=15, pady=(0, 15))
+        
+        timing_label = ctk.CTkLabel(timing_frame, text="时间模板:")
+        timing_label.pack(side="left", padx=(10, 10))
+        
+        self.timing_var = ctk.StringVar(value="normal")
+        timing_menu = ctk.CTkOptionMenu(timing_frame, values=list(TIMING_PROFILES), variable=self.timing_var, width=150)
+        timing_menu.pack(side="left")
+        
         # 控制按钮
         control_frame = ctk.CTkFrame(main_frame)
         control_frame.pack(fill="x", padx=20, pady=(0, 20))
@@ -154,8 +207,12 @@ class PortScannerGUI:
         result_label = ctk.CTkLabel(result_frame, text="扫描结果", font=ctk.CTkFont(size=16, weight="bold"))
         result_label.pack(pady=(15, 10))
         
-        # 结果文本框 - 设置合适的固定高度
-        self.result_text = ctk.CTkTextbox(result_frame, height=300, font=ctk.CTkFont(family="Courier"))
+        # 结果表格 - 只渲染可见的行，点击表头排序
+        self.result_table = VirtualTable(result_frame, self.result_model)
+        self.result_table.pack(fill="x", padx=15, pady=(0, 10))
+        
+        # 日志文本框 - 显示状态和每个目标的摘要
+        self.result_text = ctk.CTkTextbox(result_frame, height=150, font=ctk.CTkFont(family="Courier"))
         self.result_text.pack(fill="x", padx=15, pady=(0, 15))
         
         # 添加结果操作按钮
@@ -191,20 +248,23 @@ class PortScannerGUI:
         """进度回调函数"""
         self.result_queue.put(('status', message))
     
-    def result_callback(self, port, status):
-        """结果回调函数"""
-        self.result_queue.put(('result', f"端口 {port}: {status}"))
+    def progress_update_callback(self, done, total, rate, eta):
+        """进度统计回调函数"""
+        # 只记录最新的进度，不占用结果队列
+        self.latest_progress = (done, total, rate, eta)
     
-    def scan_worker(self, targets, ports, scan_type, threads):
+    def scan_worker(self, targets, ports, scan_type, threads, timing):
         """扫描工作函数"""
         try:
             def summary_callback(message):
                 self.result_queue.put(('summary', message))
             
-            # 使用扫描器执行扫描
+            # 开放端口通过输出对象带上目标地址进入结果表格
             results = self.scanner.scan_multiple_targets(
                 targets, ports, scan_type, threads,
-                self.progress_callback, self.result_callback, summary_callback
+                self.progress_callback, None, summary_callback,
+                timing=timing, progress_update_callback=self.progress_update_callback,
+                progress_interval=0.5, output=GuiOutput(self.result_queue.put)
             )
             
             self.result_queue.put(('complete', '扫描完成！'))
@@ -228,7 +288,11 @@ class PortScannerGUI:
             if not target:
                 messagebox.showerror("错误", "请输入目标地址或选择目标文件")
                 return
-            targets = [target]
+            try:
+                targets = self.scanner.parse_targets(target)
+            except Exception as e:
+                messagebox.showerror("错误", f"目标格式错误: {e}")
+                return
         
         # 解析端口
         try:
@@ -240,6 +304,7 @@ class PortScannerGUI:
         # 获取设置
         scan_type = self.scan_type_var.get()
         threads = self.thread_var.get()
+        timing = self.timing_var.get()
         
         # 检查权限
         if scan_type in ["SYN", "UDP"]:
@@ -252,12 +317,15 @@ class PortScannerGUI:
         self.scan_button.configure(state="disabled")
         self.stop_button.configure(state="normal")
         self.result_text.delete("1.0", "end")
+        self.result_model.clear()
+        self.result_table.refresh()
+        self.latest_progress = None
         self.progress_bar.set(0)
         
         # 启动扫描线程
         self.scan_thread = threading.Thread(
             target=self.scan_worker,
-            args=(targets, ports, scan_type, threads)
+            args=(targets, ports, scan_type, threads, timing)
         )
         self.scan_thread.daemon = True
         self.scan_thread.start()
@@ -271,11 +339,16 @@ class PortScannerGUI:
     def clear_results(self):
         """清空扫描结果"""
         self.result_text.delete("1.0", "end")
+        self.result_model.clear()
+        self.result_table.refresh()
         self.status_label.configure(text="结果已清空")
     
     def copy_results(self):
         """复制结果到剪贴板"""
-        content = self.result_text.get("1.0", "end-1c")
+        if not len(self.result_model):
+            messagebox.showwarning("警告", "没有结果可复制")
+            return
+        content = self.result_model.to_text()
         if not content.strip():
             messagebox.showwarning("警告", "没有结果可复制")
             return
@@ -287,18 +360,10 @@ class PortScannerGUI:
         except Exception as e:
             messagebox.showerror("错误", f"复制失败: {e}")
     
-    def scroll_to_bottom(self):
-        """滚动到结果区域底部"""
-        try:
-            # 确保滚动到文本框底部
-            self.result_text.see("end")
-            # 更新界面
-            self.window.update_idletasks()
-        except Exception:
-            pass
-    
     def save_results(self):
-        content = self.result_text.get("1.0", "end-1c")
+        # 结果表格之后附上日志中的各目标摘要
+        content = self.result_model.to_text() if len(self.result_model) else ""
+        content += self.result_text.get("1.0", "end-1c")
         if not content.strip():
             messagebox.showwarning("警告", "没有结果可保存")
             return
@@ -318,40 +383,61 @@ class PortScannerGUI:
                 messagebox.showerror("错误", f"保存失败: {e}")
     
     def check_result_queue(self):
-        """检查结果队列并更新界面"""
+        """检查结果队列并更新界面
+        
+        每次刷新取出积压的消息，结果一次性加入表格，日志一次性插入文本框，
+        状态和进度只显示最新的一条，界面每帧只更新一次。
+        """
+        rows = []
+        log_lines = []
+        status = None
+        finished = None
         try:
-            while True:
+            for _ in range(MAX_BATCH):
                 msg_type, msg_data = self.result_queue.get_nowait()
                 
                 if msg_type == 'status':
-                    self.status_label.configure(text=msg_data)
+                    status = msg_data
                 elif msg_type == 'result':
-                    self.result_text.insert("end", msg_data + "\n")
-                    self.result_text.see("end")
-                    # 自动滚动到最新结果
-                    self.scroll_to_bottom()
+                    rows.append(msg_data)
                 elif msg_type == 'summary':
-                    self.result_text.insert("end", "\n" + msg_data + "\n" + "="*50 + "\n")
-                    self.result_text.see("end")
-                    self.scroll_to_bottom()
-                elif msg_type == 'progress':
-                    self.progress_bar.set(msg_data)
-                elif msg_type == 'complete':
-                    self.status_label.configure(text=msg_data)
-                    self.scan_button.configure(state="normal")
-                    self.stop_button.configure(state="disabled")
-                    self.scanner.is_scanning = False
-                elif msg_type == 'error':
-                    self.status_label.configure(text=msg_data)
-                    self.scan_button.configure(state="normal")
-                    self.stop_button.configure(state="disabled")
-                    self.scanner.is_scanning = False
+                    log_lines.append("\n" + msg_data + "\n" + "="*50)
+                elif msg_type in ('complete', 'error'):
+                    finished = msg_data
                     
         except queue.Empty:
             pass
         
+        if rows:
+            self.result_model.add(rows)
+            self.result_table.refresh()
+        if log_lines:
+            self.result_text.insert("end", "\n".join(log_lines) + "\n")
+            # 只保留最近的日志，避免文本框无限增长
+            excess = int(self.result_text.index("end-1c").split(".")[0]) - MAX_LOG_LINES
+            if excess > 0:
+                self.result_text.delete("1.0", f"{excess + 1}.0")
+            self.result_text.see("end")
+        
+        progress = self.latest_progress
+        if progress is not None and progress is not self.shown_progress and self.scanner.is_scanning:
+            self.shown_progress = progress
+            done, total, rate, eta = progress
+            self.progress_bar.set(done / total if total else 1.0)
+            status = f"已完成 {done}/{total}，速率 {rate:.0f} 个探测/秒，预计剩余 {format_eta(eta)}"
+        if finished is not None:
+            status = finished
+            if progress is not None:
+                done, total, _, _ = progress
+                self.progress_bar.set(done / total if total else 1.0)
+            self.scan_button.configure(state="normal")
+            self.stop_button.configure(state="disabled")
+            self.scanner.is_scanning = False
+        if status is not None:
+            self.status_label.configure(text=status)
+        
         # 继续检查队列
-        self.window.after(100, self.check_result_queue)
+        self.window.after(FRAME_INTERVAL, self.check_result_queue)
     
     def run(self):
         self.window.mainloop()
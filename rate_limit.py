@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class RateController:
+    """令牌桶发包速率控制，所有扫描函数共享
+
+    速率在min_rate和max_rate之间（包/秒）自适应调整：每个统计窗口内
+    统计重传后才收到回应的探测（说明发生了丢包）和超时的比例，
+    比例过高时速率减半，回应正常时按加性方式逐步提速。
+    目标本身无回应（过滤端口）不计为丢包，避免被防火墙拖慢整个扫描。
+    """
+
+    # 丢包率超过该值时降速
+    DROP_THRESHOLD = 0.1
+    # 设置了max_rate时，每个正常窗口提速max_rate的该比例（加性增）
+    INCREASE_RATIO = 0.1
+    # 未设置max_rate时，每个正常窗口按该比例提速（乘性增）
+    RECOVERY_RATIO = 0.5
+    # 未设置min_rate时，拥塞降速的下限（包/秒）
+    DEFAULT_MIN_RATE = 100.0
+
+    def __init__(self, min_rate=None, max_rate=None, window=1.0):
+        if min_rate is not None and max_rate is not None and min_rate > max_rate:
+            raise Exception("最小发包速率不能大于最大发包速率")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.window = window
+        # None表示不限速，只有在出现丢包后才开始限速
+        self.rate = max_rate
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.window_start = self.last_refill
+        self.sent = 0
+        self.replies = 0
+        self.drops = 0
+        # 因限速累计等待的秒数，用于判断扫描是否受速率限制
+        self.wait_time = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """预约一个发包令牌，返回需要等待的秒数"""
+        with self.lock:
+            self.sent += 1
+            if self.rate is None:
+                return 0
+            now = time.monotonic()
+            # 桶容量约为50毫秒的发包量，允许小幅突发
+            capacity = max(1.0, self.rate / 20)
+            self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            delay = -self.tokens / self.rate
+            self.wait_time += delay
+            return delay
+
+    def acquire(self):
+        """阻塞直到可以发送下一个包"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def report(self, replied, retransmitted=False):
+        """报告一次探测的结果
+
+        Args:
+            replied: 是否收到回应
+            retransmitted: 是否经过重传（重传后才收到回应视为丢包）
+        """
+        with self.lock:
+            if replied:
+                self.replies += 1
+                if retransmitted:
+                    self.drops += 1
+            now = time.monotonic()
+            elapsed = now - self.window_start
+            if elapsed >= self.window:
+                self.adjust(elapsed)
+                self.window_start = now
+                self.sent = self.replies = self.drops = 0
+
+    def adjust(self, elapsed):
+        """根据上一个窗口的丢包情况调整速率"""
+        if not self.replies:
+            return
+        drop_ratio = self.drops / self.replies
+        if drop_ratio > self.DROP_THRESHOLD:
+            current = self.rate if self.rate is not None else self.sent / elapsed
+            floor = self.min_rate if self.min_rate is not None else self.DEFAULT_MIN_RATE
+            if self.max_rate is not None:
+                floor = min(floor, self.max_rate)
+            self.rate = max(floor, current / 2)
+        elif self.rate is not None:
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.INCREASE_RATIO)
+                return
+            self.rate *= 1 + self.RECOVERY_RATIO
+            if self.rate > self.sent / elapsed * 2:
+                # 没有设置上限时，速率远超实际发包量后恢复为不限速
+                self.rate = None
+
+
+class IcmpPacer:
+    """检测目标对ICMP端口不可达的限速，并按检测到的速率发送UDP探测
+
+    Linux等系统默认对每个目标每秒只发送约1个ICMP端口不可达（允许少量突发），
+    超出后关闭的端口不再回应，会被误判为"开放|过滤"。回应过端口不可达的目标
+    再有探测超时时，等待限速恢复后额外重传；额外重传收到了端口不可达，说明之前的
+    回应被限速丢弃了（真正过滤的端口重传后也不会回应）：此后对该目标的探测
+    以MIN_RATE排队发送（限速开始前的突发回应不代表持续的速率）。一个窗口内
+    没有丢弃则提速：排队发送的探测被丢弃之前每个窗口速率加倍，之后逐步提速，
+    排队发送的探测被丢弃时减半（每个窗口最多减半一次，同一时间发出的探测
+    一起被丢弃只算一次）。偶尔的网络丢包也会触发排队，加倍提速使没有
+    限速的目标很快恢复原来的速率。
+    只对触发限速的目标降速，不影响其他目标和全局的发包速率。
+    """
+
+    # 判断提速的时间窗口（秒）
+    WINDOW = 1.0
+    # 检测到限速后对单个目标的初始和最低探测速率（包/秒），与Linux的默认限速相同
+    MIN_RATE = 1.0
+    # 排队发送的探测被丢弃之后，每个没有丢弃的窗口的提速比例
+    INCREASE_RATIO = 0.25
+    # 可能限速的目标的探测在时间模板的重传次数之外可以额外重传的次数
+    EXTRA_RETRIES = 3
+    # 排队的探测重新检查发送间隔的最长等待（秒）
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, target):
+        host = self.hosts.get(target)
+        if host is None:
+            host = self.hosts[target] = {"replied": False, "interval": None, "slow_start": True,
+                                         "last_send": 0.0, "last_change": 0.0, "last_decrease": 0.0}
+        return host
+
+    def limited(self, target):
+        """目标是否已被检测到ICMP限速"""
+        with self.lock:
+            host = self.hosts.get(target)
+            return host is not None and host["interval"] is not None
+
+    def may_be_limited(self, target):
+        """目标回应过端口不可达，之后的超时可能是限速造成的"""
+        with self.lock:
+            host = self.hosts.get(target)
+            return host is not None and host["replied"]
+
+    def acquire(self, target, extra_retry=False):
+        """对限速的目标按检测到的速率排队，阻塞到可以发送为止
+
+        extra_retry为True且尚未检测到限速时，等待一个最低速率的间隔，
+        让目标的ICMP限速有时间恢复。
+
+        Returns:
+            bool: 探测是否经过了限速排队
+        """
+        if extra_retry and not self.limited(target):
+            time.sleep(1 / self.MIN_RATE)
+        while True:
+            with self.lock:
+                host = self.host(target)
+                if host["interval"] is None:
+                    return False
+                now = time.monotonic()
+                # 每次重新按当前间隔计算，排队期间的提速立即生效
+                wait = host["last_send"] + host["interval"] - now
+                if wait <= 0:
+                    host["last_send"] = now
+                    return True
+            time.sleep(min(wait, self.POLL_INTERVAL))
+
+    def icmp_reply(self, target, dropped=False, paced=False):
+        """记录一次收到的ICMP端口不可达
+
+        Args:
+            target: 目标地址
+            dropped: 是否为重传后才收到的回应，即之前的回应被限速丢弃
+            paced: 被丢弃的那次探测是否经过了限速排队
+        """
+        with self.lock:
+            host = self.host(target)
+            now = time.monotonic()
+            host["replied"] = True
+            if dropped and host["interval"] is None:
+                host["interval"] = 1 / self.MIN_RATE
+                host["last_change"] = host["last_decrease"] = now
+            elif dropped and paced:
+                if now - host["last_decrease"] >= self.WINDOW:
+                    host["interval"] = min(1 / self.MIN_RATE, host["interval"] * 2)
+                    host["slow_start"] = False
+                    host["last_change"] = host["last_decrease"] = now
+            elif not dropped and host["interval"] is not None and now - host["last_change"] >= self.WINDOW:
+                host["interval"] /= 2 if host["slow_start"] else 1 + self.INCREASE_RATIO
+                host["last_change"] = now
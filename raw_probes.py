@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 发送原始数据包的探测函数（TCP SYN和UDP扫描），需要root权限。
+# 由扫描器的探测函数注册表在第一次选择这些扫描类型时导入。
+# Linux上数据包由预先构造的模板生成，回应按固定偏移解码，不加载scapy；
+# 其他平台使用 scapy_probes 中的同名函数。
+
+import itertools
+import random
+import time
+from packets import TCP_ACK, TCP_RST, TCP_SYN, raw_exchange
+from rate_limit import IcmpPacer
+from udp_payloads import udp_payload
+from results import PortState
+from resolver import address_of
+from tracing import span
+
+# UDP探测使用的源端口范围，每个探测使用不同的源端口以区分回应
+UDP_SPORT_BASE = 32768
+UDP_SPORT_COUNT = 28232
+UDP_SPORTS = itertools.count(random.randrange(UDP_SPORT_COUNT))
+
+
+def exchange():
+    return raw_exchange((UDP_SPORT_BASE, UDP_SPORT_BASE + UDP_SPORT_COUNT - 1))
+
+
+def tcp_syn_scan(scanner, target, port):
+    """执行TCP SYN扫描"""
+    tracer = scanner.tracer
+    scanner.stats.probe_start()
+    try:
+        address = address_of(target)
+        raw = exchange()
+        template = raw.tcp_template(address)
+        key = ("tcp", address, port, raw.tcp_sport)
+        for attempt in range(scanner.timing.max_retries + 1):
+            if attempt and not scanner.is_scanning:
+                break
+            with span(tracer, "build", "tcp_syn_scan"):
+                seq = random.getrandbits(32)
+                packet = template.fill(template.new_buffer(), port, seq, TCP_SYN)
+            with span(tracer, "rate_wait", "tcp_syn_scan"):
+                scanner.rate_controller.acquire()
+            scanner.stats.sent(attempt > 0)
+            start = time.perf_counter()
+            response, sent_time, reply_time = raw.request(key, packet, scanner.timing.timeout(target, attempt), seq)
+            if tracer is not None:
+                tracer.exchange("tcp_syn_scan", start, time.perf_counter(), sent_time, reply_time)
+            if response is not None:
+                break
+
+        scanner.rate_controller.report(response is not None, attempt > 0)
+        if response is None:
+            scanner.stats.timeout()
+            return port, PortState.FILTERED
+        # 只用首次发送的回应更新RTT，重传的回应无法区分对应哪一次发送 (Karn算法)
+        rtt = None
+        if attempt == 0:
+            rtt = reply_time - sent_time
+            scanner.timing.update(target, rtt)
+        scanner.stats.reply(target, rtt)
+
+        # 引用了SYN的ICMP差错消息不是TCP回应
+        flags = response[6] if response[0] == "tcp" else None
+        if flags == TCP_SYN | TCP_ACK:
+            # 发送RST关闭半开连接，不等待回应
+            with span(tracer, "send_rst", "tcp_syn_scan"):
+                scanner.rate_controller.acquire()
+                raw.send(template.fill(template.new_buffer(), port, response[5], TCP_RST), address)
+            return port, PortState.OPEN
+        elif flags == TCP_RST | TCP_ACK:
+            return port, PortState.CLOSED
+        else:
+            return port, PortState.UNKNOWN
+    except Exception as e:
+        scanner.stats.error(str(e))
+        return port, PortState.ERROR
+    finally:
+        scanner.stats.probe_end()
+
+
+def udp_scan(scanner, target, port):
+    """执行UDP扫描
+
+    常见服务的端口发送协议相关的载荷以得到确定的回应；
+    目标限制ICMP端口不可达的速率时，按检测到的速率对该目标排队发送。
+    """
+    tracer = scanner.tracer
+    scanner.stats.probe_start()
+    try:
+        payload = udp_payload(port)
+        address = address_of(target)
+        raw = exchange()
+        template = raw.udp_template(address)
+        attempt = 0
+        paced = False
+        while True:
+            # 每个探测使用不同的源端口，并发探测的回应不会被错认
+            with span(tracer, "build", "udp_scan"):
+                sport = UDP_SPORT_BASE + next(UDP_SPORTS) % UDP_SPORT_COUNT
+                packet = template.build(sport, port, payload)
+            last_paced = paced
+            with span(tracer, "icmp_pacing", "udp_scan"):
+                paced = scanner.icmp_pacer.acquire(target, attempt > scanner.timing.max_retries)
+            with span(tracer, "rate_wait", "udp_scan"):
+                scanner.rate_controller.acquire()
+            scanner.stats.sent(attempt > 0)
+            start = time.perf_counter()
+            response, sent_time, reply_time = raw.request(("udp", address, port, sport), packet,
+                                                          scanner.timing.timeout(target, attempt))
+            if tracer is not None:
+                tracer.exchange("udp_scan", start, time.perf_counter(), sent_time, reply_time)
+            if response is not None:
+                break
+            # 可能触发了ICMP限速的目标可以额外重传几次
+            max_retries = scanner.timing.max_retries
+            if scanner.icmp_pacer.may_be_limited(target):
+                max_retries += IcmpPacer.EXTRA_RETRIES
+            if attempt >= max_retries or not scanner.is_scanning:
+                break
+            attempt += 1
+
+        # ICMP限速造成的重传不是网络丢包，不降低全局发包速率
+        retransmitted = attempt > 0 and not scanner.icmp_pacer.limited(target)
+        scanner.rate_controller.report(response is not None, retransmitted)
+        if response is None:
+            scanner.stats.timeout()
+            return port, PortState.OPEN_FILTERED
+        rtt = None
+        if attempt == 0:
+            rtt = reply_time - sent_time
+            scanner.timing.update(target, rtt)
+        scanner.stats.reply(target, rtt)
+
+        if response[0] == "icmp":
+            # ICMP端口不可达表示端口关闭
+            if response[2] == 3 and response[3] == 3:
+                scanner.icmp_pacer.icmp_reply(target, attempt > 0, last_paced)
+                return port, PortState.CLOSED
+            else:
+                return port, PortState.FILTERED
+        else:
+            return port, PortState.OPEN
+    except Exception as e:
+        scanner.stats.error(str(e))
+        return port, PortState.ERROR
+    finally:
+        scanner.stats.probe_end()
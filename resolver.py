@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from targets import TargetSpec
+
+try:
+    # dnspython可选: 可以读取记录的TTL，未安装时使用系统解析器
+    import dns.exception
+    import dns.resolver
+except ImportError:
+    dns = None
+
+# 系统解析器无法给出TTL，解析结果缓存的时间（秒）
+DEFAULT_TTL = 300
+# 解析失败的缓存时间（秒）
+NEGATIVE_TTL = 60
+# TTL的下限，避免TTL很小的记录在扫描中反复解析（秒）
+MIN_TTL = 30
+
+
+def address_family(address):
+    """IP地址对应的套接字地址族"""
+    return socket.AF_INET6 if ":" in address else socket.AF_INET
+
+
+class DnsCache:
+    """域名解析缓存
+
+    每条记录按TTL过期，解析失败也缓存NEGATIVE_TTL秒，
+    同一个无法解析的目标在扫描中只解析一次。可以从文件读取和
+    保存到文件（只保存解析成功且未过期的记录），多次运行之间复用。
+    """
+
+    def __init__(self):
+        # name -> (address, error, expires)，expires为time.time()时间
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """未过期的记录 (address, error)，没有记录时返回None"""
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None or entry[2] <= time.time():
+            return None
+        return entry[0], entry[1]
+
+    def put(self, name, address, error, ttl):
+        with self.lock:
+            self.entries[name] = (address, error, time.time() + ttl)
+
+    def export(self):
+        """解析成功的记录 {name: (address, expires)}，传给工作进程"""
+        now = time.time()
+        with self.lock:
+            return {name: (address, expires) for name, (address, error, expires) in self.entries.items()
+                    if address is not None and expires > now}
+
+    def update(self, records):
+        """加入export()导出的记录"""
+        now = time.time()
+        with self.lock:
+            for name, (address, expires) in records.items():
+                if expires > now:
+                    self.entries[name] = (address, None, expires)
+
+    def load(self, file_path):
+        """从文件读取缓存，文件不存在时忽略"""
+        if not os.path.exists(file_path):
+            return
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except Exception as e:
+            raise Exception(f"读取DNS缓存文件失败: {e}")
+        self.update({name: tuple(record) for name, record in records.items()})
+
+    def save(self, file_path):
+        """原子地写入缓存文件"""
+        temp_path = file_path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.export(), f, ensure_ascii=False)
+            os.replace(temp_path, file_path)
+        except Exception as e:
+            raise Exception(f"写入DNS缓存文件失败: {e}")
+
+
+class BulkResolver:
+    """批量并发解析域名目标
+
+    扫描开始前用线程池并发解析所有域名，结果进入DnsCache，
+    之后每个探测通过 address_of() 直接取得缓存中的IP地址，
+    不再在每个端口的探测中调用阻塞的解析器。
+    """
+
+    def __init__(self, concurrency=64, timeout=5.0):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cache = DnsCache()
+
+    def resolve_all(self, names, progress_callback=None):
+        """并发解析一组域名
+
+        Returns:
+            tuple: ({name: address}, {name: 错误信息})
+        """
+        addresses = {}
+        failures = {}
+        pending = []
+        for name in dict.fromkeys(names):
+            cached = self.cache.get(name)
+            if cached is None:
+                pending.append(name)
+            elif cached[0] is not None:
+                addresses[name] = cached[0]
+            else:
+                failures[name] = cached[1]
+        if pending:
+            if progress_callback:
+                progress_callback(f"正在解析 {len(pending)} 个域名")
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(pending))) as executor:
+                for name, (address, error) in zip(pending, executor.map(self.resolve, pending)):
+                    if address is not None:
+                        addresses[name] = address
+                    else:
+                        failures[name] = error
+        return addresses, failures
+
+    def resolve(self, name):
+        """解析一个域名并写入缓存，返回 (address, error)"""
+        address, error, ttl = self.lookup(name)
+        self.cache.put(name, address, error, ttl)
+        return address, error
+
+    def lookup(self, name):
+        """返回 (IPv4地址, 错误信息, 缓存时间)"""
+        if dns is not None:
+            try:
+                answer = dns.resolver.resolve(name, "A", lifetime=self.timeout)
+                return answer[0].to_text(), None, max(answer.rrset.ttl, MIN_TTL)
+            except dns.exception.DNSException:
+                # hosts文件中的名称和本地域名由系统解析器处理
+                pass
+        try:
+            infos = socket.getaddrinfo(name, None, socket.AF_INET, socket.SOCK_STREAM)
+            return infos[0][4][0], None, DEFAULT_TTL
+        except (socket.gaierror, UnicodeError) as e:
+            return None, str(e), NEGATIVE_TTL
+
+    def address_of(self, target):
+        """目标的IP地址，IP地址原样返回；缓存未命中或已过期时同步解析
+
+        Raises:
+            socket.gaierror: 无法解析
+        """
+        if TargetSpec.is_ip(target):
+            return target
+        cached = self.cache.get(target)
+        if cached is None:
+            cached = self.resolve(target)
+        if cached[0] is None:
+            raise socket.gaierror(socket.EAI_NONAME, cached[1])
+        return cached[0]
+
+
+# 进程内共享的解析器，扫描器、各引擎和输出通过 address_of() 使用同一份缓存
+default_resolver = BulkResolver()
+
+
+def address_of(target):
+    return default_resolver.address_of(target)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import ipaddress
+from tkinter import ttk
+import customtkinter as ctk
+
+# 表格的列: (字段名, 标题, 宽度)
+COLUMNS = (
+    ("host", "主机", 220),
+    ("port", "端口", 80),
+    ("state", "状态", 120),
+    ("service", "服务", 160),
+)
+
+
+def host_sort_key(host):
+    """IP地址按数值排序并排在域名之前"""
+    try:
+        return (0, int(ipaddress.ip_address(host)), "")
+    except ValueError:
+        return (1, 0, host)
+
+
+# 各列的排序键
+SORT_KEYS = (
+    lambda row: (host_sort_key(row[0]), row[1]),
+    lambda row: (row[1], host_sort_key(row[0])),
+    lambda row: (row[2], host_sort_key(row[0]), row[1]),
+    lambda row: (row[3], row[1], host_sort_key(row[0])),
+)
+
+
+class ResultModel:
+    """扫描结果表格的数据模型，每行为 (主机, 端口, 状态, 服务)
+
+    新结果先追加到末尾，按列排序时只在下次读取前重新排序一次，
+    大量结果连续到达时不会每行排序一次。
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.sort_column = None
+        self.reverse = False
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, rows):
+        self.rows.extend(rows)
+        if self.sort_column is not None and rows:
+            self.dirty = True
+
+    def clear(self):
+        self.rows = []
+        self.dirty = False
+
+    def sort(self, column):
+        """按列排序，再次点击同一列时反向"""
+        if self.sort_column == column:
+            self.reverse = not self.reverse
+        else:
+            self.sort_column = column
+            self.reverse = False
+        self.dirty = True
+
+    def slice(self, start, end):
+        """返回排序后第start到end行"""
+        if self.dirty:
+            self.rows.sort(key=SORT_KEYS[self.sort_column], reverse=self.reverse)
+            self.dirty = False
+        return self.rows[start:end]
+
+    def to_text(self):
+        """以制表符分隔的文本返回所有行"""
+        lines = ["\t".join(title for _, title, _ in COLUMNS)]
+        lines.extend("\t".join(map(str, row)) for row in self.slice(0, len(self.rows)))
+        return "\n".join(lines) + "\n"
+
+
+class VirtualTable:
+    """只为可见行创建表格项的结果表格
+
+    Treeview中始终只有一屏的行，滚动时从ResultModel中取出对应的
+    切片重新填充，结果数量不影响界面的响应速度和内存占用。
+    视图位于末尾时跟随新结果滚动。
+    """
+
+    def __init__(self, parent, model, height=15):
+        self.model = model
+        self.height = height
+        self.top = 0
+        self.follow = True
+
+        self.frame = ctk.CTkFrame(parent)
+        style = ttk.Style(self.frame)
+        style.configure("Result.Treeview", rowheight=22)
+        self.tree = ttk.Treeview(self.frame, columns=[key for key, _, _ in COLUMNS], show="headings",
+                                 height=height, selectmode="browse", style="Result.Treeview")
+        for index, (key, title, width) in enumerate(COLUMNS):
+            self.tree.heading(key, text=title, command=lambda index=index: self.sort_by(index))
+            self.tree.column(key, width=width, anchor="w")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(self.frame, command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+
+        # Windows/macOS使用<MouseWheel>，X11使用<Button-4>/<Button-5>
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_rows(-1 if event.delta > 0 else 1) or "break")
+        self.tree.bind("<Button-4>", lambda event: self.scroll_rows(-1) or "break")
+        self.tree.bind("<Button-5>", lambda event: self.scroll_rows(1) or "break")
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def max_top(self):
+        return max(0, len(self.model) - self.height)
+
+    def scroll_to(self, top):
+        self.top = min(max(0, top), self.max_top())
+        self.follow = self.top >= self.max_top()
+        self.refresh()
+
+    def scroll_rows(self, rows):
+        self.scroll_to(self.top + rows)
+
+    def on_scroll(self, action, amount, unit=None):
+        """滚动条回调，参数与Tk的yview命令相同"""
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.model)))
+        elif action == "scroll":
+            step = self.height if unit == "pages" else 1
+            self.scroll_rows(int(amount) * step)
+
+    def sort_by(self, column):
+        self.model.sort(column)
+        for index, (key, title, _) in enumerate(COLUMNS):
+            if index == column:
+                title += " ▼" if self.model.reverse else " ▲"
+            self.tree.heading(key, text=title)
+        self.refresh()
+
+    def refresh(self):
+        """用模型中当前可见的切片重新填充表格"""
+        total = len(self.model)
+        if self.follow:
+            self.top = self.max_top()
+        self.top = min(self.top, self.max_top())
+        self.tree.delete(*self.tree.get_children())
+        for row in self.model.slice(self.top, self.top + self.height):
+            self.tree.insert("", "end", values=row)
+        if total > self.height:
+            self.scrollbar.set(self.top / total, (self.top + self.height) / total)
+        else:
+            self.scrollbar.set(0, 1)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import enum
+import threading
+from array import array
+
+# 位图覆盖的端口数 (0-65535)
+PORT_COUNT = 65536
+BITMAP_SIZE = PORT_COUNT // 8
+
+
+class PortState(enum.IntEnum):
+    """端口状态代码
+
+    扫描引擎返回状态代码而不是本地化的字符串，str()得到中文状态名，
+    nmap_name为nmap输出中使用的英文状态名。
+    """
+
+    OPEN = 1
+    CLOSED = 2
+    FILTERED = 3
+    OPEN_FILTERED = 4
+    UNKNOWN = 5
+    ERROR = 6
+
+    @property
+    def label(self):
+        return STATE_LABELS[self]
+
+    @property
+    def nmap_name(self):
+        return STATE_NMAP_NAMES[self]
+
+    @property
+    def is_open(self):
+        """开放或可能开放（UDP无回应）"""
+        return self in (PortState.OPEN, PortState.OPEN_FILTERED)
+
+    def __str__(self):
+        return self.label
+
+    def __format__(self, format_spec):
+        return format(self.label, format_spec)
+
+
+STATE_LABELS = {
+    PortState.OPEN: "开放",
+    PortState.CLOSED: "关闭",
+    PortState.FILTERED: "过滤",
+    PortState.OPEN_FILTERED: "开放|过滤",
+    PortState.UNKNOWN: "未知",
+    PortState.ERROR: "错误",
+}
+
+# 与nmap的输出保持一致
+STATE_NMAP_NAMES = {
+    PortState.OPEN: "open",
+    PortState.CLOSED: "closed",
+    PortState.FILTERED: "filtered",
+    PortState.OPEN_FILTERED: "open|filtered",
+    PortState.UNKNOWN: "unknown",
+    PortState.ERROR: "error",
+}
+
+
+class PortSet:
+    """紧凑的端口集合
+
+    端口较少时保存为有序的16位数组（每个端口2字节），超过位图的
+    大小时改为65536位的位图（固定8KB），取两者中较小的一种。
+    """
+
+    __slots__ = ("count", "bitmap", "ports")
+
+    def __init__(self, ports):
+        ports = sorted(set(ports))
+        self.count = len(ports)
+        if self.count * 2 > BITMAP_SIZE:
+            self.bitmap = bytearray(BITMAP_SIZE)
+            for port in ports:
+                self.bitmap[port >> 3] |= 1 << (port & 7)
+            self.ports = None
+        else:
+            self.bitmap = None
+            self.ports = array('H', ports)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, port):
+        if self.bitmap is not None:
+            return bool(self.bitmap[port >> 3] & (1 << (port & 7)))
+        ports = self.ports
+        lo, hi = 0, len(ports)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ports[mid] < port:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(ports) and ports[lo] == port
+
+    def __iter__(self):
+        if self.bitmap is None:
+            return iter(self.ports)
+        return (port for port in range(PORT_COUNT) if self.bitmap[port >> 3] & (1 << (port & 7)))
+
+    def nbytes(self):
+        return len(self.bitmap) if self.bitmap is not None else self.ports.itemsize * len(self.ports)
+
+
+class HostResult:
+    """单个主机所有端口的状态
+
+    扫描期间按状态把端口追加到16位数组中；主机完成后seal()把数量
+    最多的状态作为默认状态，只保存其他状态的端口（PortSet），
+    绝大多数端口状态相同的主机只占用几百个字节。
+    """
+
+    __slots__ = ("scan_ports", "pending", "default", "default_count", "exceptions")
+
+    def __init__(self, ports):
+        self.scan_ports = ports
+        self.pending = {}
+        self.default = None
+        self.default_count = 0
+        self.exceptions = {}
+
+    def add(self, port, state):
+        ports = self.pending.get(state)
+        if ports is None:
+            ports = self.pending[state] = array('H')
+        ports.append(port)
+
+    def seal(self):
+        """主机完成，压缩为默认状态加例外端口的形式"""
+        if not self.pending:
+            return
+        counts = {state: len(ports) for state, ports in self.pending.items()}
+        # 只扫描了部分端口（扫描被中断）时，默认状态无法覆盖未扫描的端口
+        if sum(counts.values()) == len(self.scan_ports):
+            self.default = max(counts, key=counts.get)
+            self.default_count = counts[self.default]
+        self.exceptions = {state: PortSet(ports) for state, ports in self.pending.items()
+                           if state != self.default}
+        self.pending = {}
+
+    def counts(self):
+        """返回 {PortState: 端口数}"""
+        if self.pending:
+            return {state: len(ports) for state, ports in self.pending.items()}
+        counts = {state: len(ports) for state, ports in self.exceptions.items()}
+        if self.default is not None:
+            counts[self.default] = self.default_count
+        return counts
+
+    def state(self, port):
+        """端口的状态，未扫描的端口返回None"""
+        for state, ports in self.pending.items():
+            if port in ports:
+                return state
+        for state, ports in self.exceptions.items():
+            if port in ports:
+                return state
+        if self.default is not None and port in self.scan_ports:
+            return self.default
+        return None
+
+    def ports(self, state):
+        """按端口号顺序返回处于state的端口"""
+        if state in self.pending:
+            return sorted(self.pending[state])
+        if state in self.exceptions:
+            return list(self.exceptions[state])
+        if state == self.default:
+            others = list(self.exceptions.values())
+            return sorted(port for port in self.scan_ports if not any(port in ports for ports in others))
+        return []
+
+    def open_ports(self):
+        return sorted(port for state in PortState if state.is_open for port in self.ports(state))
+
+    def nbytes(self):
+        """端口状态占用的字节数（不含对象开销）"""
+        return (sum(ports.itemsize * len(ports) for ports in self.pending.values())
+                + sum(ports.nbytes() for ports in self.exceptions.values()))
+
+
+class ResultStore:
+    """保存扫描中所有主机所有端口状态的结果库
+
+    支持按主机查询开放端口、按端口查询开放的主机和按状态计数，
+    /16 × 全端口的扫描在主机大多为过滤或关闭时只占用几十MB内存。
+    """
+
+    def __init__(self, ports):
+        self.ports = ports
+        self.hosts = {}
+        self.services = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __iter__(self):
+        return iter(list(self.hosts))
+
+    def __contains__(self, target):
+        return target in self.hosts
+
+    def record(self, target, port, state):
+        """记录一个端口的扫描结果"""
+        with self.lock:
+            host = self.hosts.get(target)
+            if host is None:
+                host = self.hosts[target] = HostResult(self.ports)
+            host.add(port, state)
+
+    def finish(self, target):
+        """主机扫描完成，压缩其结果"""
+        with self.lock:
+            host = self.hosts.get(target)
+            if host is None:
+                # 没有任何端口结果的主机（例如端口列表为空）也记录下来
+                host = self.hosts[target] = HostResult(self.ports)
+            host.seal()
+        return host
+
+    def host(self, target):
+        return self.hosts.get(target)
+
+    def set_service(self, target, port, service):
+        """记录开放端口的服务识别结果"""
+        with self.lock:
+            self.services.setdefault(target, {})[port] = service
+
+    def services_of(self, target):
+        """主机的服务识别结果 {port: service}"""
+        with self.lock:
+            return dict(self.services.get(target, {}))
+
+    def open_ports(self, target):
+        """主机的开放端口"""
+        host = self.hosts.get(target)
+        return host.open_ports() if host is not None else []
+
+    def hosts_with(self, port, state=PortState.OPEN):
+        """端口处于state的所有主机"""
+        return [target for target, host in list(self.hosts.items()) if host.state(port) == state]
+
+    def counts(self, target=None):
+        """按状态计数，target为None时统计所有主机"""
+        if target is not None:
+            host = self.hosts.get(target)
+            return host.counts() if host is not None else {}
+        totals = {}
+        for host in list(self.hosts.values()):
+            for state, count in host.counts().items():
+                totals[state] = totals.get(state, 0) + count
+        return totals
+
+    def to_dict(self):
+        """返回 {target: [open_ports]}"""
+        return {target: self.open_ports(target) for target in self}
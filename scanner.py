@@ -1,92 +1,82 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import socket
 import ipaddress
 import threading
-import time
 import random
+import importlib
+import functools
 from concurrent.futures import ThreadPoolExecutor
-from scapy.all import sr1, IP, TCP, UDP, ICMP
+from timing import HostTiming
+from rate_limit import RateController, IcmpPacer
+from targets import PortSpec, TargetSpec, ScanOrder, StridedView, compact_targets, split_shard
+from progress import ProgressTracker
+from telemetry import ScanStats
+from results import ResultStore
+from services import ServiceDetector, format_service
+from resolver import default_resolver
+from history import format_change
+from socket_budget import connect_budget
+from tracing import span
+from packets import RAW_SOCKETS
+
+# 发送原始数据包的探测函数所在的模块: Linux上使用数据包模板，其他平台通过scapy收发
+RAW_PROBES = "raw_probes" if RAW_SOCKETS else "scapy_probes"
+
+# 探测函数注册表: 扫描类型 -> (模块, 函数)，函数的参数为 (scanner, target, port)。
+# 模块在第一次选择该扫描类型时才导入，只有非Linux平台上发送原始数据包的扫描类型会加载scapy
+SCAN_PROBES = {
+    "SYN": (RAW_PROBES, "tcp_syn_scan"),
+    "TCP": ("connect_probe", "tcp_connect_scan"),
+    "UDP": (RAW_PROBES, "udp_scan"),
+}
+
+
+def check_address_family(targets, scan_type):
+    """原始数据包的探测只构造IPv4数据包，IPv6目标只能使用TCP Connect扫描"""
+    if scan_type == "TCP":
+        return
+    if not isinstance(targets, TargetSpec):
+        targets = TargetSpec(targets)
+    if targets.has_ipv6():
+        raise Exception("SYN和UDP扫描只支持IPv4目标，IPv6目标请使用TCP Connect扫描 (-sT)")
+
+
+def load_probe(scan_type):
+    """返回扫描类型对应的探测函数，按需导入其所在的模块"""
+    if scan_type not in SCAN_PROBES:
+        raise Exception(f"未知的扫描类型: {scan_type}")
+    module_name, function_name = SCAN_PROBES[scan_type]
+    return getattr(importlib.import_module(module_name), function_name)
 
 class PortScanner:
-    def __init__(self):
+    def __init__(self, warm=False):
         self.is_scanning = False
+        self.engine = None
+        # warm为True时（守护进程），thread引擎的线程池和batch引擎的收发套接字在扫描之间保留，
+        # 不再需要时调用close()
+        self.warm = warm
+        self.thread_pool = None
+        self.thread_pool_size = 0
+        self.batch_engine = None
+        self.timing = HostTiming()
+        self.rate_controller = RateController()
+        self.seed = None
+        self.progress = None
+        self.stats = ScanStats(self.rate_controller)
+        self.results = None
+        self.service_detector = None
+        self.changes = {}
+        self.icmp_pacer = IcmpPacer()
+        # ScanTracer对象，启用 --trace 或 --profile 时记录各阶段的耗时
+        self.tracer = None
     
     def parse_port_range(self, port_str):
-        """解析端口范围字符串"""
-        ports = []
-        if not port_str:
-            # 默认扫描常用端口
-            return [21, 22, 23, 25, 53, 80, 110, 111, 135, 139, 143, 443, 445, 993, 995, 1723, 3306, 3389, 5900, 8080]
-        
-        for item in port_str.split(','):
-            if '-' in item:
-                start, end = map(int, item.split('-'))
-                ports.extend(range(start, end + 1))
-            else:
-                ports.append(int(item))
-        return ports
-    
-    def tcp_syn_scan(self, target, port):
-        """执行TCP SYN扫描"""
-        try:
-            # 使用scapy发送SYN包
-            packet = IP(dst=target)/TCP(dport=port, flags="S")
-            response = sr1(packet, timeout=1, verbose=0)
-            
-            if response is None:
-                return port, "过滤"
-            elif response.haslayer(TCP) and response.getlayer(TCP).flags == 0x12:  # SYN-ACK
-                # 发送RST包关闭连接
-                rst_packet = IP(dst=target)/TCP(dport=port, flags="R")
-                sr1(rst_packet, timeout=1, verbose=0)
-                return port, "开放"
-            elif response.haslayer(TCP) and response.getlayer(TCP).flags == 0x14:  # RST-ACK
-                return port, "关闭"
-            else:
-                return port, "未知"
-        except Exception as e:
-            return port, f"错误: {str(e)}"
-    
-    def tcp_connect_scan(self, target, port):
-        """执行TCP Connect扫描"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(1)
-            result = s.connect_ex((target, port))
-            s.close()
-            
-            if result == 0:
-                return port, "开放"
-            else:
-                return port, "关闭"
-        except Exception as e:
-            return port, f"错误: {str(e)}"
-    
-    def udp_scan(self, target, port):
-        """执行UDP扫描"""
-        try:
-            # 发送UDP包
-            packet = IP(dst=target)/UDP(dport=port)
-            response = sr1(packet, timeout=2, verbose=0)
-            
-            if response is None:
-                return port, "开放|过滤"
-            elif response.haslayer(ICMP):
-                # ICMP端口不可达表示端口关闭
-                if int(response[ICMP].type) == 3 and int(response[ICMP].code) == 3:
-                    return port, "关闭"
-                else:
-                    return port, "过滤"
-            elif response.haslayer(UDP):
-                return port, "开放"
-            else:
-                return port, "未知"
-        except Exception as e:
-            return port, f"错误: {str(e)}"
+        """解析端口范围字符串，返回按需计算的端口序列"""
+        return PortSpec(port_str)
     
-    def scan_target(self, target, ports, scan_type, threads=20, progress_callback=None, result_callback=None):
+    def scan_target(self, target, ports, scan_type, threads=20, progress_callback=None, result_callback=None,
+                    service_detection=False, service_callback=None):
         """扫描指定目标的端口
         
         Args:
@@ -96,42 +86,56 @@ class PortScanner:
             threads: 线程数
             progress_callback: 进度回调函数(current, total)
             result_callback: 结果回调函数(port, status)
+            service_detection: 是否对开放端口进行服务识别（与端口扫描并行）
+            service_callback: 服务识别结果回调函数(target, port, service)
         
         Returns:
             list: 开放的端口列表
         """
+        check_address_family([target], scan_type)
         if progress_callback:
             progress_callback(f"开始扫描目标: {target}")
         
-        open_ports = []
-        completed = 0
-        total = len(ports)
-        
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            # 根据扫描类型选择扫描函数
-            if scan_type == "SYN":
-                future_to_port = {executor.submit(self.tcp_syn_scan, target, port): port for port in ports}
-            elif scan_type == "TCP":
-                future_to_port = {executor.submit(self.tcp_connect_scan, target, port): port for port in ports}
-            elif scan_type == "UDP":
-                future_to_port = {executor.submit(self.udp_scan, target, port): port for port in ports}
+        port_callback = None
+        if service_detection:
+            self.service_detector = self.create_service_detector(scan_type, service_callback=service_callback)
             
-            for future in future_to_port:
-                if not self.is_scanning:
-                    break
-                    
-                port, status = future.result()
-                completed += 1
-                
-                if "开放" in status:
-                    open_ports.append(port)
-                    if result_callback:
-                        result_callback(port, status)
-        
-        return open_ports
+            def port_callback(target, port, status, elapsed):
+                if status.is_open:
+                    self.service_detector.submit(target, port)
+        
+        try:
+            with span(self.tracer, "scan", "thread"):
+                results = self.scheduled_scan([target], ports, scan_type, threads, max_hosts=1,
+                                              result_callback=result_callback, port_callback=port_callback)
+        finally:
+            if self.service_detector is not None:
+                self.service_detector.close()
+                self.service_detector = None
+        return results.get(target, [])
+    
+    def create_service_detector(self, scan_type, concurrency=32, timeout=3.0, service_callback=None):
+        """创建服务识别器，服务识别通过TCP连接进行，只支持TCP扫描"""
+        if scan_type == "UDP":
+            raise Exception("服务识别仅支持TCP扫描 (-sS 或 -sT)")
+        return ServiceDetector(concurrency, timeout, self.rate_controller, service_callback)
+    
+    def get_scan_function(self, scan_type):
+        """根据扫描类型返回对应的扫描函数(target, port)"""
+        return functools.partial(load_probe(scan_type), self)
     
     def scan_multiple_targets(self, targets, ports, scan_type, threads=20, 
-                            progress_callback=None, result_callback=None, summary_callback=None):
+                            progress_callback=None, result_callback=None, summary_callback=None,
+                            engine="thread", concurrency=5000, max_hosts=16, max_host_probes=None,
+                            timing="normal", min_rate=None, max_rate=None, host_discovery=False,
+                            randomize=True, seed=None, progress_update_callback=None, progress_interval=1.0,
+                            output=None, checkpoint=None, workers=1, shard=None,
+                            stats=None, stats_callback=None, stats_interval=0,
+                            service_detection=False, service_concurrency=32, service_timeout=3.0,
+                            service_callback=None, history=None, change_callback=None,
+                            resolve_concurrency=64, dns_cache=None, rate_controller=None,
+                            coordinator=None, cluster_units=64, lease_timeout=30.0, cluster_token=None,
+                            tracer=None):
         """扫描多个目标
         
         Args:
@@ -142,49 +146,466 @@ class PortScanner:
             progress_callback: 进度回调函数
             result_callback: 结果回调函数
             summary_callback: 摘要回调函数
+            engine: 扫描引擎 ("thread", "async", "batch")
+            concurrency: async引擎的并发连接数
+            max_hosts: thread引擎同时在途的目标数
+            max_host_probes: thread引擎每个目标同时执行的探测数（默认等于线程数）
+            timing: 时间模板名称，决定超时估计和重传次数
+            min_rate: 最小发包速率（包/秒），拥塞降速不会低于该值
+            max_rate: 最大发包速率（包/秒）
+            host_discovery: 是否先进行主机发现，只扫描存活的主机
+            randomize: 是否按伪随机顺序遍历目标和端口
+            seed: 随机顺序的种子，相同的种子得到相同的扫描顺序
+            progress_update_callback: 进度统计回调函数(done, total, rate, eta)，按固定间隔调用
+            progress_interval: 进度统计回调的间隔（秒）
+            output: ScanOutput对象，扫描过程中把端口结果和主机摘要流式写出
+            checkpoint: ScanCheckpoint对象，记录已完成的目标；从文件读取的检查点会跳过已完成的目标
+            workers: 工作进程数，大于1时把扫描分片到多个进程中执行
+            shard: (index, count)，只扫描整个任务的第index个分片（index从0开始）
+            stats: ScanStats对象，记录探测计数和RTT分布（默认新建一个）
+            stats_callback: 统计信息回调函数(stats)，按固定间隔调用
+            stats_interval: 统计信息回调和输出统计记录的间隔（秒），0表示只在结束时输出
+            service_detection: 是否对开放端口进行服务识别，开放端口在发现时立即提交，与端口扫描并行
+            service_concurrency: 同时进行服务识别的端口数
+            service_timeout: 服务识别每次连接和读取的超时（秒）
+            service_callback: 服务识别结果回调函数(target, port, service)
+            history: ScanHistory对象，主机完成时记录其结果并与上次扫描比较
+            change_callback: 端口变化回调函数(target, changes)，只对有变化的主机调用
+            resolve_concurrency: 同时解析的域名数
+            dns_cache: DNS缓存文件路径，解析结果在多次运行之间复用
+            rate_controller: 多个扫描共用的RateController（守护进程的全局速率限制），指定时忽略min_rate和max_rate
+            coordinator: 协调节点的监听地址 "host:port"，指定时由连接的工作节点执行扫描
+            cluster_units: 分布式扫描的工作单元数
+            lease_timeout: 工作节点超过该时间（秒）没有消息时收回它租用的工作单元
+            cluster_token: 工作节点连接时需要提供的令牌
+            tracer: ScanTracer对象，记录本进程中各探测阶段的时间线和耗时
+        
+        所有端口的状态和服务识别结果保存在 self.results (ResultStore) 中，
+        与历史相比的变化保存在 self.changes ({target: changes}) 中。
         
         Returns:
             dict: {target: [open_ports]}
         """
+        check_address_family(targets, scan_type)
+        self.timing = HostTiming(timing)
+        self.tracer = tracer
+        self.rate_controller = rate_controller or RateController(min_rate, max_rate)
+        self.icmp_pacer = IcmpPacer()
+        detector = None
+        if service_detection:
+            detector = self.create_service_detector(scan_type, service_concurrency, service_timeout)
+        self.stats = stats if stats is not None else ScanStats()
+        self.stats.rate_controller = self.rate_controller
+        if randomize:
+            self.seed = seed if seed is not None else random.getrandbits(32)
+        else:
+            self.seed = None
+        resuming = checkpoint is not None and checkpoint.resumed
+        if checkpoint is not None:
+            self.seed = checkpoint.begin(len(targets), self.seed)
+        
         self.is_scanning = True
-        results = {}
         
-        try:
-            for i, target in enumerate(targets):
+        # 扫描开始前并发解析所有域名目标，探测只使用缓存中的地址
+        with span(self.tracer, "resolve", "setup"):
+            targets = self.resolve_targets(targets, resolve_concurrency, dns_cache, checkpoint, progress_callback)
+        
+        if host_discovery:
+            if checkpoint is not None and checkpoint.alive is not None:
+                # 恢复扫描时沿用上次主机发现的结果，保证扫描顺序不变
+                targets = TargetSpec(checkpoint.alive)
+            else:
+                with span(self.tracer, "discovery", "setup"):
+                    targets = self.discover_hosts(targets, progress_callback)
+                # 主机发现期间收到停止请求
                 if not self.is_scanning:
-                    break
-                
-                if progress_callback:
-                    progress_callback(f"正在扫描目标 {i+1}/{len(targets)}: {target}")
-                
-                open_ports = self.scan_target(target, ports, scan_type, threads, 
-                                            progress_callback, result_callback)
-                results[target] = open_ports
-                
-                if summary_callback:
-                    if open_ports:
-                        summary_callback(f"目标 {target} 开放的端口: {', '.join(map(str, open_ports))}")
-                    else:
-                        summary_callback(f"目标 {target} 没有发现开放的端口")
+                    return {}
+                if checkpoint is not None:
+                    checkpoint.set_alive(compact_targets(targets))
         
+        # 扫描顺序只在这里决定，各引擎按给定顺序遍历目标
+        target_shard, port_shard = split_shard(shard, len(targets))
+        if port_shard is not None:
+            ports = StridedView(ports, *port_shard)
+        completed = checkpoint.completed if checkpoint is not None else None
+        order = ScanOrder(targets, self.seed, completed, track=checkpoint is not None, shard=target_shard)
+        if checkpoint is not None:
+            if target_shard is not None:
+                checkpoint.set_scan_count(len(range(target_shard[0], len(targets), target_shard[1])))
+            else:
+                checkpoint.set_scan_count(len(targets))
+            if resuming and progress_callback:
+                progress_callback(f"从检查点恢复: 已完成 {len(checkpoint.completed)}/{checkpoint.scan_count} 个目标")
+        
+        # 所有端口的状态都记录到结果库中，流式输出和 -oN 从结果库读取
+        self.results = ResultStore(ports)
+        self.changes = {}
+        if output is not None:
+            output.start(scan_type, ports, self.results)
+        if history is not None:
+            history.begin_run(scan_type, "udp" if scan_type == "UDP" else "tcp", ports)
+        
+        def port_callback(target, port, status, elapsed):
+            self.results.record(target, port, status)
+            if output is not None:
+                output.port_result(target, port, status, elapsed)
+            if detector is not None and status.is_open:
+                detector.submit(target, port)
+        
+        def host_callback(target, open_ports, positions=None, timing=None, rtt_histogram=None):
+            self.results.finish(target)
+            # 主机完成时总是取出它的RTT直方图，避免长时间扫描中累积
+            rtt_histogram = rtt_histogram or self.stats.host_histogram(target)
+            timing = timing or self.timing.get(target)
+            if checkpoint is not None and positions is None:
+                positions = order.pop_positions(target)
+            
+            def finish_host():
+                if output is not None:
+                    output.host_done(target, open_ports, timing, rtt_histogram)
+                # 输出写入后再记录检查点，中断时最多重复输出几个目标，不会遗漏
+                if checkpoint is not None:
+                    checkpoint.mark_done(positions, target, open_ports)
+                if history is not None:
+                    services = {port: format_service(service)
+                                for port, service in self.results.services_of(target).items()}
+                    changes = history.record_host(target, self.results.host(target), services)
+                    if changes:
+                        self.changes[target] = changes
+                        if change_callback:
+                            change_callback(target, changes)
+            
+            # 主机的服务识别全部完成后再输出摘要，摘要中包含各端口的服务
+            if detector is not None:
+                detector.when_done(target, finish_host)
+            else:
+                finish_host()
+        
+        def service_result(target, port, service):
+            self.results.set_service(target, port, service)
+            if output is not None:
+                output.service_result(target, port, service)
+            if service_callback:
+                service_callback(target, port, service)
+        
+        if detector is not None:
+            detector.service_callback = service_result
+            self.service_detector = detector
+        
+        self.progress = ProgressTracker(len(order) * len(ports), progress_update_callback,
+                                        progress_interval)
+        self.progress.start()
+        
+        def report_stats(snapshot):
+            if output is not None:
+                output.stats(snapshot)
+            if stats_callback:
+                stats_callback(snapshot)
+        
+        self.stats.start(report_stats, stats_interval)
+        try:
+            if workers > 1 or coordinator:
+                settings = {
+                    "scan_type": scan_type, "engine": engine, "threads": threads,
+                    "concurrency": concurrency, "max_hosts": max_hosts,
+                    "max_host_probes": max_host_probes, "timing": timing,
+                    "min_rate": min_rate, "max_rate": max_rate, "seed": self.seed,
+                    "addresses": default_resolver.cache.export(),
+                }
+                if coordinator:
+                    results = self.cluster_scan(targets, ports, order, coordinator, cluster_units,
+                                                lease_timeout, cluster_token, target_shard, completed,
+                                                settings, progress_callback, result_callback,
+                                                summary_callback, port_callback, host_callback, self.stats)
+                else:
+                    results = self.sharded_scan(targets, ports, order, workers, target_shard,
+                                                completed, settings, progress_callback, result_callback,
+                                                summary_callback, port_callback, host_callback,
+                                                self.stats)
+            else:
+                results = self.run_engine(order, ports, scan_type, engine, threads, concurrency,
+                                          max_hosts, max_host_probes, progress_callback, result_callback,
+                                          summary_callback, port_callback, host_callback)
         finally:
-            self.is_scanning = False
+            if detector is not None:
+                # 等待剩余的服务识别，停止扫描后只等待进行中的探测
+                detector.close()
+                self.service_detector = None
+            self.progress.stop()
+            self.progress = None
+            self.stats.stop()
+            # 结束时总是输出一次最终的统计信息
+            report_stats(self.stats.snapshot())
+            if output is not None:
+                output.finish()
+            if checkpoint is not None:
+                checkpoint.save()
+            if history is not None:
+                history.finish_run()
         
+        if checkpoint is not None:
+            # 合并之前运行中发现的开放端口
+            return {**checkpoint.results, **results}
         return results
     
+    def run_engine(self, targets, ports, scan_type, engine="thread", threads=20, concurrency=5000,
+                   max_hosts=16, max_host_probes=None, progress_callback=None, result_callback=None,
+                   summary_callback=None, port_callback=None, host_callback=None):
+        """用指定的引擎按给定顺序扫描目标
+        
+        Returns:
+            dict: {target: [open_ports]}
+        """
+        with span(self.tracer, "scan", engine):
+            if engine == "async":
+                return self.async_connect_scan(targets, ports, concurrency, progress_callback,
+                                               result_callback, summary_callback,
+                                               port_callback, host_callback)
+            if engine == "batch":
+                return self.batch_syn_scan(targets, ports, progress_callback,
+                                           result_callback, summary_callback,
+                                           port_callback, host_callback)
+            return self.scheduled_scan(targets, ports, scan_type, threads, max_hosts, max_host_probes,
+                                       progress_callback, result_callback, summary_callback,
+                                       port_callback, host_callback)
+    
+    def sharded_scan(self, targets, ports, order, workers, target_shard=None, completed=None, settings=None, progress_callback=None, result_callback=None,
+                     summary_callback=None, port_callback=None, host_callback=None, stats=None):
+        """把扫描分片到多个工作进程中执行，合并各进程的结果
+        
+        Returns:
+            dict: {target: [open_ports]}
+        """
+        from workers import ShardedScan
+        
+        if not isinstance(targets, TargetSpec):
+            # 主机发现的结果压缩后再传给工作进程
+            targets = TargetSpec(compact_targets(targets))
+        self.engine = ShardedScan(workers, settings, self.progress, stats)
+        self.is_scanning = True
+        
+        if progress_callback:
+            progress_callback(f"使用 {workers} 个工作进程扫描 {len(order)} 个目标")
+        
+        try:
+            return self.engine.run(targets, ports, len(order), target_shard, completed,
+                                   progress_callback, result_callback, summary_callback,
+                                   port_callback, host_callback)
+        finally:
+            self.is_scanning = False
+            self.engine = None
+    
+    def cluster_scan(self, targets, ports, order, listen, units=64, lease_timeout=30.0, token=None,
+                     target_shard=None, completed=None, settings=None, progress_callback=None,
+                     result_callback=None, summary_callback=None, port_callback=None, host_callback=None,
+                     stats=None):
+        """作为协调节点把扫描分给连接的工作节点执行，合并各节点的结果
+        
+        Returns:
+            dict: {target: [open_ports]}
+        """
+        from cluster import ScanCoordinator
+        
+        self.engine = ScanCoordinator(listen, settings, units, lease_timeout, token, self.progress, stats)
+        self.is_scanning = True
+        
+        try:
+            return self.engine.run(targets, ports, len(order), target_shard, completed,
+                                   progress_callback, result_callback, summary_callback,
+                                   port_callback, host_callback)
+        finally:
+            self.is_scanning = False
+            self.engine = None
+    
+    def scheduled_scan(self, targets, ports, scan_type, threads=20, max_hosts=16, max_host_probes=None,
+                       progress_callback=None, result_callback=None, summary_callback=None,
+                       port_callback=None, host_callback=None):
+        """通过全局工作队列在共享线程池中交错扫描多个目标
+        
+        Returns:
+            dict: {target: [open_ports]}
+        """
+        from scheduler import ScanScheduler
+        
+        if scan_type == "TCP":
+            # 每个线程同时只占用一个连接
+            threads, limit = connect_budget(threads)
+            if limit and progress_callback:
+                progress_callback(f"线程数受{limit}限制，减少为 {threads}")
+        self.engine = ScanScheduler(self.get_scan_function(scan_type), threads,
+                                    max_hosts, max_host_probes, self.seed, self.progress, self.tracer,
+                                    self.warm_thread_pool(threads) if self.warm else None)
+        self.is_scanning = True
+        
+        try:
+            return self.engine.run(targets, ports, progress_callback, result_callback, summary_callback,
+                                   port_callback, host_callback)
+        finally:
+            self.is_scanning = False
+            self.engine = None
+    
+    def warm_thread_pool(self, threads):
+        """返回保留的线程池，线程数与上次不同时重新创建"""
+        if self.thread_pool is not None and self.thread_pool_size != threads:
+            self.thread_pool.shutdown(wait=False, cancel_futures=True)
+            self.thread_pool = None
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(max_workers=threads)
+            self.thread_pool_size = threads
+        return self.thread_pool
+    
+    def resolve_targets(self, targets, concurrency=64, dns_cache=None, checkpoint=None, progress_callback=None):
+        """并发解析目标中的域名，返回去掉无法解析的域名后的目标列表
+        
+        无法解析的域名只报告一次，不参与扫描。恢复扫描时沿用检查点中
+        记录的无法解析的域名，保证扫描顺序与上次一致。
+        """
+        if isinstance(targets, TargetSpec):
+            names = targets.hostnames
+        else:
+            names = [target for target in targets if not TargetSpec.is_ip(target)]
+        if not names:
+            return targets
+        
+        default_resolver.concurrency = concurrency
+        if dns_cache:
+            default_resolver.cache.load(dns_cache)
+        addresses, failures = default_resolver.resolve_all(names, progress_callback)
+        if dns_cache:
+            default_resolver.cache.save(dns_cache)
+        
+        if progress_callback:
+            for name, error in failures.items():
+                progress_callback(f"无法解析目标 {name}: {error}")
+            progress_callback(f"域名解析完成: {len(addresses)}/{len(addresses) + len(failures)} 个域名已解析")
+        
+        unresolved = list(failures)
+        if checkpoint is not None:
+            if checkpoint.unresolved is None:
+                checkpoint.set_unresolved(unresolved)
+            unresolved = checkpoint.unresolved
+        if not unresolved:
+            return targets
+        if isinstance(targets, TargetSpec):
+            return targets.exclude(unresolved)
+        unresolved = set(unresolved)
+        return [target for target in targets if target not in unresolved]
+    
+    def discover_hosts(self, targets, progress_callback=None):
+        """主机发现，返回存活的目标列表"""
+        from discovery import HostDiscovery
+        
+        if progress_callback:
+            progress_callback(f"正在进行主机发现: {len(targets)} 个目标")
+        
+        discovery = HostDiscovery(timeout=self.timing.initial_rto, rate_controller=self.rate_controller)
+        alive = discovery.discover(targets, progress_callback)
+        
+        if progress_callback:
+            progress_callback(f"主机发现完成: {len(alive)}/{len(targets)} 个目标存活")
+        return alive
+    
+    def async_connect_scan(self, targets, ports, concurrency=5000, progress_callback=None,
+                           result_callback=None, summary_callback=None, port_callback=None, host_callback=None):
+        """使用asyncio引擎对多个目标执行TCP Connect扫描
+        
+        Returns:
+            dict: {target: [open_ports]}
+        """
+        from async_scanner import AsyncConnectScanner
+        
+        self.engine = AsyncConnectScanner(concurrency=concurrency, timing=self.timing,
+                                          rate_controller=self.rate_controller, seed=self.seed,
+                                          progress=self.progress, stats=self.stats)
+        self.is_scanning = True
+        
+        if progress_callback:
+            progress_callback(f"使用异步引擎扫描 {len(targets)} 个目标（并发连接数: {self.engine.concurrency}）")
+            if self.engine.concurrency_limit:
+                progress_callback(f"并发连接数受{self.engine.concurrency_limit}限制")
+        
+        try:
+            return self.engine.scan(targets, ports, result_callback, summary_callback,
+                                    port_callback, host_callback)
+        finally:
+            self.is_scanning = False
+            self.engine = None
+    
+    def batch_syn_scan(self, targets, ports, progress_callback=None,
+                       result_callback=None, summary_callback=None, port_callback=None, host_callback=None):
+        """使用无状态批量引擎对多个目标执行TCP SYN扫描
+        
+        Returns:
+            dict: {target: [open_ports]}
+        """
+        from syn_scanner import BatchSynScanner
+        
+        if self.batch_engine is not None:
+            # 保留的引擎沿用已打开的收发套接字，只更新本次扫描的参数
+            engine = self.batch_engine
+            engine.timing = self.timing
+            engine.rate_controller = self.rate_controller
+            engine.seed = self.seed
+            engine.progress = self.progress
+            engine.stats = self.stats
+        else:
+            engine = BatchSynScanner(timing=self.timing, rate_controller=self.rate_controller,
+                                     seed=self.seed, progress=self.progress, stats=self.stats,
+                                     keep_open=self.warm)
+            if self.warm:
+                self.batch_engine = engine
+        self.engine = engine
+        self.is_scanning = True
+        
+        if progress_callback:
+            progress_callback(f"使用批量SYN引擎扫描 {len(targets)} 个目标（源端口: {self.engine.sport}）")
+        
+        try:
+            return self.engine.scan(targets, ports, progress_callback, result_callback, summary_callback,
+                                    port_callback, host_callback)
+        finally:
+            self.is_scanning = False
+            self.engine = None
+    
     def stop_scan(self):
         """停止扫描"""
         self.is_scanning = False
+        if self.engine:
+            self.engine.stop_scan()
+        if self.service_detector:
+            self.service_detector.stop()
+    
+    def close(self):
+        """释放保留的线程池和收发套接字"""
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown(wait=False, cancel_futures=True)
+            self.thread_pool = None
+        if self.batch_engine is not None:
+            self.batch_engine.close()
+            self.batch_engine = None
     
     def load_targets_from_file(self, file_path):
-        """从文件加载目标列表"""
+        """从文件加载目标列表，支持CIDR网段和IP范围"""
         try:
             with open(file_path, 'r') as f:
-                targets = [line.strip() for line in f if line.strip()]
-            return targets
+                return TargetSpec(f)
         except Exception as e:
             raise Exception(f"读取文件失败: {e}")
     
+    def parse_targets(self, target_str):
+        """解析命令行或界面输入的目标，支持CIDR网段和IP范围，多个目标用逗号分隔"""
+        return TargetSpec(target_str.split(','))
+    
+    def save_hosts_to_file(self, hosts, file_path):
+        """将主机发现结果保存到文件"""
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write("# 主机发现结果\n\n")
+                for host in hosts:
+                    f.write(f"- {host}\n")
+        except Exception as e:
+            raise Exception(f"保存文件失败: {e}")
+    
     def save_results_to_file(self, results, file_path):
         """将结果保存到文件"""
         try:
@@ -192,12 +613,24 @@ class PortScanner:
                 f.write("# 端口扫描结果\n\n")
                 for target, open_ports in results.items():
                     f.write(f"## 目标: {target}\n")
+                    counts = self.results.counts(target) if self.results is not None else {}
+                    if counts:
+                        f.write("端口状态: " + "，".join(f"{state} {count} 个"
+                                                        for state, count in sorted(counts.items())) + "\n")
                     if open_ports:
+                        services = self.results.services_of(target) if self.results is not None else {}
                         f.write("开放的端口:\n")
                         for port in open_ports:
-                            f.write(f"- {port}\n")
+                            if port in services:
+                                f.write(f"- {port} {format_service(services[port])}\n")
+                            else:
+                                f.write(f"- {port}\n")
                     else:
                         f.write("无开放端口\n")
+                    if target in self.changes:
+                        f.write("与上次扫描相比的变化:\n")
+                        for change in self.changes[target]:
+                            f.write(f"- {format_change(target, change)}\n")
                     f.write("\n")
         except Exception as e:
             raise Exception(f"保存文件失败: {e}") 
\ No newline at end of file
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 通过scapy收发的TCP SYN和UDP探测函数，需要root/管理员权限。
+# 用于不支持自行构造IP头的原始套接字的平台（非Linux），
+# Linux上由 raw_probes 中基于数据包模板的探测函数代替。
+
+import time
+from scapy.all import sr1, IP, TCP, UDP, ICMP, Raw
+from rate_limit import IcmpPacer
+from udp_payloads import udp_payload
+from results import PortState
+from resolver import address_of
+from tracing import span
+from raw_probes import UDP_SPORT_BASE, UDP_SPORT_COUNT, UDP_SPORTS
+
+
+def tcp_syn_scan(scanner, target, port):
+    """执行TCP SYN扫描"""
+    tracer = scanner.tracer
+    scanner.stats.probe_start()
+    try:
+        address = address_of(target)
+        for attempt in range(scanner.timing.max_retries + 1):
+            if attempt and not scanner.is_scanning:
+                break
+            # 使用scapy发送SYN包
+            with span(tracer, "build", "tcp_syn_scan"):
+                packet = IP(dst=address)/TCP(dport=port, flags="S")
+            with span(tracer, "rate_wait", "tcp_syn_scan"):
+                scanner.rate_controller.acquire()
+            scanner.stats.sent(attempt > 0)
+            start = time.perf_counter()
+            response = sr1(packet, timeout=scanner.timing.timeout(target, attempt), verbose=0)
+            if tracer is not None:
+                tracer.exchange("tcp_syn_scan", start, time.perf_counter(), getattr(packet, "sent_time", None),
+                                response.time if response is not None else None)
+            if response is not None:
+                break
+
+        scanner.rate_controller.report(response is not None, attempt > 0)
+        if response is None:
+            scanner.stats.timeout()
+            return port, PortState.FILTERED
+        # 只用首次发送的回应更新RTT，重传的回应无法区分对应哪一次发送 (Karn算法)
+        rtt = None
+        if attempt == 0:
+            rtt = response.time - packet.sent_time
+            scanner.timing.update(target, rtt)
+        scanner.stats.reply(target, rtt)
+
+        if response.haslayer(TCP) and response.getlayer(TCP).flags == 0x12:  # SYN-ACK
+            # 发送RST包关闭连接
+            with span(tracer, "send_rst", "tcp_syn_scan"):
+                rst_packet = IP(dst=address)/TCP(dport=port, flags="R")
+                scanner.rate_controller.acquire()
+                sr1(rst_packet, timeout=1, verbose=0)
+            return port, PortState.OPEN
+        elif response.haslayer(TCP) and response.getlayer(TCP).flags == 0x14:  # RST-ACK
+            return port, PortState.CLOSED
+        else:
+            return port, PortState.UNKNOWN
+    except Exception as e:
+        scanner.stats.error(str(e))
+        return port, PortState.ERROR
+    finally:
+        scanner.stats.probe_end()
+
+
+def udp_scan(scanner, target, port):
+    """执行UDP扫描
+
+    常见服务的端口发送协议相关的载荷以得到确定的回应；
+    目标限制ICMP端口不可达的速率时，按检测到的速率对该目标排队发送。
+    """
+    tracer = scanner.tracer
+    scanner.stats.probe_start()
+    try:
+        payload = udp_payload(port)
+        address = address_of(target)
+        attempt = 0
+        paced = False
+        while True:
+            # 每个探测使用不同的源端口，并发探测的回应不会被错认
+            with span(tracer, "build", "udp_scan"):
+                sport = UDP_SPORT_BASE + next(UDP_SPORTS) % UDP_SPORT_COUNT
+                packet = IP(dst=address)/UDP(sport=sport, dport=port)/Raw(payload)
+            last_paced = paced
+            with span(tracer, "icmp_pacing", "udp_scan"):
+                paced = scanner.icmp_pacer.acquire(target, attempt > scanner.timing.max_retries)
+            with span(tracer, "rate_wait", "udp_scan"):
+                scanner.rate_controller.acquire()
+            scanner.stats.sent(attempt > 0)
+            start = time.perf_counter()
+            response = sr1(packet, timeout=scanner.timing.timeout(target, attempt), verbose=0)
+            if tracer is not None:
+                tracer.exchange("udp_scan", start, time.perf_counter(), getattr(packet, "sent_time", None),
+                                response.time if response is not None else None)
+            if response is not None:
+                break
+            # 可能触发了ICMP限速的目标可以额外重传几次
+            max_retries = scanner.timing.max_retries
+            if scanner.icmp_pacer.may_be_limited(target):
+                max_retries += IcmpPacer.EXTRA_RETRIES
+            if attempt >= max_retries or not scanner.is_scanning:
+                break
+            attempt += 1
+
+        # ICMP限速造成的重传不是网络丢包，不降低全局发包速率
+        retransmitted = attempt > 0 and not scanner.icmp_pacer.limited(target)
+        scanner.rate_controller.report(response is not None, retransmitted)
+        if response is None:
+            scanner.stats.timeout()
+            return port, PortState.OPEN_FILTERED
+        rtt = None
+        if attempt == 0:
+            rtt = response.time - packet.sent_time
+            scanner.timing.update(target, rtt)
+        scanner.stats.reply(target, rtt)
+
+        if response.haslayer(ICMP):
+            # ICMP端口不可达表示端口关闭
+            if int(response[ICMP].type) == 3 and int(response[ICMP].code) == 3:
+                scanner.icmp_pacer.icmp_reply(target, attempt > 0, last_paced)
+                return port, PortState.CLOSED
+            else:
+                return port, PortState.FILTERED
+        elif response.haslayer(UDP):
+            return port, PortState.OPEN
+        else:
+            return port, PortState.UNKNOWN
+    except Exception as e:
+        scanner.stats.error(str(e))
+        return port, PortState.ERROR
+    finally:
+        scanner.stats.probe_end()
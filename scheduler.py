@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from targets import Permutation
+from tracing import span
+
+# 等待结果时检查停止标志的间隔（秒）
+STOP_POLL_INTERVAL = 0.05
+
+
+class HostState:
+    """调度器中一个在途目标的状态"""
+
+    def __init__(self, index, target, ports, seed=None):
+        self.index = index
+        self.target = target
+        # 每个目标的端口顺序各不相同，但由seed和目标序号唯一确定
+        port_seed = None if seed is None else seed + index
+        self.ports = (ports[i] for i in Permutation(len(ports), port_seed))
+        self.total = len(ports)
+        self.submitted = 0
+        self.completed = 0
+        self.in_flight = 0
+        self.open_ports = []
+
+    def has_pending(self):
+        return self.submitted < self.total
+
+    def is_done(self):
+        return self.completed == self.total
+
+
+class ScanScheduler:
+    """全局 (目标, 端口) 工作队列
+
+    所有目标共享同一个线程池，同时最多有max_hosts个目标在途，
+    每个目标最多同时有max_host_probes个探测在执行，探测在在途目标之间
+    轮转提交，某个目标的所有端口完成后立即输出摘要并补入下一个目标。
+    目标按传入的顺序激活（由ScanOrder决定），给定seed时每个目标的端口
+    按伪随机排列遍历。
+    给定executor时使用这个长期存在的线程池（大小应等于threads），
+    扫描结束时只取消本次扫描排队中的探测，不关闭线程池。
+    """
+
+    def __init__(self, scan_func, threads=20, max_hosts=16, max_host_probes=None, seed=None,
+                 progress=None, tracer=None, executor=None):
+        self.scan_func = scan_func
+        self.threads = threads
+        self.executor = executor
+        self.max_hosts = max(1, max_hosts)
+        self.max_host_probes = max(1, max_host_probes or threads)
+        self.seed = seed
+        self.progress = progress
+        self.tracer = tracer
+        # 跟踪记录中探测区间的类别为探测函数名
+        self.probe_name = getattr(getattr(scan_func, "func", scan_func), "__name__", "probe")
+        self.is_scanning = False
+
+    def run(self, targets, ports, progress_callback=None, result_callback=None, summary_callback=None,
+            port_callback=None, host_callback=None):
+        """扫描所有目标，返回 {target: [open_ports]}
+        
+        port_callback(target, port, status, elapsed) 在每个端口完成时调用，
+        host_callback(target, open_ports) 在每个目标完成时调用。
+        """
+        self.is_scanning = True
+        results = {}
+        done_queue = queue.Queue()
+        pending_targets = enumerate(targets)
+        active = []
+        in_flight = 0
+        # 线程池任务队列中最多保留的探测数，避免一次性提交全部端口
+        window = self.threads * 2
+        executor = self.executor or ThreadPoolExecutor(max_workers=self.threads)
+        # 已提交但结果尚未处理的探测，使用共享线程池时结束后取消其中排队的探测
+        pending = set()
+
+        def activate_hosts():
+            while len(active) < self.max_hosts:
+                try:
+                    index, target = next(pending_targets)
+                except StopIteration:
+                    return
+                if progress_callback:
+                    progress_callback(f"正在扫描目标 {index+1}/{len(targets)}: {target}")
+                host = HostState(index, target, ports, self.seed)
+                if host.is_done():
+                    finish_host(host)
+                    continue
+                active.append(host)
+
+        def finish_host(host):
+            open_ports = sorted(host.open_ports)
+            results[host.target] = open_ports
+            if host_callback:
+                host_callback(host.target, open_ports)
+            if summary_callback:
+                if open_ports:
+                    summary_callback(f"目标 {host.target} 开放的端口: {', '.join(map(str, open_ports))}")
+                else:
+                    summary_callback(f"目标 {host.target} 没有发现开放的端口")
+
+        def submit(host):
+            port = next(host.ports)
+            host.submitted += 1
+            host.in_flight += 1
+            queued = time.perf_counter() if self.tracer is not None else None
+            future = executor.submit(self.timed_probe, host.target, port, queued)
+            pending.add(future)
+            future.add_done_callback(lambda f, h=host: done_queue.put((h, f)))
+
+        try:
+            activate_hosts()
+            while self.is_scanning and (active or in_flight):
+                # 在在途目标之间轮转提交探测
+                progress = True
+                while progress and in_flight < window:
+                    progress = False
+                    for host in active:
+                        if in_flight >= window:
+                            break
+                        if host.has_pending() and host.in_flight < self.max_host_probes:
+                            submit(host)
+                            in_flight += 1
+                            progress = True
+
+                if not in_flight:
+                    break
+
+                # 按完成顺序处理结果，定期醒来检查是否已停止
+                try:
+                    host, future = done_queue.get(timeout=STOP_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                pending.discard(future)
+                in_flight -= 1
+                host.in_flight -= 1
+                host.completed += 1
+                if future.cancelled():
+                    continue
+
+                port, status, elapsed = future.result()
+                with span(self.tracer, "callback", "scheduler"):
+                    if self.progress:
+                        self.progress.advance()
+                    if port_callback:
+                        port_callback(host.target, port, status, elapsed)
+                    if status.is_open:
+                        host.open_ports.append(port)
+                        if result_callback:
+                            result_callback(port, status)
+
+                if host.is_done():
+                    active.remove(host)
+                    with span(self.tracer, "host_done", "scheduler"):
+                        finish_host(host)
+                    activate_hosts()
+        finally:
+            self.is_scanning = False
+            if self.executor is None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                for future in pending:
+                    future.cancel()
+
+        return results
+
+    def timed_probe(self, target, port, queued=None):
+        """执行一次探测并记录耗时（含重传）
+
+        启用跟踪时记录探测在线程池队列中等待的区间和整个探测的区间。
+        """
+        start = time.monotonic()
+        tracer = self.tracer
+        if tracer is not None:
+            begin = time.perf_counter()
+            tracer.add("queue", "scheduler", queued, begin)
+        port, status = self.scan_func(target, port)
+        if tracer is not None:
+            tracer.add("probe", self.probe_name, begin, time.perf_counter(),
+                       {"target": target, "port": port, "state": status.nmap_name})
+        return port, status, time.monotonic() - start
+
+    def stop_scan(self):
+        """停止扫描"""
+        self.is_scanning = False
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import functools
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from resolver import address_of
+from targets import TargetSpec
+
+# 读取回应的最大字节数
+BANNER_SIZE = 4096
+# 收到第一段数据后继续等待后续数据的时间（秒）
+READ_MORE_TIMEOUT = 0.3
+# 输出中保留的banner长度
+BANNER_DISPLAY_LENGTH = 80
+
+# 探测载荷，None表示只连接并等待服务主动发送的banner
+PROBES = {
+    "null": None,
+    "http": b"GET / HTTP/1.0\r\nHost: {host}\r\nUser-Agent: pscan\r\nAccept: */*\r\n\r\n",
+    "redis": b"*1\r\n$4\r\nPING\r\n",
+    # TLS握手由ssl模块完成，握手成功后在TLS连接内先等待banner再发送HTTP请求
+    "tls": None,
+}
+
+# 已知端口优先使用的探测，这些服务不会主动发送数据，跳过等待banner
+PORT_PROBES = {
+    80: ("http",), 81: ("http",), 3000: ("http",), 5000: ("http",), 8000: ("http",),
+    8008: ("http",), 8080: ("http",), 8081: ("http",), 8888: ("http",), 9200: ("http",),
+    443: ("tls",), 465: ("tls",), 636: ("tls",), 853: ("tls",), 993: ("tls",), 995: ("tls",),
+    4443: ("tls",), 8443: ("tls",), 9443: ("tls",),
+    6379: ("redis",),
+}
+
+# 没有命中已知端口或已知端口的探测没有结果时依次尝试的探测
+DEFAULT_PROBES = ("null", "http", "tls", "redis")
+
+# 特征表: (偏移, 前缀, 服务名, 正则表达式)
+# 正则表达式可以包含 product 和 version 两个命名分组；同一前缀下按顺序匹配
+SIGNATURES = (
+    (0, b"SSH-", "ssh", rb"SSH-[\d.]+-(?P<product>[A-Za-z][\w.-]*?)[_-](?P<version>[\w.]+)"),
+    (0, b"SSH-", "ssh", rb"SSH-[\d.]+-(?P<product>[^\s\r\n]+)"),
+    (0, b"HTTP/", "http", rb"HTTP/\d\.\d \d{3}[^\r\n]*\r\n(?:[^\r\n]+\r\n)*?[Ss][Ee][Rr][Vv][Ee][Rr]: *"
+                          rb"(?P<product>[^\r\n/ ]+)(?:/(?P<version>[^\r\n ]+))?"),
+    (0, b"HTTP/", "http", rb"HTTP/"),
+    (0, b"220", "ftp", rb"220[ -][^\r\n]*?(?P<product>vsFTPd|ProFTPD|Pure-FTPd|FileZilla Server)"
+                       rb"[ ]?(?P<version>[\d.]+[a-z]?)?"),
+    (0, b"220", "smtp", rb"220[ -][^\r\n]*?SMTP(?:[^\r\n]*?(?P<product>Postfix|Exim|Sendmail)"
+                        rb"[ ]?(?P<version>\d[\d.]*)?)?"),
+    (0, b"220", "ftp", rb"220[ -][^\r\n]*?FTP"),
+    (0, b"+OK", "pop3", rb"\+OK(?:[^\r\n]*?(?P<product>Dovecot|Cyrus|Courier))?"),
+    (0, b"* OK", "imap", rb"\* OK(?:[^\r\n]*?(?P<product>Dovecot|Cyrus|Courier))?"),
+    (0, b"+PONG", "redis", rb"\+PONG"),
+    (0, b"-NOAUTH", "redis", rb"-NOAUTH"),
+    (0, b"-DENIED", "redis", rb"-DENIED"),
+    (0, b"-ERR", "redis", rb"-ERR (?:unknown command|wrong number of arguments|Protected mode)"),
+    (0, b"RFB ", "vnc", rb"RFB (?P<version>\d{3}\.\d{3})"),
+    (0, b"\xff\xfb", "telnet", rb"\xff\xfb"),
+    (0, b"\xff\xfd", "telnet", rb"\xff\xfd"),
+    # MySQL握手包: 3字节长度、序号0、协议版本10、以\0结尾的版本号
+    (3, b"\x00\x0a", "mysql", rb"...\x00\x0a(?P<version>[\w.-]+)\x00"),
+    (0, b"AMQP", "amqp", rb"AMQP"),
+)
+
+
+def compile_signatures(signatures):
+    """把特征表按 (偏移, 前缀) 编译为字典
+
+    Returns:
+        tuple: ({(offset, prefix): [(name, regex)]}, [(offset, length)])，
+        (偏移, 长度) 按前缀长度从长到短排列
+    """
+    table = {}
+    for offset, prefix, name, pattern in signatures:
+        table.setdefault((offset, prefix), []).append((name, re.compile(pattern, re.DOTALL)))
+    keys = sorted({(offset, len(prefix)) for offset, prefix in table}, key=lambda key: -key[1])
+    return table, keys
+
+
+SIGNATURE_TABLE, SIGNATURE_KEYS = compile_signatures(SIGNATURES)
+
+
+@functools.lru_cache(maxsize=None)
+def service_name(port, protocol="tcp"):
+    """按系统的服务数据库返回端口对应的服务名，未知时返回空字符串"""
+    try:
+        return socket.getservbyport(port, protocol)
+    except (OSError, OverflowError):
+        return ""
+
+
+def banner_text(data):
+    """banner的第一行，不可打印的字符转义，截断到BANNER_DISPLAY_LENGTH"""
+    line = data.split(b"\n", 1)[0].rstrip(b"\r")
+    text = "".join(chr(b) if 32 <= b < 127 else f"\\x{b:02x}" for b in line[:BANNER_DISPLAY_LENGTH])
+    return text
+
+
+def match_banner(data):
+    """用特征表识别回应，返回 (服务名, 产品, 版本)，无法识别时返回None
+
+    先按固定偏移处的前缀查字典，只对前缀相同的少数特征执行正则匹配，
+    每个回应的匹配时间与特征表的大小无关。
+    """
+    for offset, length in SIGNATURE_KEYS:
+        entries = SIGNATURE_TABLE.get((offset, data[offset:offset + length]))
+        if not entries:
+            continue
+        for name, regex in entries:
+            match = regex.match(data)
+            if match:
+                groups = match.groupdict()
+                product = groups.get("product")
+                version = groups.get("version")
+                return (name,
+                        product.decode("latin-1") if product else None,
+                        version.decode("latin-1") if version else None)
+    return None
+
+
+def format_service(service):
+    """把服务识别结果格式化为 "ssl/http nginx 1.24.0" 形式"""
+    name = service["name"]
+    if service.get("tunnel"):
+        name = f"{service['tunnel']}/{name}"
+    parts = [name] + [service[key] for key in ("product", "version") if service.get(key)]
+    return " ".join(parts)
+
+
+class ServiceDetector:
+    """开放端口的服务和banner识别
+
+    端口扫描发现开放端口后立即提交，在独立的线程池中与端口扫描并行执行，
+    同时最多有concurrency个端口在识别。每个端口依次尝试几种探测：
+    等待服务主动发送的banner，发送HTTP请求、Redis PING，或完成TLS握手后
+    在加密连接内重复探测；每次连接和读取都有超时。
+    主机的所有端口识别完成后才调用 when_done() 登记的回调，
+    输出的主机摘要可以包含服务信息。
+    """
+
+    def __init__(self, concurrency=32, timeout=3.0, rate_controller=None, service_callback=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate_controller = rate_controller
+        self.service_callback = service_callback
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.pending = {}
+        self.waiting = {}
+        self.is_running = True
+        self.lock = threading.Lock()
+        # 只有进行服务识别时才导入ssl
+        import ssl
+        self.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.tls_context.check_hostname = False
+        self.tls_context.verify_mode = ssl.CERT_NONE
+
+    def submit(self, target, port):
+        """提交一个开放端口"""
+        with self.lock:
+            if not self.is_running:
+                return
+            self.pending[target] = self.pending.get(target, 0) + 1
+        self.executor.submit(self.run, target, port)
+
+    def when_done(self, target, callback):
+        """目标的所有端口识别完成后调用callback，没有进行中的识别时立即调用"""
+        with self.lock:
+            if self.pending.get(target):
+                self.waiting[target] = callback
+                return
+        callback()
+
+    def run(self, target, port):
+        try:
+            service = self.detect(target, port) if self.is_running else None
+            if service is not None and self.service_callback:
+                self.service_callback(target, port, service)
+        finally:
+            with self.lock:
+                self.pending[target] -= 1
+                callback = None
+                if not self.pending[target]:
+                    del self.pending[target]
+                    callback = self.waiting.pop(target, None)
+            if callback is not None:
+                callback()
+
+    def detect(self, target, port):
+        """识别一个端口的服务
+
+        Returns:
+            dict: name, product, version, tunnel, banner, method；
+            所有探测都没有回应时按端口号给出服务名 (method为"table")
+        """
+        probes = PORT_PROBES.get(port, ())
+        probes += tuple(name for name in DEFAULT_PROBES if name not in probes)
+        first_banner = None
+        for name in probes:
+            if not self.is_running:
+                break
+            try:
+                data, tunnel = self.probe(target, port, name)
+            except ConnectionRefusedError:
+                # 端口已经关闭
+                break
+            except OSError:
+                continue
+            if not data:
+                continue
+            matched = match_banner(data)
+            if matched is not None:
+                service, product, version = matched
+                return {"name": service, "product": product, "version": version, "tunnel": tunnel,
+                        "banner": banner_text(data), "method": "probed"}
+            if first_banner is None:
+                first_banner = (data, tunnel)
+        return {"name": service_name(port) or "unknown", "product": None, "version": None,
+                "tunnel": first_banner[1] if first_banner else None,
+                "banner": banner_text(first_banner[0]) if first_banner else None, "method": "table"}
+
+    def probe(self, target, port, name):
+        """执行一种探测，返回 (回应数据, 隧道)"""
+        if self.rate_controller is not None:
+            self.rate_controller.acquire()
+        sock = socket.create_connection((address_of(target), port), timeout=self.timeout)
+        try:
+            if name == "tls":
+                server_hostname = None if TargetSpec.is_ip(target) else target
+                sock = self.tls_context.wrap_socket(sock, server_hostname=server_hostname)
+                # 先等待banner（SMTPS、IMAPS等），没有banner时按HTTPS探测
+                data = self.read(sock)
+                if not data:
+                    sock.sendall(PROBES["http"].replace(b"{host}", target.encode("idna")))
+                    data = self.read(sock)
+                return data, "ssl"
+            payload = PROBES[name]
+            if payload is not None:
+                sock.sendall(payload.replace(b"{host}", target.encode("idna")))
+            return self.read(sock), None
+        finally:
+            sock.close()
+
+    def read(self, sock):
+        """读取回应，直到连接关闭、超时或读满BANNER_SIZE"""
+        data = b""
+        deadline = time.monotonic() + self.timeout
+        while len(data) < BANNER_SIZE:
+            remaining = deadline - time.monotonic()
+            if data:
+                remaining = min(remaining, READ_MORE_TIMEOUT)
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                chunk = sock.recv(BANNER_SIZE - len(data))
+            except OSError:
+                # 超时、连接被重置或TLS连接异常结束，保留已读到的数据
+                break
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def close(self):
+        """等待所有识别完成（停止后只等待进行中的探测），调用剩余的主机回调"""
+        self.executor.shutdown(wait=True, cancel_futures=not self.is_running)
+        with self.lock:
+            self.is_running = False
+            # 被取消的识别不会减少计数，其主机的回调在这里调用
+            callbacks = list(self.waiting.values())
+            self.waiting.clear()
+            self.pending.clear()
+        for callback in callbacks:
+            callback()
+
+    def stop(self):
+        """停止识别：取消排队的端口，进行中的探测在超时内结束"""
+        with self.lock:
+            self.is_running = False
+        self.executor.shutdown(wait=False, cancel_futures=True)
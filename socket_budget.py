@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# TCP Connect扫描的本机资源预算: 文件描述符上限、本地临时端口范围、
+# 以RST方式关闭连接，以及因本机资源不足失败的探测的重试
+
+import errno
+import socket
+import struct
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块
+    resource = None
+
+# 保留给标准输入输出、日志文件等的文件描述符数量
+RESERVED_FDS = 64
+
+# 扫描最多占用本地临时端口范围的比例，其余留给本机的其他连接
+EPHEMERAL_PORT_SHARE = 0.75
+# 无法读取系统设置时使用的临时端口范围（Linux的默认值）
+DEFAULT_EPHEMERAL_PORTS = (32768, 60999)
+EPHEMERAL_PORT_RANGE_FILE = "/proc/sys/net/ipv4/ip_local_port_range"
+
+# 本机原因导致的失败（临时端口或文件描述符耗尽、内核缓冲区不足），
+# 与目标端口的状态无关，等待后重试，不消耗探测的重传次数
+LOCAL_ERRNOS = frozenset((errno.EADDRNOTAVAIL, errno.EADDRINUSE, errno.EMFILE, errno.ENFILE,
+                          errno.ENOBUFS, errno.ENOMEM))
+# 本机原因的最大重试次数和退避时间（秒）
+LOCAL_RETRY_LIMIT = 30
+LOCAL_RETRY_DELAY = 0.01
+LOCAL_RETRY_MAX_DELAY = 1.0
+
+# SO_LINGER开启且超时为0: close()直接发送RST，本地不留下TIME_WAIT
+LINGER_RST = struct.pack('ii', 1, 0)
+
+
+def raise_fd_limit(wanted):
+    """尽量提高进程的文件描述符上限，返回可用于扫描的套接字数量"""
+    if resource is None:
+        return wanted
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        target = wanted + RESERVED_FDS
+        if hard != resource.RLIM_INFINITY:
+            target = min(target, hard)
+        if soft != resource.RLIM_INFINITY and soft < target:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        if soft == resource.RLIM_INFINITY:
+            return wanted
+        return max(1, min(wanted, soft - RESERVED_FDS))
+    except (ValueError, OSError):
+        return wanted
+
+
+def ephemeral_port_count():
+    """本地临时端口范围内的端口数"""
+    try:
+        with open(EPHEMERAL_PORT_RANGE_FILE) as f:
+            low, high = (int(value) for value in f.read().split())
+    except (OSError, ValueError):
+        low, high = DEFAULT_EPHEMERAL_PORTS
+    return max(1, high - low + 1)
+
+
+def connect_budget(wanted):
+    """按文件描述符上限和临时端口数计算connect扫描可以同时在途的连接数
+
+    Returns:
+        tuple: (并发数, 限制的原因)，没有受到限制时原因为None
+    """
+    budget = raise_fd_limit(wanted)
+    reason = "文件描述符上限" if budget < wanted else None
+    ports = max(1, int(ephemeral_port_count() * EPHEMERAL_PORT_SHARE))
+    if ports < budget:
+        budget = ports
+        reason = "本地临时端口范围"
+    return budget, reason
+
+
+def abortive_close(sock):
+    """以RST关闭已建立的连接，不进入TIME_WAIT，临时端口立即可以复用"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+    except OSError:
+        pass
+    sock.close()
+
+
+def local_retry_delay(retry):
+    """第retry次本机原因重试前等待的秒数（指数退避）"""
+    return min(LOCAL_RETRY_MAX_DELAY, LOCAL_RETRY_DELAY * 2 ** retry)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import socket
+import threading
+import time
+import zlib
+from packets import RAW_SOCKETS, TCP_RST, TCP_SYN, RawReceiver, TcpTemplate, decode, open_send_socket
+from timing import HostTiming
+from rate_limit import RateController
+from targets import block_probes, block_size_for, iter_target_blocks
+from telemetry import ScanStats
+from results import PortState
+from resolver import address_of
+
+# 每块目标的探测数，一块的最后一轮发送完成并超时后输出其中目标的摘要
+PROBES_PER_BLOCK = 1 << 20
+
+
+class TemplateSynIO:
+    """Linux上批量SYN引擎的收发: 数据包模板 + 原始套接字接收
+
+    每个在途目标有一个TCP模板和一个预先分配的发送缓冲区（只由发送线程使用），
+    回应由接收线程按固定偏移解码，内核中的BPF过滤器只保留发往本机源端口的TCP包。
+    """
+
+    def __init__(self, sport, handler):
+        self.sport = sport
+        self.handler = handler
+        self.templates = {}
+        self.send_sock = open_send_socket()
+        self.receiver = RawReceiver(self.receive)
+        self.receiver.add(socket.IPPROTO_TCP, (sport, sport))
+
+    def start(self):
+        self.receiver.start()
+
+    def add_target(self, ip):
+        template = TcpTemplate(ip, self.sport)
+        self.templates[ip] = (template, template.new_buffer())
+
+    def remove_target(self, ip):
+        self.templates.pop(ip, None)
+
+    def send_syn(self, ip, port, seq):
+        template, buffer = self.templates[ip]
+        self.send_sock.sendto(template.fill(buffer, port, seq, TCP_SYN), (ip, 0))
+
+    def send_rst(self, ip, port, seq):
+        # 在接收线程中发送，不能使用发送线程的缓冲区
+        entry = self.templates.get(ip)
+        template = entry[0] if entry else TcpTemplate(ip, self.sport)
+        self.send_sock.sendto(template.fill(template.new_buffer(), port, seq, TCP_RST), (ip, 0))
+
+    def receive(self, packet, timestamp):
+        reply = decode(packet)
+        if reply is None or reply[0] != "tcp" or reply[3] != self.sport:
+            return
+        self.handler(reply[1], reply[2], reply[5], reply[6], timestamp)
+
+    def close(self):
+        self.receiver.close()
+        self.send_sock.close()
+
+
+class ScapySynIO:
+    """其他平台上批量SYN引擎的收发，通过scapy的L3套接字发送、AsyncSniffer接收"""
+
+    def __init__(self, sport, handler):
+        from scapy.all import conf
+
+        self.sport = sport
+        self.handler = handler
+        self.send_sock = conf.L3socket()
+        self.sniffer = None
+
+    def reply_filter(self):
+        """返回抓包过滤参数，无法编译BPF时退回到Python层过滤"""
+        from scapy.all import TCP
+        from scapy.arch.common import compile_filter
+
+        bpf = f"tcp and dst port {self.sport}"
+        try:
+            compile_filter(bpf)
+            return {"filter": bpf}
+        except (ImportError, OSError):
+            return {"lfilter": lambda pkt: pkt.haslayer(TCP) and pkt[TCP].dport == self.sport}
+
+    def start(self):
+        from scapy.all import AsyncSniffer
+        from scapy.interfaces import get_working_ifaces
+
+        self.sniffer = AsyncSniffer(iface=[i.name for i in get_working_ifaces()], prn=self.receive, store=False,
+                                    **self.reply_filter())
+        self.sniffer.start()
+        # 等待抓包线程就绪，避免丢失最早的回应
+        time.sleep(0.1)
+
+    def add_target(self, ip):
+        pass
+
+    def remove_target(self, ip):
+        pass
+
+    def send_syn(self, ip, port, seq):
+        from scapy.all import IP, TCP
+
+        self.send_sock.send(IP(dst=ip)/TCP(sport=self.sport, dport=port, flags="S", seq=seq))
+
+    def send_rst(self, ip, port, seq):
+        from scapy.all import IP, TCP
+
+        self.send_sock.send(IP(dst=ip)/TCP(sport=self.sport, dport=port, flags="R", seq=seq))
+
+    def receive(self, pkt):
+        from scapy.all import IP, TCP
+
+        if not pkt.haslayer(TCP) or not pkt.haslayer(IP):
+            return
+        tcp = pkt[TCP]
+        if tcp.dport != self.sport:
+            return
+        self.handler(pkt[IP].src, tcp.sport, tcp.ack, int(tcp.flags), pkt.time)
+
+    def close(self):
+        if self.sniffer is not None:
+            self.sniffer.stop()
+        self.send_sock.close()
+
+
+class BatchSynScanner:
+    """无状态批量SYN扫描引擎
+
+    发送线程通过一个长期打开的原始套接字连续发送SYN包（Linux上由每个目标的
+    数据包模板生成），接收端在BPF过滤器后匹配SYN-ACK/RST回应。探测信息编码在
+    初始序列号中（对目标地址和端口的校验值），因此不需要为
+    每个探测保存状态，回应的确认号减一即可还原并校验。
+    每轮发送结束后，对仍未回应的端口按时间模板重传。
+    keep_open为True时收发套接字和接收线程在扫描之间保持打开，
+    供常驻进程重复使用，不再需要时调用close()。
+    """
+
+    def __init__(self, timing=None, rate_controller=None, seed=None, progress=None, stats=None,
+                 keep_open=False):
+        self.keep_open = keep_open
+        self.packet_io = None
+        self.seed = seed
+        self.progress = progress
+        self.stopped = threading.Event()
+        self.timing = timing or HostTiming()
+        self.rate_controller = rate_controller or RateController()
+        self.stats = stats or ScanStats(self.rate_controller)
+        self.is_scanning = False
+        self.secret = os.urandom(8)
+        self.sport = random.randint(40000, 60000)
+
+    def cookie(self, ip, port):
+        """根据目标地址和端口计算SYN包的初始序列号"""
+        return zlib.crc32(f"{ip}:{port}".encode(), zlib.crc32(self.secret))
+
+    def resolve_block(self, block, progress_callback=None):
+        """将一块目标解析为IP地址，返回 {ip: [targets]}
+
+        解析到同一地址的多个目标（例如主机名和它的地址）只探测一次，
+        回应的结果交给其中每个目标。
+        """
+        ip_to_targets = {}
+        for target in block:
+            try:
+                ip_to_targets.setdefault(address_of(target), []).append(target)
+            except socket.gaierror as e:
+                if progress_callback:
+                    progress_callback(f"无法解析目标 {target}: {e}")
+        return ip_to_targets
+
+    def scan(self, targets, ports, progress_callback=None, result_callback=None, summary_callback=None,
+             port_callback=None, host_callback=None):
+        """扫描所有目标，返回 {target: [open_ports]}"""
+        self.is_scanning = True
+        self.stopped.clear()
+        results = {}
+        lock = threading.Lock()
+        # 当前在途的目标: ip -> [targets]，以及每个IP已回应的端口和首轮发送时间
+        active = {}
+        seen = {}
+        open_ports_of = {}
+        first_sent = {}
+        # 每个IP首轮已发送的探测数，目标完成时用于统计超时的探测
+        issued = {}
+        # 每个目标最后一个SYN的发送时间和超时，超时后即可输出该目标的摘要
+        last_sent = {}
+        block_size = block_size_for(len(ports), PROBES_PER_BLOCK)
+
+        def handle_reply(ip, port, ack, flags, timestamp):
+            # 校验确认号，丢弃不属于本次扫描的回应
+            if (ack - 1) & 0xFFFFFFFF != self.cookie(ip, port):
+                return
+            with lock:
+                targets_of_ip = active.get(ip)
+                if targets_of_ip is None or port in seen[ip]:
+                    return
+                seen[ip].add(port)
+                sent = first_sent[ip].pop(port, None)
+            self.rate_controller.report(True, sent is None)
+            # 只用首轮发送的回应更新RTT (Karn算法)
+            rtt = None
+            if sent is not None:
+                rtt = timestamp - sent
+                for target in targets_of_ip:
+                    self.timing.update(target, rtt)
+            self.stats.reply(targets_of_ip[0], rtt)
+            self.stats.probe_end()
+            if flags & 0x04 and port_callback:  # RST
+                for target in targets_of_ip:
+                    port_callback(target, port, PortState.CLOSED, rtt)
+            if flags & 0x12 == 0x12:  # SYN-ACK
+                # 发送RST关闭半开连接，不等待回应
+                packet_io.send_rst(ip, port, ack)
+                with lock:
+                    for target in targets_of_ip:
+                        open_ports_of[target].append(port)
+                for target in targets_of_ip:
+                    if port_callback:
+                        port_callback(target, port, PortState.OPEN, rtt)
+                    if result_callback:
+                        result_callback(port, PortState.OPEN)
+
+        if self.packet_io is None:
+            self.packet_io = (TemplateSynIO if RAW_SOCKETS else ScapySynIO)(self.sport, handle_reply)
+            self.packet_io.start()
+        else:
+            # 保持打开的收发器改为把回应交给本次扫描
+            self.packet_io.handler = handle_reply
+        packet_io = self.packet_io
+
+        def send_block(ip_to_targets):
+            block = list(ip_to_targets)
+            for attempt in range(self.timing.max_retries + 1):
+                if attempt:
+                    # 等待上一轮的回应后再重传未回应的端口
+                    wait = max((self.timing.timeout(targets_of_ip[0], attempt - 1)
+                                for targets_of_ip in ip_to_targets.values()), default=0)
+                    if self.stopped.wait(wait):
+                        return
+                for ip, port in block_probes(block, ports, self.seed):
+                    if not self.is_scanning:
+                        return
+                    if port in seen[ip]:
+                        continue
+                    self.rate_controller.acquire()
+                    # 先登记发送时间再发包，避免回应早于登记
+                    if attempt == 0:
+                        self.stats.probe_start()
+                    self.stats.sent(attempt > 0)
+                    with lock:
+                        if attempt == 0:
+                            first_sent[ip][port] = time.time()
+                            issued[ip] += 1
+                        else:
+                            first_sent[ip].pop(port, None)
+                    packet_io.send_syn(ip, port, self.cookie(ip, port))
+                    if attempt == 0 and self.progress:
+                        # 同一地址的每个目标各算一次探测
+                        self.progress.advance(len(ip_to_targets[ip]))
+            with lock:
+                for ip, targets_of_ip in ip_to_targets.items():
+                    last_sent[ip] = (time.time(), self.timing.timeout(targets_of_ip[0], self.timing.max_retries))
+
+        def sender():
+            for block in iter_target_blocks(targets, block_size):
+                ip_to_targets = self.resolve_block(block, progress_callback)
+                # 地址仍在上一块中探测时，等它完成后再发送，回应才不会被混在一起
+                while self.is_scanning:
+                    with lock:
+                        if not any(ip in active for ip in ip_to_targets):
+                            break
+                    self.stopped.wait(0.05)
+                if not self.is_scanning:
+                    return
+                with lock:
+                    for ip, targets_of_ip in ip_to_targets.items():
+                        active[ip] = targets_of_ip
+                        packet_io.add_target(ip)
+                        seen[ip] = set()
+                        first_sent[ip] = {}
+                        issued[ip] = 0
+                        for target in targets_of_ip:
+                            open_ports_of[target] = []
+                send_block(ip_to_targets)
+                if not self.is_scanning:
+                    return
+
+        def finish_target(ip):
+            with lock:
+                targets_of_ip = active.pop(ip)
+                packet_io.remove_target(ip)
+                answered = seen.pop(ip)
+                del first_sent[ip]
+                del last_sent[ip]
+                unanswered = issued.pop(ip) - len(answered)
+                open_ports_by_target = [(target, sorted(open_ports_of.pop(target))) for target in targets_of_ip]
+            self.stats.timeout(unanswered)
+            self.stats.probe_end(unanswered)
+            for target, open_ports in open_ports_by_target:
+                if port_callback:
+                    # 重传后仍未回应的端口视为过滤
+                    for port in ports:
+                        if port not in answered:
+                            port_callback(target, port, PortState.FILTERED, None)
+                results[target] = open_ports
+                if host_callback:
+                    host_callback(target, open_ports)
+                if summary_callback:
+                    if open_ports:
+                        summary_callback(f"目标 {target} 开放的端口: {', '.join(map(str, open_ports))}")
+                    else:
+                        summary_callback(f"目标 {target} 没有发现开放的端口")
+
+        send_thread = threading.Thread(target=sender, daemon=True)
+        send_thread.start()
+
+        try:
+            while self.is_scanning:
+                now = time.time()
+                with lock:
+                    expired = [ip for ip, (sent, timeout) in last_sent.items() if now - sent >= timeout]
+                for ip in expired:
+                    finish_target(ip)
+                if not send_thread.is_alive() and not last_sent:
+                    break
+                self.stopped.wait(0.05)
+        finally:
+            self.is_scanning = False
+            send_thread.join()
+            if self.keep_open:
+                # 中途停止时仍在途的目标不再需要模板
+                for ip in list(active):
+                    packet_io.remove_target(ip)
+            else:
+                self.close()
+
+        return results
+
+    def stop_scan(self):
+        """停止扫描"""
+        self.is_scanning = False
+        self.stopped.set()
+
+    def close(self):
+        """关闭收发套接字和接收线程"""
+        if self.packet_io is not None:
+            self.packet_io.close()
+            self.packet_io = None
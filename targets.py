@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import ipaddress
+import random
+import threading
+
+# 默认扫描的常用端口
+DEFAULT_PORTS = [21, 22, 23, 25, 53, 80, 110, 111, 135, 139, 143, 443, 445, 993, 995, 1723, 3306, 3389, 5900, 8080]
+
+
+class RangeSequence:
+    """由若干连续区间组成的只读序列，按需计算元素，不展开成列表"""
+
+    def __init__(self):
+        self.blocks = []
+        # 每个区间在整个序列中的起始下标
+        self.offsets = []
+        self.total = 0
+
+    def add_block(self, block):
+        self.blocks.append(block)
+        self.offsets.append(self.total)
+        self.total += len(block)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.total
+        if not 0 <= index < self.total:
+            raise IndexError("下标超出范围")
+        i = bisect.bisect_right(self.offsets, index) - 1
+        return self.item(self.blocks[i], index - self.offsets[i])
+
+    def __iter__(self):
+        for block in self.blocks:
+            for offset in range(len(block)):
+                yield self.item(block, offset)
+
+    def item(self, block, offset):
+        return block[offset]
+
+
+class PortSpec(RangeSequence):
+    """端口范围，例如 "22,80,443" 或 "1-1000" """
+
+    def __init__(self, port_str=None):
+        super().__init__()
+        if not port_str:
+            for port in DEFAULT_PORTS:
+                self.add_block(range(port, port + 1))
+            return
+
+        for item in port_str.split(','):
+            item = item.strip()
+            if '-' in item:
+                start, end = map(int, item.split('-'))
+            else:
+                start = end = int(item)
+            if not 0 < start <= end <= 65535:
+                raise Exception(f"无效的端口范围: {item}")
+            self.add_block(range(start, end + 1))
+
+    def __contains__(self, port):
+        return any(port in block for block in self.blocks)
+
+
+class AddressBlock:
+    """一段连续的IP地址，只保存起止地址的整数值和地址版本，按下标计算地址"""
+
+    def __init__(self, start, stop, version=4):
+        self.start = start
+        self.stop = stop
+        self.version = version
+        self.address_class = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, offset):
+        return str(self.address_class(self.start + offset))
+
+    def entry(self):
+        """重新解析后得到同一段地址的条目"""
+        return f"{self.address_class(self.start)}-{self.address_class(self.stop - 1)}"
+
+
+class TargetSpec(RangeSequence):
+    """目标列表，支持单个IP/域名、CIDR网段和IP范围
+
+    网段和范围只保存起止地址，遍历或按下标访问时才计算具体地址。
+    支持的写法:
+        192.168.1.1, example.com
+        192.168.1.0/24
+        192.168.1.10-50, 192.168.1.10-192.168.2.20
+    """
+
+    def __init__(self, entries=()):
+        super().__init__()
+        # 域名目标，扫描开始前统一解析
+        self.hostnames = []
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        entry = entry.strip()
+        if not entry or entry.startswith('#'):
+            return
+        if '/' in entry:
+            network = ipaddress.ip_network(entry, strict=False)
+            first = int(network.network_address)
+            last = int(network.broadcast_address)
+            # 大于/31的IPv4网段跳过网络地址和广播地址
+            if network.version == 4 and network.num_addresses > 2:
+                first += 1
+                last -= 1
+            self.add_block(AddressBlock(first, last + 1, network.version))
+        elif '-' in entry and self.is_ip(entry.split('-')[0]):
+            start_str, end_str = entry.split('-', 1)
+            start = ipaddress.ip_address(start_str)
+            if self.is_ip(end_str):
+                end = ipaddress.ip_address(end_str)
+            elif start.version == 4:
+                # 简写形式: 192.168.1.10-50
+                end = ipaddress.ip_address(start_str.rsplit('.', 1)[0] + '.' + end_str)
+            else:
+                raise Exception(f"无效的IP范围: {entry}，IPv6范围需要写出完整的结束地址")
+            if end.version != start.version or int(end) < int(start):
+                raise Exception(f"无效的IP范围: {entry}")
+            self.add_block(AddressBlock(int(start), int(end) + 1, start.version))
+        else:
+            self.add_block([entry])
+            if not self.is_ip(entry):
+                self.hostnames.append(entry)
+
+    def exclude(self, names):
+        """返回去掉指定域名目标后的目标列表，其余目标的顺序不变"""
+        names = set(names)
+        spec = TargetSpec()
+        for block in self.blocks:
+            if isinstance(block, list) and block[0] in names:
+                continue
+            spec.add_block(block)
+            if isinstance(block, list) and not self.is_ip(block[0]):
+                spec.hostnames.append(block[0])
+        return spec
+
+    def entries(self):
+        """重新解析后得到相同目标列表的条目，目标的顺序和下标不变"""
+        entries = []
+        for block in self.blocks:
+            if isinstance(block, AddressBlock):
+                entries.append(block.entry())
+            else:
+                entries.append(block[0])
+        return entries
+
+    def has_ipv6(self):
+        """是否包含IPv6地址（域名只解析为IPv4地址）"""
+        for block in self.blocks:
+            if isinstance(block, AddressBlock):
+                if block.version == 6:
+                    return True
+            elif self.is_ip(block[0]) and ipaddress.ip_address(block[0]).version == 6:
+                return True
+        return False
+
+    @staticmethod
+    def is_ip(text):
+        try:
+            ipaddress.ip_address(text)
+            return True
+        except ValueError:
+            return False
+
+
+class Permutation:
+    """[0, n) 上的伪随机排列，不生成整个序列
+
+    使用平衡Feistel网络在2^k (>= n) 的定义域上构造双射，
+    落在 [0, n) 之外的值继续迭代（cycle walking），
+    因此第i个元素可以直接计算，内存占用与n无关。
+    seed为None时退化为顺序排列。
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, n, seed=None):
+        self.n = n
+        self.seed = seed
+        bits = max(2, (n - 1).bit_length())
+        bits += bits % 2
+        self.half_bits = bits // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def __len__(self):
+        return self.n
+
+    def round_function(self, value, key):
+        value = ((value ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+        value ^= value >> 15
+        return value & self.half_mask
+
+    def encrypt(self, value):
+        left = value >> self.half_bits
+        right = value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self.round_function(right, key)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.n:
+            raise IndexError("下标超出范围")
+        if self.seed is None:
+            return index
+        value = self.encrypt(index)
+        while value >= self.n:
+            value = self.encrypt(value)
+        return value
+
+    def __iter__(self):
+        for index in range(self.n):
+            yield self[index]
+
+
+def permuted(sequence, seed=None):
+    """按伪随机顺序遍历支持下标访问的序列"""
+    for index in Permutation(len(sequence), seed):
+        yield sequence[index]
+
+
+class ScanOrder(RangeSequence):
+    """按扫描顺序排列的目标视图
+
+    第k个元素是伪随机排列中第k个位置上的目标，completed中记录的
+    位置（RangeSet）会被跳过，因此恢复扫描时剩余目标的顺序与中断前相同。
+    给定shard=(index, count)时只包含位置模count等于index的目标。
+    track为True时记录已取出但尚未完成的目标所在的位置，
+    用于在目标完成后更新检查点。
+    """
+
+    def __init__(self, targets, seed=None, completed=None, track=False, shard=None):
+        super().__init__()
+        self.targets = targets
+        self.permutation = Permutation(len(targets), seed)
+        self.track = track
+        self.issued = {}
+        self.lock = threading.Lock()
+        if completed is None:
+            pending = [(0, len(targets))] if len(targets) else []
+        else:
+            pending = completed.complement(len(targets))
+        index, count = shard or (0, 1)
+        for start, end in pending:
+            first = start + (index - start) % count
+            if first < end:
+                self.add_block(range(first, end, count))
+
+    def item(self, block, offset):
+        position = block[offset]
+        target = self.targets[self.permutation[position]]
+        if self.track:
+            with self.lock:
+                self.issued.setdefault(target, []).append(position)
+        return target
+
+    def pop_positions(self, target):
+        """返回并清除目标已取出的所有位置（重复的目标只扫描一次）"""
+        with self.lock:
+            return self.issued.pop(target, [])
+
+
+class StridedView(RangeSequence):
+    """序列中下标为 index, index+count, index+2*count, ... 的元素组成的视图"""
+
+    def __init__(self, sequence, index, count):
+        super().__init__()
+        self.sequence = sequence
+        self.add_block(range(index, len(sequence), count))
+
+    def item(self, block, offset):
+        return self.sequence[block[offset]]
+
+    def __contains__(self, value):
+        return any(item == value for item in self)
+
+
+def parse_shard(shard_str):
+    """解析 "i/N" 形式的分片参数（i从1开始），返回 (index, count)，index从0开始"""
+    try:
+        index, count = map(int, shard_str.split('/'))
+    except ValueError:
+        raise Exception(f"无效的分片: {shard_str}，格式应为 i/N")
+    if not 1 <= index <= count:
+        raise Exception(f"无效的分片: {shard_str}，i应在1到N之间")
+    return index - 1, count
+
+
+def compose_shard(shard, index, count):
+    """把已有的分片再分成count份，返回第index份对应的分片"""
+    base_index, base_count = shard or (0, 1)
+    return base_index + index * base_count, base_count * count
+
+
+def split_shard(shard, target_count):
+    """决定分片按目标还是按端口划分，返回 (target_shard, port_shard)
+
+    目标数不少于分片数时按扫描顺序中的目标位置划分，每个分片得到完整的主机；
+    否则（例如单个目标的全端口扫描）按端口划分。
+    """
+    if shard is None:
+        return None, None
+    if target_count >= shard[1]:
+        return shard, None
+    return None, shard
+
+
+def compact_targets(targets):
+    """把目标列表压缩为TargetSpec可以解析的条目，连续的IPv4地址合并为范围，保持原有顺序"""
+    entries = []
+    run = None
+    for target in targets:
+        try:
+            address = ipaddress.IPv4Address(target)
+        except ValueError:
+            address = None
+        if address is not None and run is not None and int(address) == run[1] + 1:
+            run[1] = int(address)
+            continue
+        if run is not None:
+            entries.append(format_ip_range(*run))
+            run = None
+        if address is not None:
+            run = [int(address), int(address)]
+        else:
+            entries.append(target)
+    if run is not None:
+        entries.append(format_ip_range(*run))
+    return entries
+
+
+def format_ip_range(start, end):
+    if start == end:
+        return str(ipaddress.IPv4Address(start))
+    return f"{ipaddress.IPv4Address(start)}-{ipaddress.IPv4Address(end)}"
+
+
+def block_size_for(port_count, probes_per_block):
+    """根据端口数计算每块包含的目标数，使每块的探测数接近probes_per_block"""
+    return max(1, probes_per_block // max(1, port_count))
+
+
+def iter_target_blocks(targets, block_size):
+    """把目标按给定顺序分成若干块（块内去重），每次只生成一块"""
+    block = {}
+    for target in targets:
+        block[target] = None
+        if len(block) >= block_size:
+            yield list(block)
+            block = {}
+    if block:
+        yield list(block)
+
+
+def block_probes(block, ports, seed=None):
+    """按伪随机顺序生成一块目标的 (目标, 端口) 探测
+
+    块内的 目标×端口 空间整体打乱，使同一主机的探测分散在整块的
+    发送过程中；可以对同一块重复调用以得到相同的顺序（用于重传）。
+    """
+    for index in Permutation(len(block) * len(ports), seed):
+        yield block[index % len(block)], ports[index // len(block)]
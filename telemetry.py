@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import threading
+import time
+
+# RTT直方图的桶上界（秒），最后一个桶为 +Inf
+RTT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+# 累计计数器的名称和说明（用于Prometheus输出）
+COUNTERS = {
+    "sent": "已发送的探测数（含重传）",
+    "retransmits": "重传的探测数",
+    "replies": "收到回应的探测数",
+    "timeouts": "重传后仍无回应的探测数",
+    "errors": "出错的探测数",
+    "local_retries": "因本机资源不足（临时端口或文件描述符耗尽）重试的次数",
+}
+
+
+class RttHistogram:
+    """按固定桶统计RTT分布，内存占用与样本数无关"""
+
+    def __init__(self, counts=None, total=0.0):
+        self.counts = list(counts) if counts else [0] * (len(RTT_BUCKETS) + 1)
+        self.total = total
+
+    def observe(self, rtt):
+        self.counts[bisect.bisect_left(RTT_BUCKETS, rtt)] += 1
+        self.total += rtt
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """按桶上界估计分位数，落在最后一个桶时返回最大的有限上界"""
+        count = self.count
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return RTT_BUCKETS[min(i, len(RTT_BUCKETS) - 1)]
+        return RTT_BUCKETS[-1]
+
+    def to_dict(self):
+        return {"buckets": list(RTT_BUCKETS), "counts": list(self.counts), "sum": self.total}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["counts"], data["sum"])
+
+
+class ScanStats:
+    """扫描遥测: 探测计数、在途探测数、发包速率和RTT直方图
+
+    各扫描引擎在发送、收到回应、超时和出错时调用对应的方法，
+    全局RTT直方图覆盖整个扫描，每个主机的直方图只在主机扫描期间保留，
+    主机完成时由host_histogram()取出写入输出。
+    多进程扫描时，主进程通过merge_worker()汇总各工作进程的累计值。
+    """
+
+    # pps平滑系数
+    SMOOTHING = 0.3
+
+    def __init__(self, rate_controller=None):
+        self.rate_controller = rate_controller
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.in_flight = 0
+        self.histogram = RttHistogram()
+        self.hosts = {}
+        self.workers = {}
+        self.start_time = time.monotonic()
+        self.last_time = self.start_time
+        self.last_sent = 0
+        self.pps = 0.0
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def probe_start(self, count=1):
+        with self.lock:
+            self.in_flight += count
+
+    def probe_end(self, count=1):
+        with self.lock:
+            self.in_flight -= count
+
+    def sent(self, retransmit=False):
+        with self.lock:
+            self.counters["sent"] += 1
+            if retransmit:
+                self.counters["retransmits"] += 1
+
+    def reply(self, target, rtt=None):
+        """记录一次回应，rtt为None表示重传后的回应（不计入RTT）"""
+        with self.lock:
+            self.counters["replies"] += 1
+            if rtt is not None:
+                self.histogram.observe(rtt)
+                host = self.hosts.get(target)
+                if host is None:
+                    host = self.hosts[target] = RttHistogram()
+                host.observe(rtt)
+
+    def timeout(self, count=1):
+        with self.lock:
+            self.counters["timeouts"] += count
+
+    def local_retry(self):
+        with self.lock:
+            self.counters["local_retries"] += 1
+
+    def error(self, message=None):
+        """记录一次出错的探测，保留最近一次的错误信息"""
+        with self.lock:
+            self.counters["errors"] += 1
+            if message:
+                self.last_error = message
+
+    def host_histogram(self, target):
+        """取出并清除主机的RTT直方图，主机没有RTT样本时返回None"""
+        with self.lock:
+            host = self.hosts.pop(target, None)
+        return host.to_dict() if host is not None else None
+
+    def totals(self):
+        """本进程的累计值，用于从工作进程发回主进程"""
+        with self.lock:
+            return {"counters": dict(self.counters), "in_flight": self.in_flight,
+                    "histogram": self.histogram.to_dict(),
+                    "rate_limit": self.rate_controller.rate if self.rate_controller else None,
+                    "rate_wait": self.rate_controller.wait_time if self.rate_controller else 0.0,
+                    "last_error": self.last_error}
+
+    def merge_worker(self, index, totals):
+        """记录工作进程的最新累计值"""
+        with self.lock:
+            self.workers[index] = totals
+
+    def combined(self):
+        """合并本进程和各工作进程的累计值
+
+        Returns:
+            tuple: (counters, in_flight, histogram, rate_limit, rate_wait)，
+            有工作进程时速率上限为各进程上限之和，任一进程不限速时为None
+        """
+        counters = dict(self.counters)
+        in_flight = self.in_flight
+        histogram = RttHistogram(self.histogram.counts, self.histogram.total)
+        rate_limit = self.rate_controller.rate if self.rate_controller else None
+        rate_wait = self.rate_controller.wait_time if self.rate_controller else 0.0
+        if self.workers:
+            limits = [totals["rate_limit"] for totals in self.workers.values()]
+            rate_limit = None if None in limits else sum(limits)
+        for totals in self.workers.values():
+            for name, value in totals["counters"].items():
+                counters[name] += value
+            in_flight += totals["in_flight"]
+            histogram.merge(RttHistogram.from_dict(totals["histogram"]))
+            rate_wait += totals["rate_wait"]
+        return counters, in_flight, histogram, rate_limit, rate_wait
+
+    def snapshot(self):
+        """返回当前统计信息的字典"""
+        with self.lock:
+            counters, in_flight, histogram, rate_limit, rate_wait = self.combined()
+            now = time.monotonic()
+            elapsed = now - self.last_time
+            if elapsed > 0:
+                current = (counters["sent"] - self.last_sent) / elapsed
+                if self.last_sent == 0 and self.pps == 0:
+                    self.pps = current
+                else:
+                    self.pps = self.SMOOTHING * current + (1 - self.SMOOTHING) * self.pps
+                self.last_time = now
+                self.last_sent = counters["sent"]
+            return {
+                **counters,
+                "in_flight": in_flight,
+                "pps": self.pps,
+                "rate_limit": rate_limit,
+                "rate_wait": rate_wait,
+                "elapsed": now - self.start_time,
+                "rtt_count": histogram.count,
+                "rtt_mean": histogram.total / histogram.count if histogram.count else None,
+                "rtt_p50": histogram.quantile(0.5),
+                "rtt_p99": histogram.quantile(0.99),
+                "rtt_histogram": histogram.to_dict(),
+                "last_error": self.last_error or next(
+                    (totals["last_error"] for totals in self.workers.values() if totals["last_error"]), None),
+            }
+
+    def prometheus(self):
+        """Prometheus文本格式的指标"""
+        with self.lock:
+            counters, in_flight, histogram, rate_limit, rate_wait = self.combined()
+        lines = []
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP pscan_probes_{name}_total {help_text}",
+                      f"# TYPE pscan_probes_{name}_total counter",
+                      f"pscan_probes_{name}_total {counters[name]}"]
+        lines += ["# HELP pscan_probes_in_flight 正在等待结果的探测数",
+                  "# TYPE pscan_probes_in_flight gauge",
+                  f"pscan_probes_in_flight {in_flight}",
+                  "# HELP pscan_rate_limit_pps 当前的发包速率上限，0表示不限速",
+                  "# TYPE pscan_rate_limit_pps gauge",
+                  f"pscan_rate_limit_pps {rate_limit or 0}",
+                  "# HELP pscan_rate_limit_wait_seconds_total 因速率限制等待的总时间",
+                  "# TYPE pscan_rate_limit_wait_seconds_total counter",
+                  f"pscan_rate_limit_wait_seconds_total {rate_wait}",
+                  "# HELP pscan_rtt_seconds 探测的往返时间",
+                  "# TYPE pscan_rtt_seconds histogram"]
+        cumulative = 0
+        for bound, count in zip(RTT_BUCKETS + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f'pscan_rtt_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"pscan_rtt_seconds_sum {histogram.total}",
+                  f"pscan_rtt_seconds_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+    def start(self, callback, interval):
+        """每隔interval秒以snapshot()的结果调用callback"""
+        if callback is None or interval <= 0:
+            return
+        self.thread = threading.Thread(target=self.report_loop, args=(callback, interval), daemon=True)
+        self.thread.start()
+
+    def report_loop(self, callback, interval):
+        while not self.stopped.wait(interval):
+            callback(self.snapshot())
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def format_stats(stats):
+    """把统计信息格式化为一行状态"""
+    rate_limit = f"{stats['rate_limit']:.0f}" if stats["rate_limit"] else "不限"
+    line = (f"统计: 发送 {stats['sent']}（重传 {stats['retransmits']}），回应 {stats['replies']}，"
+            f"超时 {stats['timeouts']}，错误 {stats['errors']}，在途 {stats['in_flight']}，"
+            f"{stats['pps']:.0f} pps（上限 {rate_limit}，限速等待 {stats['rate_wait']:.1f}s）")
+    if stats["local_retries"]:
+        line += f"，本机资源不足重试 {stats['local_retries']}"
+    if stats["rtt_count"]:
+        line += f"，RTT p50 ≤{stats['rtt_p50'] * 1000:g}ms p99 ≤{stats['rtt_p99'] * 1000:g}ms"
+    if stats["last_error"]:
+        line += f"，最近的错误: {stats['last_error']}"
+    return line
+
+
+class MetricsServer:
+    """在本机提供Prometheus格式的 /metrics 接口"""
+
+    def __init__(self, stats, port, host="127.0.0.1"):
+        # 只有启用指标接口时才导入http.server，缩短命令行的启动时间
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.stats = stats
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = self.server.stats.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            raise Exception(f"无法在 {host}:{port} 上启动指标服务: {e}")
+        self.server.stats = stats
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+# 时间模板，参考nmap的 -T0 ~ -T5
+# initial_rto: 尚无RTT样本时的探测超时（秒）
+# min_rto/max_rto: 超时时间的上下限（秒）
+# max_retries: 无回应时的最大重传次数
+TIMING_PROFILES = {
+    "paranoid": {"initial_rto": 5.0, "min_rto": 1.0, "max_rto": 10.0, "max_retries": 5},
+    "sneaky": {"initial_rto": 3.0, "min_rto": 0.5, "max_rto": 10.0, "max_retries": 5},
+    "polite": {"initial_rto": 1.0, "min_rto": 0.1, "max_rto": 10.0, "max_retries": 3},
+    "normal": {"initial_rto": 1.0, "min_rto": 0.1, "max_rto": 10.0, "max_retries": 2},
+    "aggressive": {"initial_rto": 0.5, "min_rto": 0.1, "max_rto": 1.25, "max_retries": 2},
+    "insane": {"initial_rto": 0.25, "min_rto": 0.05, "max_rto": 0.3, "max_retries": 1},
+}
+
+# 数字别名，与nmap的 -T0 ~ -T5 对应
+TIMING_ALIASES = {str(i): name for i, name in enumerate(TIMING_PROFILES)}
+
+
+def get_timing_profile(name):
+    """根据名称或数字别名返回时间模板名称"""
+    name = TIMING_ALIASES.get(str(name), str(name))
+    if name not in TIMING_PROFILES:
+        raise Exception(f"未知的时间模板: {name}")
+    return name
+
+
+class RttEstimator:
+    """单个目标的RTT估计，按TCP的RTO算法计算 (RFC 6298)"""
+
+    # 平滑系数
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self, initial_rto=1.0, min_rto=0.1, max_rto=10.0):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # 多进程扫描时估计值随主机摘要发回主进程，锁不能序列化
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def update(self, rtt):
+        """加入一个RTT样本（秒）"""
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+            self.samples += 1
+            self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+    def timeout(self, attempt=0):
+        """第attempt次发送（从0开始）使用的超时时间，重传时按指数退避"""
+        return min(self.max_rto, self.rto * (2 ** attempt))
+
+
+class HostTiming:
+    """按目标维护RTT估计，并给出探测超时和重传次数"""
+
+    def __init__(self, profile="normal"):
+        self.profile = get_timing_profile(profile)
+        settings = TIMING_PROFILES[self.profile]
+        self.initial_rto = settings["initial_rto"]
+        self.min_rto = settings["min_rto"]
+        self.max_rto = settings["max_rto"]
+        self.max_retries = settings["max_retries"]
+        self.estimators = {}
+        self.lock = threading.Lock()
+
+    def get(self, target):
+        """返回目标的RTT估计器"""
+        with self.lock:
+            estimator = self.estimators.get(target)
+            if estimator is None:
+                estimator = RttEstimator(self.initial_rto, self.min_rto, self.max_rto)
+                self.estimators[target] = estimator
+            return estimator
+
+    def timeout(self, target, attempt=0):
+        """目标第attempt次发送使用的超时时间"""
+        return self.get(target).timeout(attempt)
+
+    def update(self, target, rtt):
+        """记录目标的一个RTT样本"""
+        self.get(target).update(rtt)
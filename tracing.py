@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 探测级的时间线跟踪 (--trace) 和分阶段耗时统计 (--profile)。
+# 跟踪文件为Chrome trace的JSON数组格式，可以用 chrome://tracing 或
+# Perfetto (ui.perfetto.dev) 打开。未启用时扫描代码只多一次None判断。
+
+import contextlib
+import json
+import os
+import threading
+import time
+import unicodedata
+
+# 缓冲区中的事件达到该数量时写入文件
+FLUSH_EVENTS = 10000
+
+# 包含其他阶段的区间，不计入各阶段的占比
+ENCLOSING_SPANS = ("scan", "probe")
+
+# 未启用跟踪时使用的空上下文，可以重复使用
+NULL_SPAN = contextlib.nullcontext()
+
+
+class Span:
+    """记录一个区间的上下文管理器"""
+
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args=None):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+
+def span(tracer, name, category, args=None):
+    """tracer为None时返回空上下文，否则返回记录区间的上下文"""
+    if tracer is None:
+        return NULL_SPAN
+    return Span(tracer, name, category, args)
+
+
+class ScanTracer:
+    """扫描的时间线跟踪和分阶段耗时统计
+
+    各阶段以 (类别, 名称) 标识，类别为探测函数名或 "scheduler"，
+    名称为阶段（构造数据包、限速等待、发送、等待回应、回调等）。
+    指定file_path时每个区间写成一个Chrome trace的完整事件 (ph="X")，
+    按线程分行显示；profile为True时按阶段累计次数、总耗时和最长耗时。
+    时间使用perf_counter，探测记录的发送和接收时间（time.time()）
+    按启动时记录的差值换算。
+    """
+
+    def __init__(self, file_path=None, profile=False):
+        self.file_path = file_path
+        self.profile = profile
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        # time.time() 与 perf_counter() 的差值
+        self.wall_offset = time.time() - self.origin
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.threads = {}
+        self.totals = {}
+        self.event_count = 0
+        self.file = None
+        if file_path:
+            try:
+                self.file = open(file_path, 'w', encoding='utf-8')
+                self.file.write("[\n")
+            except OSError as e:
+                raise Exception(f"无法写入跟踪文件: {e}")
+
+    def add(self, name, category, start, end, args=None):
+        """记录一个区间，start和end为perf_counter时间"""
+        duration = end - start
+        thread = threading.current_thread()
+        with self.lock:
+            if self.profile:
+                total = self.totals.get((category, name))
+                if total is None:
+                    self.totals[(category, name)] = [1, duration, duration]
+                else:
+                    total[0] += 1
+                    total[1] += duration
+                    if duration > total[2]:
+                        total[2] = duration
+            if self.file is not None:
+                if thread.ident not in self.threads:
+                    self.threads[thread.ident] = thread.name
+                self.buffer.append((name, category, start, duration, thread.ident, args))
+                if len(self.buffer) >= FLUSH_EVENTS:
+                    self.flush_locked()
+
+    def exchange(self, category, start, end, sent_time, reply_time):
+        """把一次收发拆分为发送准备、等待回应（或超时）和接收处理三段
+
+        Args:
+            start, end: 发送前和得到结果后的perf_counter时间
+            sent_time: 数据包的发送时间（发送失败时为None）
+            reply_time: 回应的捕获时间，超时为None
+        """
+        if sent_time is None:
+            self.add("sr1", category, start, end)
+            return
+        sent = sent_time - self.wall_offset
+        self.add("send_setup", category, start, sent)
+        if reply_time is None:
+            self.add("timeout_wait", category, sent, end)
+        else:
+            reply = reply_time - self.wall_offset
+            self.add("wire", category, sent, reply)
+            self.add("receive", category, reply, end)
+
+    def flush_locked(self):
+        lines = []
+        for name, category, start, duration, tid, args in self.buffer:
+            event = {"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": tid,
+                     "ts": round((start - self.origin) * 1e6, 3), "dur": round(duration * 1e6, 3)}
+            if args:
+                event["args"] = args
+            lines.append(json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+        if lines:
+            # JSON数组中除第一个事件外，每个事件前加逗号
+            prefix = ",\n" if self.event_count else ""
+            self.file.write(prefix + ",\n".join(lines))
+            self.event_count += len(lines)
+        self.buffer = []
+
+    def close(self):
+        """写出剩余的事件和线程名称，结束跟踪文件"""
+        with self.lock:
+            if self.file is None:
+                return
+            self.flush_locked()
+            for tid, name in self.threads.items():
+                event = {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                self.file.write((",\n" if self.event_count else "") + json.dumps(event, ensure_ascii=False))
+                self.event_count += 1
+            self.buffer = []
+            self.file.write("\n]\n")
+            self.file.close()
+            self.file = None
+
+    def report(self):
+        """按阶段汇总的耗时，按总耗时从高到低排列，返回文本行"""
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)
+        if not totals:
+            return ["性能剖析: 没有记录到任何阶段"]
+        grand_total = sum(total for (category, name), (count, total, longest) in totals
+                          if name not in ENCLOSING_SPANS)
+        lines = ["性能剖析（按阶段汇总，各线程的耗时相加）:",
+                 "  " + pad("类别/阶段", -32) + pad("次数", 10) + pad("总耗时", 12) + pad("平均", 12)
+                 + pad("最长", 12) + pad("占比", 8)]
+        for (category, name), (count, total, longest) in totals:
+            share = f"{total / grand_total * 100:.1f}%" if grand_total and name not in ENCLOSING_SPANS else "-"
+            lines.append(f"  {category + '/' + name:<32}{count:>10}{format_duration(total):>12}"
+                         f"{format_duration(total / count):>12}{format_duration(longest):>12}{share:>8}")
+        return lines
+
+
+def pad(text, width):
+    """按显示宽度（中文字符占两列）补齐，width为负数时左对齐"""
+    size = sum(2 if unicodedata.east_asian_width(char) in "WF" else 1 for char in text)
+    fill = " " * max(0, abs(width) - size)
+    return text + fill if width < 0 else fill + text
+
+
+def format_duration(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.2f}ms"
+    return f"{seconds * 1e6:.1f}us"
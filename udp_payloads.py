@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 常见UDP服务的探测载荷，大多数UDP服务会忽略空的数据报，
+# 发送协议相关的请求才能得到确定的回应（参考nmap-payloads）
+
+# DNS: 查询 version.bind 的 CH TXT 记录
+DNS_VERSION_BIND = (b"\x00\x06\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+                    b"\x07version\x04bind\x00\x00\x10\x00\x03")
+
+# SNMPv1: 使用 public 团体名读取 sysDescr.0
+SNMP_V1_GET = (b"\x30\x29\x02\x01\x00\x04\x06public"
+               b"\xa0\x1c\x02\x04\x71\x68\x83\x2c\x02\x01\x00\x02\x01\x00"
+               b"\x30\x0e\x30\x0c\x06\x08\x2b\x06\x01\x02\x01\x01\x01\x00\x05\x00")
+
+# NetBIOS名称服务: 节点状态查询 (NBSTAT *)
+NETBIOS_NBSTAT = (b"\x80\xf0\x00\x10\x00\x01\x00\x00\x00\x00\x00\x00"
+                  b"\x20CKAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA\x00\x00\x21\x00\x01")
+
+# Sun RPC: portmapper NULL 调用
+RPC_PORTMAP_NULL = (b"\x72\xfe\x1d\x13\x00\x00\x00\x00\x00\x00\x00\x02"
+                    b"\x00\x01\x86\xa0\x00\x00\x00\x02\x00\x00\x00\x00"
+                    b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+# mDNS: 查询 _services._dns-sd._udp.local 的PTR记录
+MDNS_SERVICES = (b"\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+                 b"\x09_services\x07_dns-sd\x04_udp\x05local\x00\x00\x0c\x00\x01")
+
+SSDP_MSEARCH = (b"M-SEARCH * HTTP/1.1\r\n"
+                b"HOST: 239.255.255.250:1900\r\n"
+                b"MAN: \"ssdp:discover\"\r\n"
+                b"MX: 1\r\n"
+                b"ST: ssdp:all\r\n\r\n")
+
+SIP_OPTIONS = (b"OPTIONS sip:pscan SIP/2.0\r\n"
+               b"Via: SIP/2.0/UDP pscan;branch=z9hG4bK-pscan\r\n"
+               b"From: <sip:pscan@pscan>;tag=pscan\r\n"
+               b"To: <sip:pscan@pscan>\r\n"
+               b"Call-ID: pscan-50000\r\n"
+               b"CSeq: 1 OPTIONS\r\n"
+               b"Max-Forwards: 70\r\n"
+               b"Content-Length: 0\r\n\r\n")
+
+UDP_PAYLOADS = {
+    53: DNS_VERSION_BIND,
+    # TFTP: 读请求
+    69: b"\x00\x01pscan.txt\x00octet\x00",
+    111: RPC_PORTMAP_NULL,
+    # NTP: v3 客户端请求
+    123: b"\xe3" + b"\x00" * 47,
+    137: NETBIOS_NBSTAT,
+    161: SNMP_V1_GET,
+    # XDMCP: Query
+    177: b"\x00\x01\x00\x02\x00\x01\x00",
+    # RIPv2: 请求整个路由表
+    520: b"\x01\x02\x00\x00" + b"\x00" * 16 + b"\x00\x00\x00\x10",
+    # OpenVPN: P_CONTROL_HARD_RESET_CLIENT_V2
+    1194: b"\x38\x01\x02\x03\x04\x05\x06\x07\x08\x00\x00\x00\x00\x00",
+    # MS-SQL Browser: 枚举实例
+    1434: b"\x02",
+    1900: SSDP_MSEARCH,
+    # STUN: Binding Request
+    3478: b"\x00\x01\x00\x00\x21\x12\xa4\x42" + b"pscan-stun!\x00",
+    5060: SIP_OPTIONS,
+    # NAT-PMP: 查询外部地址
+    5351: b"\x00\x00",
+    5353: MDNS_SERVICES,
+    # CoAP: GET /.well-known/core
+    5683: b"\x40\x01\x7d\x70\xbb.well-known\x04core",
+    # memcached: stats（带UDP帧头）
+    11211: b"\x00\x01\x00\x00\x00\x01\x00\x00stats\r\n",
+}
+
+
+def udp_payload(port):
+    """返回端口对应的探测载荷，没有专用载荷的端口返回空数据"""
+    return UDP_PAYLOADS.get(port, b"")
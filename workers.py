@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from targets import ScanOrder, StridedView, compose_shard
+from telemetry import RttHistogram
+
+# 主进程等待事件时检查工作进程状态的间隔（秒）
+STOP_POLL_INTERVAL = 0.05
+# 停止后等待工作进程退出的时间（秒）
+JOIN_TIMEOUT = 5.0
+
+
+class EventBatcher:
+    """在工作进程中缓冲扫描事件，按固定间隔或缓冲区满时成批发给主进程
+
+    每批消息为 (工作进程序号, 事件列表, 已完成的探测数, 遥测累计值)。
+    """
+
+    MAX_EVENTS = 1000
+
+    def __init__(self, events, index, interval=0.1):
+        self.events = events
+        self.index = index
+        self.interval = interval
+        self.progress = None
+        self.stats = None
+        self.buffer = []
+        self.last_done = 0
+        self.last_totals = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def put(self, event):
+        with self.lock:
+            self.buffer.append(event)
+            if len(self.buffer) >= self.MAX_EVENTS:
+                self.flush_locked()
+
+    def flush_locked(self):
+        done = self.progress.done if self.progress else 0
+        totals = self.stats.totals() if self.stats else None
+        if self.buffer or done != self.last_done or totals != self.last_totals:
+            self.events.put((self.index, self.buffer, done, totals))
+            self.buffer = []
+            self.last_done = done
+            self.last_totals = totals
+
+    def start(self):
+        self.thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.thread.start()
+
+    def flush_loop(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                self.flush_locked()
+
+    def close(self, error=None):
+        """发送剩余的事件和结束标记"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            self.buffer.append(("done", error))
+            self.flush_locked()
+
+
+def scan_shard(scanner, batcher, targets, ports, target_shard, port_split, completed, settings):
+    """按设置扫描一个分片，扫描事件交给batcher发出"""
+    from timing import HostTiming
+    from rate_limit import RateController
+    from progress import ProgressTracker
+    from resolver import default_resolver
+
+    scanner.timing = HostTiming(settings["timing"])
+    scanner.rate_controller = RateController(settings["min_rate"], settings["max_rate"])
+    scanner.seed = settings["seed"]
+    # 主进程已经解析了所有域名，工作进程直接使用解析结果
+    default_resolver.cache.update(settings["addresses"])
+    if port_split is not None:
+        ports = StridedView(ports, *port_split)
+    order = ScanOrder(targets, scanner.seed, completed, track=True, shard=target_shard)
+    scanner.progress = ProgressTracker(len(order) * len(ports))
+    scanner.stats.rate_controller = scanner.rate_controller
+    batcher.progress = scanner.progress
+    batcher.stats = scanner.stats
+    batcher.start()
+
+    def host_callback(target, open_ports):
+        batcher.put(("host", target, open_ports, order.pop_positions(target), scanner.timing.get(target),
+                     scanner.stats.host_histogram(target)))
+
+    scanner.run_engine(
+        order, ports, settings["scan_type"], settings["engine"], settings["threads"],
+        settings["concurrency"], settings["max_hosts"], settings["max_host_probes"],
+        progress_callback=lambda message: batcher.put(("message", message)),
+        result_callback=lambda port, status: batcher.put(("result", port, status)),
+        port_callback=lambda target, port, status, elapsed: batcher.put(
+            ("port", target, port, status, elapsed)),
+        host_callback=host_callback,
+    )
+
+
+def run_worker(index, targets, ports, target_shard, port_split, completed, settings, events, stop_flag):
+    """工作进程入口，扫描一个分片并把事件发回主进程"""
+    from scanner import PortScanner
+
+    # Ctrl-C由主进程处理，通过共享的stop_flag通知工作进程停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    batcher = EventBatcher(events, index)
+    scanner = PortScanner()
+    error = None
+
+    def watch_stop():
+        while not batcher.stopped.wait(0.1):
+            # 引擎可能还没有创建，收到停止请求后持续通知直到扫描结束
+            if stop_flag.value:
+                scanner.stop_scan()
+
+    try:
+        threading.Thread(target=watch_stop, daemon=True).start()
+        scan_shard(scanner, batcher, targets, ports, target_shard, port_split, completed, settings)
+    except Exception as e:
+        error = str(e)
+    finally:
+        batcher.close(error)
+
+
+class ShardedScan:
+    """多进程分片扫描
+
+    目标数不少于工作进程数时，按扫描顺序中的目标位置把目标分给各进程，
+    每个进程扫描完整的主机；否则每个进程扫描所有目标的一部分端口，
+    主进程收齐所有进程的报告后才认为主机扫描完成。
+    各进程运行各自的扫描引擎，发包速率上下限平均分配给各进程。
+    端口结果、主机摘要和进度按批发回主进程，通过原有的回调输出。
+    """
+
+    def __init__(self, workers, settings, progress=None, stats=None):
+        self.workers = workers
+        self.settings = dict(settings)
+        for key in ("min_rate", "max_rate"):
+            if self.settings[key] is not None:
+                self.settings[key] = self.settings[key] / workers
+        self.progress = progress
+        self.stats = stats
+        # 使用spawn启动全新的解释器，避免fork时复制主进程中其他线程持有的锁
+        self.context = multiprocessing.get_context("spawn")
+        # 不使用multiprocessing.Event：等待中的进程退出后set()可能永远阻塞
+        self.stop_flag = self.context.Value('b', 0, lock=False)
+        self.processes = []
+        self.is_scanning = False
+
+    def run(self, targets, ports, target_count, target_shard=None, completed=None,
+            progress_callback=None, result_callback=None, summary_callback=None,
+            port_callback=None, host_callback=None):
+        """扫描所有分片，返回 {target: [open_ports]}
+
+        host_callback(target, open_ports, positions, timing, rtt_histogram) 在主机的
+        所有报告收齐后调用，positions为主机在扫描顺序中的位置（用于检查点）。
+        """
+        self.is_scanning = True
+        split_targets = target_count >= self.workers
+        reports_per_host = 1 if split_targets else self.workers
+        events = self.context.Queue()
+
+        for index in range(self.workers):
+            if split_targets:
+                shard, port_split = compose_shard(target_shard, index, self.workers), None
+            else:
+                shard, port_split = target_shard, (index, self.workers)
+            process = self.context.Process(
+                target=run_worker, daemon=True,
+                args=(index, targets, ports, shard, port_split, completed, self.settings, events,
+                      self.stop_flag))
+            process.start()
+            self.processes.append(process)
+
+        results = {}
+        hosts = {}
+        done_counts = [0] * self.workers
+        finished = set()
+        errors = []
+
+        def finish_host(target, host):
+            open_ports = sorted(host["open_ports"])
+            results[target] = open_ports
+            if host_callback:
+                histogram = host["histogram"].to_dict() if host["histogram"].count else None
+                host_callback(target, open_ports, sorted(host["positions"]), host["timing"], histogram)
+            if summary_callback:
+                if open_ports:
+                    summary_callback(f"目标 {target} 开放的端口: {', '.join(map(str, open_ports))}")
+                else:
+                    summary_callback(f"目标 {target} 没有发现开放的端口")
+
+        def handle(index, event):
+            kind = event[0]
+            if kind == "port":
+                if port_callback:
+                    port_callback(*event[1:])
+            elif kind == "result":
+                if result_callback:
+                    result_callback(*event[1:])
+            elif kind == "message":
+                if progress_callback:
+                    progress_callback(f"[进程 {index+1}] {event[1]}")
+            elif kind == "host":
+                _, target, open_ports, positions, timing, histogram = event
+                host = hosts.setdefault(target, {"reports": 0, "open_ports": set(), "positions": set(),
+                                                 "timing": timing, "histogram": RttHistogram()})
+                host["reports"] += 1
+                host["open_ports"].update(open_ports)
+                host["positions"].update(positions)
+                if histogram is not None:
+                    host["histogram"].merge(RttHistogram.from_dict(histogram))
+                if host["reports"] == reports_per_host:
+                    del hosts[target]
+                    finish_host(target, host)
+            elif kind == "done":
+                finished.add(index)
+                if event[1]:
+                    errors.append(f"工作进程 {index+1} 出错: {event[1]}")
+
+        try:
+            while len(finished) < self.workers:
+                try:
+                    index, batch, done, totals = events.get(timeout=STOP_POLL_INTERVAL)
+                except queue.Empty:
+                    for index, process in enumerate(self.processes):
+                        # 正常退出的进程在结束标记之后才退出，非零退出码说明进程崩溃
+                        if index not in finished and process.exitcode not in (None, 0):
+                            raise Exception(f"工作进程 {index+1} 异常退出 (退出码 {process.exitcode})")
+                    continue
+                if self.progress:
+                    self.progress.advance(done - done_counts[index])
+                done_counts[index] = done
+                if self.stats and totals is not None:
+                    self.stats.merge_worker(index, totals)
+                for event in batch:
+                    handle(index, event)
+        finally:
+            self.is_scanning = False
+            self.stop_flag.value = 1
+            self.join_workers(events)
+
+        if errors:
+            raise Exception(errors[0])
+        return results
+
+    def join_workers(self, events):
+        """等待工作进程退出，期间丢弃剩余的事件以免进程阻塞在队列上"""
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            try:
+                events.get(timeout=STOP_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.processes = []
+
+    def stop_scan(self):
+        """停止扫描"""
+        self.is_scanning = False
+        self.stop_flag.value = 1